@@ -1,11 +1,38 @@
-import pandas as pd
 import exoboot
-from typing import Type
+import config_util
+from typing import List, Type, TYPE_CHECKING
+if TYPE_CHECKING:
+    import pandas as pd  # Only for type hints
 
 
-def populate_data_container_from_series(df: Type[pd.Series]):
+def populate_data_container_from_series(df: Type['pd.Series']):
     data_container = exoboot.Exo.DataContainerWithFSRs()
     for key, value in df.items():
         if hasattr(df, key):
             setattr(data_container, key, value)
     return data_container
+
+
+def get_config_filename(data_filename: str) -> str:
+    '''exo_data/..._LEFT.csv -> exo_data/..._CONFIG.csv, from the same session.
+
+    The config file is named a moment after the data files, so if a session started on the
+    turn of a minute, its name may differ by one minute: pass it to join_config() directly.'''
+    base_filename = data_filename[:-len('.csv')]
+    for side in ('_LEFT', '_RIGHT'):
+        if base_filename.endswith(side):
+            base_filename = base_filename[:-len(side)]
+    return base_filename + '_CONFIG.csv'
+
+
+def join_config(data: Type['pd.DataFrame'], data_filename: str, keys: List[str],
+                config_filename: str = None) -> Type['pd.DataFrame']:
+    '''Returns a copy of data (e.g., pd.read_csv(data_filename)) with a column for each config
+    key, holding the value in effect at each row, e.g. to split a session by RISE_FRACTION:
+
+        df = join_config(pd.read_csv(filename), filename, keys=['RISE_FRACTION'])
+        for rise_fraction, df_setting in df.groupby('RISE_FRACTION'): ...'''
+    if config_filename is None:
+        config_filename = get_config_filename(data_filename)
+    config_log = config_util.load_config_log(config_filename)
+    return config_log.join(data, keys=keys)
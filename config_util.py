@@ -1,9 +1,12 @@
+import typing
 from typing import Type, List
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 import time
 import csv
 import sys
 import importlib
+import ast
+import bisect
 from enum import Enum
 import argparse
 import constants
@@ -25,6 +28,35 @@ class StanceCtrlStyle(Enum):
     SAWICKIWICKI = 2
     GENERICIMPEDANCE = 3
     FIVEPOINTSPLINE = 4
+    ITERATIVELEARNINGSPLINE = 5  # FOURPOINTSPLINE with a learned stride-to-stride correction
+
+
+class FadeShape(Enum):
+    '''Weight vs. elapsed fraction of a spline cross-fade (see profiles.get_fade_weight).'''
+    LINEAR = 0
+    COSINE = 1
+    SMOOTHSTEP = 2
+
+
+class HILCost(Enum):
+    '''Per-stride cost minimized by hil_optimizer.HILOptimizer.'''
+    TORQUE_TRACKING = 0  # RMS of commanded minus measured ankle torque / peak commanded torque
+    # Mean of samples passed to HILOptimizer.add_external_cost() (e.g., metabolics), sent as
+    # {"external_cost": x} to the NetworkParameterPasser (needs PARAMETER_SERVER_PORT)
+    EXTERNAL = 1
+
+
+class SlackPrediction(Enum):
+    '''How StalkController predicts ankle angle to compensate for slack command latency.'''
+    NONE = 0  # Use the latest ankle_angle
+    VELOCITY = 1  # ankle_angle + ankle_velocity * latency
+    POLYNOMIAL = 2  # Extrapolate a polynomial fit over recent ankle angles
+
+
+class JetsonProtocol(Enum):
+    '''Wire format used by ml_util.JetsonInterface.'''
+    TEXT = 0
+    BINARY = 1
 
 
 @dataclass
@@ -58,6 +90,10 @@ class ConfigurableConstants():
     HS_GYRO_FILTER_WN: float = 3
     HS_GYRO_DELAY: float = 0.05
     SWING_SLACK: int = 10000
+    SLACK_PREDICTION: Type[SlackPrediction] = SlackPrediction.NONE
+    SLACK_PREDICTION_LATENCY: float = 0.02  # s, streaming delay + position loop lag
+    SLACK_PREDICTION_WINDOW: int = 8  # Samples, for POLYNOMIAL
+    SLACK_PREDICTION_ORDER: int = 2  # For POLYNOMIAL
 
     RIGHT_TOE_OFF_FRACTION: float = 0.60
     LEFT_TOE_OFF_FRACTION: float = 0.60
@@ -81,6 +117,33 @@ class ConfigurableConstants():
     RIGHT_PEAK_TORQUE: float = 5
 
     SPLINE_BIAS: float = 3  # Nm
+    USE_SPLINE_TABLE: bool = True  # Evaluate splines from a precomputed table, not pchip
+    SPLINE_FADE_SHAPE: Type[FadeShape] = FadeShape.LINEAR  # Cross-fade curve on spline updates
+    USE_CURRENT_TABLE: bool = False  # Spline stance current from a (phase, ankle angle) table
+
+    # Iterative learning (StanceCtrlStyle.ITERATIVELEARNINGSPLINE)
+    ILC_NUM_BINS: int = 100  # Gait phase bins
+    ILC_LEARNING_GAIN: float = 0.3  # (0, 1]
+    ILC_FORGETTING_FACTOR: float = 0.99  # [0, 1]
+    ILC_MAX_CORRECTION: float = 5  # Nm
+    ILC_MAX_STRIDE_DURATION_CHANGE: float = 0.3  # Larger stride-to-stride changes reset learning
+
+    # Human-in-the-loop optimization of the 4 point spline (see hil_optimizer.py)
+    DO_HIL_OPTIMIZATION: bool = False
+    HIL_COST: Type[HILCost] = HILCost.TORQUE_TRACKING
+    HIL_STRIDES_PER_CANDIDATE: int = 10  # Heel strikes per side averaged per candidate
+    HIL_STRIDES_TO_SKIP: int = 3  # Heel strikes per side ignored after each change (fade in)
+    HIL_POPULATION_SIZE: int = 6
+    HIL_NUM_GENERATIONS: int = None  # None = run until quit
+    HIL_INITIAL_SIGMA: float = 0.25  # Fraction of each parameter's range
+    HIL_SEED: int = None
+    # Name: (min, max). Names without LEFT_/RIGHT_ set both sides. Keep ranges in order
+    # (rise < peak < fall) so every candidate is a valid spline.
+    HIL_PARAMETER_BOUNDS: dict = field(default_factory=lambda: {
+        'RISE_FRACTION': (0.1, 0.3),
+        'PEAK_FRACTION': (0.45, 0.55),
+        'FALL_FRACTION': (0.56, 0.62),
+        'PEAK_TORQUE': (2, 20)})
 
     # Impedance
     K_VAL: int = 500
@@ -91,6 +154,8 @@ class ConfigurableConstants():
     READ_ONLY: bool = False  # Does not require Lipos
     DO_READ_FSRS: bool = False
     DO_READ_SYNC: bool = False
+    USE_GPIO_EDGE_CALLBACKS: bool = False  # FSRs/sync update via gpiozero callbacks, not polling
+    WRITE_REFRESH_INTERVAL: float = None  # s. If set, repeated gains/commands are only re-sent this often
 
     PRINT_HS: bool = True  # Print heel strikes
     VARS_TO_PLOT: List = field(default_factory=lambda: [])
@@ -98,13 +163,83 @@ class ConfigurableConstants():
     SLIP_DETECT_ACTIVE: bool = False
     DO_INCLUDE_GEN_VARS: bool = False
     SLIP_DETECT_DELAY: int = 0
+    JETSON_PROTOCOL: Type[JetsonProtocol] = JetsonProtocol.TEXT  # BINARY needs the new Jetson server
+    JETSON_USE_IO_THREAD: bool = True  # Keeps Jetson socket traffic off the control loop
+    JETSON_WINDOW_SIZE: int = 0  # If > 0, send this many samples per request (BINARY only)
+    ML_MAX_PREDICTION_AGE: float = 0.1  # s. Older Jetson predictions are rejected
+    ML_DO_EXTRAPOLATE_PHASE: bool = False  # Advance predictions by age * estimated phase rate
+    ML_LOCAL_MODEL_PATH: str = None  # .npz from ml_util.save_local_model(), used if Jetson is down
+    SCHEDULE_FILENAME: str = None  # csv of timed config changes (see parameter_schedule.py)
+    PARAMETER_SERVER_PORT: int = None  # If set, JSON parameter batches are accepted on localhost:port
     EXPERIMENTER_NOTES: str = 'Experimenter notes go here'
     #REAL_TIME_PLOT_VARIABLE=
 
 
+CONFIG_LOG_FIELDS = ['loop_time', 'actual_time', 'key', 'value']
+UNLOGGED_CONFIG_KEYS = ['loop_time', 'actual_time']  # Written as columns of every row
+# Keys that take effect mid-run: those read by the update_ctrl_params_from_config() and
+# update_params_from_config() methods the main loop calls on new_params_event, plus notes.
+# Everything else is only read when the loop is built (see config_util_test.py).
+RUNTIME_CONFIG_KEYS = [
+    'SWING_ONLY', 'RISE_FRACTION', 'LEFT_PEAK_FRACTION', 'RIGHT_PEAK_FRACTION',
+    'LEFT_FALL_FRACTION', 'RIGHT_FALL_FRACTION', 'LEFT_TOE_OFF_FRACTION', 'RIGHT_TOE_OFF_FRACTION',
+    'LEFT_PEAK_TORQUE', 'RIGHT_PEAK_TORQUE', 'K_VAL', 'B_VAL', 'SET_POINT',
+    'SLIP_DETECT_ACTIVE', 'SLIP_DETECT_DELAY', 'ML_MAX_PREDICTION_AGE', 'ML_DO_EXTRAPOLATE_PHASE',
+    'EXPERIMENTER_NOTES']
+
+
+def validate_config_updates(updates: dict, allowed_keys: List[str] = RUNTIME_CONFIG_KEYS) -> dict:
+    '''Checks {key: value} updates against ConfigurableConstants' fields and types.
+
+    Only allowed_keys may be updated; by default, the keys that take effect mid-run. Enum
+    fields take the member name (e.g., 'FOURPOINTSPLINE'), float fields take ints, and
+    fields that default to None take None. Returns the updates with enum names converted, or
+    raises ValueError listing every invalid update, so a batch can be applied all or nothing.'''
+    config_fields = {config_field.name: config_field for config_field in fields(ConfigurableConstants)
+                     if config_field.name not in UNLOGGED_CONFIG_KEYS}
+    validated_updates = {}
+    errors = []
+    for key, value in updates.items():
+        if key not in config_fields:
+            errors.append('%s is not a config field' % key)
+            continue
+        if key not in allowed_keys:
+            errors.append('%s is only read at startup, so cannot be changed while running' % key)
+            continue
+        field_type = config_fields[key].type
+        if value is None and config_fields[key].default is None:
+            validated_updates[key] = value
+            continue
+        if typing.get_origin(field_type) is type:  # Type[SomeEnum]
+            enum_class = typing.get_args(field_type)[0]
+            if isinstance(value, str) and value in enum_class.__members__:
+                validated_updates[key] = enum_class[value]
+            else:
+                errors.append('%s must be one of %s' % (key, list(enum_class.__members__)))
+            continue
+        field_type = typing.get_origin(field_type) or field_type  # e.g., List -> list
+        if field_type is float:
+            is_valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+        elif field_type is int:
+            is_valid = isinstance(value, int) and not isinstance(value, bool)
+        else:
+            is_valid = isinstance(value, field_type)
+        if is_valid:
+            validated_updates[key] = value
+        else:
+            errors.append('%s must be %s, not %r' % (key, field_type.__name__, value))
+    if errors:
+        raise ValueError('; '.join(errors))
+    return validated_updates
+
+
 class ConfigSaver():
     def __init__(self, file_ID: str, config: Type[ConfigurableConstants]):
-        '''file_ID is used as a custom file identifier after date.'''
+        '''file_ID is used as a custom file identifier after date.
+
+        The config file is a change log: one (loop_time, actual_time, key, value) row per
+        key, for every key on the first write_data() and only changed keys after that. Values
+        are written with encode_config_value(). Read it back with load_config_log().'''
         self.file_ID = file_ID
         self.config = config
         subfolder_name = 'exo_data/'
@@ -112,21 +247,117 @@ class ConfigSaver():
             time.strftime("%Y%m%d_%H%M_") + file_ID + \
             '_CONFIG' + '.csv'
         self.my_file = open(filename, 'w', newline='')
-        self.writer = csv.DictWriter(
-            self.my_file, fieldnames=self.config.__dict__.keys())
-        self.writer.writeheader()
+        self.writer = csv.writer(self.my_file)
+        self.writer.writerow(CONFIG_LOG_FIELDS)
+        self.last_values = {}  # key -> encoded value last written
 
     def write_data(self, loop_time):
-        '''Writes new row of Config data to Config file.'''
+        '''Writes a row for each config key changed since the last call (all keys on the first).'''
         self.config.loop_time = loop_time
         self.config.actual_time = time.time()
-        self.writer.writerow(self.config.__dict__)
+        for key, value in self.config.__dict__.items():
+            if key in UNLOGGED_CONFIG_KEYS:
+                continue
+            encoded_value = encode_config_value(value)
+            if self.last_values.get(key) != encoded_value:
+                self.last_values[key] = encoded_value
+                self.writer.writerow(
+                    [loop_time, self.config.actual_time, key, encoded_value])
 
     def close_file(self):
         if self.file_ID is not None:
             self.my_file.close()
 
 
+def encode_config_value(value) -> str:
+    '''Enums are written as e.g. Task.WALKING, everything else as its repr.'''
+    if isinstance(value, Enum):
+        return str(value)
+    return repr(value)
+
+
+def decode_config_value(text: str):
+    '''Inverse of encode_config_value. Also reads str() values from old full-row config files.
+
+    Enum values are looked up among this module's enums; anything that can't be parsed is
+    returned as the string.'''
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        enum_name, _, member_name = text.partition('.')
+        enum_class = globals().get(enum_name)
+        if (isinstance(enum_class, type) and issubclass(enum_class, Enum) and
+                member_name in enum_class.__members__):
+            return enum_class[member_name]
+        return text
+
+
+class ConfigLog():
+    def __init__(self, loop_times: List[float], snapshots: List[dict]):
+        '''Config in effect from each loop_time (sorted) on. snapshots[i] is a full dict of
+        key -> value from loop_times[i] until loop_times[i+1]. Usually made by load_config_log().'''
+        self.loop_times = loop_times
+        self.snapshots = snapshots
+
+    def _get_index(self, loop_time: float) -> int:
+        # Binary search for the last change at or before loop_time. Before the first one, the
+        # initial snapshot applies (it is written before the main loop starts).
+        return max(bisect.bisect_right(self.loop_times, loop_time) - 1, 0)
+
+    def config_at(self, loop_time: float) -> dict:
+        '''Returns (a copy of) the config in effect at loop_time, as key -> value.'''
+        return dict(self.snapshots[self._get_index(loop_time)])
+
+    def value_at(self, key: str, loop_time: float):
+        '''Returns the value of one config key in effect at loop_time.'''
+        return self.snapshots[self._get_index(loop_time)][key]
+
+    def join(self, data, keys: List[str], on: str = 'loop_time'):
+        '''Returns a copy of a pandas DataFrame of exo data with a column added for each config
+        key, holding the value in effect at each row. The snapshot for every row is found with
+        one vectorized search over the change times, as in event_log.join_events().'''
+        import numpy as np  # Only needed for analysis, so not imported with config_util
+        idxs = np.searchsorted(np.asarray(self.loop_times, dtype=float), data[on].to_numpy(),
+                               side='right') - 1
+        np.maximum(idxs, 0, out=idxs)  # Before the first change, the initial snapshot applies
+        joined = data.copy()
+        values = np.empty(len(self.snapshots), dtype=object)
+        for key in keys:
+            for i, snapshot in enumerate(self.snapshots):
+                values[i] = snapshot.get(key)
+            joined[key] = values[idxs]
+            joined[key] = joined[key].infer_objects()
+        return joined
+
+
+def load_config_log(filename: str) -> ConfigLog:
+    '''Reads a _CONFIG.csv file written by ConfigSaver into a ConfigLog.
+
+    Old config files, with a full row of every key per update, are read too.'''
+    with open(filename, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = list(reader)
+    loop_times = []
+    snapshots = []
+    if header == CONFIG_LOG_FIELDS:
+        snapshot = {}
+        for loop_time, _, key, value in rows:
+            loop_time = float(loop_time)
+            if not loop_times or loop_time != loop_times[-1]:
+                snapshot = dict(snapshot)  # Rows of one write_data() call share a loop_time
+                loop_times.append(loop_time)
+                snapshots.append(snapshot)
+            snapshot[key] = decode_config_value(value)
+    else:
+        for row in rows:
+            snapshot = {key: decode_config_value(value) for key, value in zip(header, row)
+                        if key not in UNLOGGED_CONFIG_KEYS}
+            loop_times.append(float(row[header.index('loop_time')]))
+            snapshots.append(snapshot)
+    return ConfigLog(loop_times=loop_times, snapshots=snapshots)
+
+
 def load_config(config_filename) -> Type[ConfigurableConstants]:
     try:
         # strip extra parts off
@@ -171,9 +402,10 @@ def load_config_from_args():
 def get_sync_detector(config: Type[ConfigurableConstants]):
     if config.DO_READ_SYNC:
         print('Creating sync detector')
-        import gpiozero  # pylint: disable=import-error
-        sync_detector = gpiozero.InputDevice(
-            pin=constants.SYNC_PIN, pull_up=False)
+        import gpio_util
+        sync_detector = gpio_util.create_input_device(
+            pin=constants.SYNC_PIN, pull_up=False,
+            use_edge_callbacks=config.USE_GPIO_EDGE_CALLBACKS)
         return sync_detector
     else:
         return None
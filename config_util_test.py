@@ -0,0 +1,139 @@
+import csv
+import dataclasses
+import inspect
+import os
+import re
+import tempfile
+import unittest
+
+import pandas as pd
+
+import config_util
+
+
+class Test_ConfigLog(unittest.TestCase):
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.temp_dir.name)
+        os.mkdir('exo_data')
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        self.temp_dir.cleanup()
+
+    def write_config_log(self):
+        config = config_util.ConfigurableConstants()
+        config_saver = config_util.ConfigSaver(file_ID='test', config=config)
+        config_saver.write_data(loop_time=0)
+        config.RISE_FRACTION = 0.25
+        config_saver.write_data(loop_time=5)
+        config_saver.write_data(loop_time=7)  # No change
+        config.LEFT_PEAK_TORQUE = 12
+        config.TASK = config_util.Task.STANDINGPERTURBATION
+        config_saver.write_data(loop_time=10)
+        config_saver.close_file()
+        return config, os.path.join('exo_data', os.listdir('exo_data')[0])
+
+    def test_only_changes_are_written(self):
+        config, filename = self.write_config_log()
+        with open(filename, newline='') as f:
+            rows = list(csv.DictReader(f))
+        num_keys = len(config.__dict__) - len(config_util.UNLOGGED_CONFIG_KEYS)
+        self.assertEqual(len(rows), num_keys + 3)
+        self.assertEqual([(row['loop_time'], row['key']) for row in rows[num_keys:]],
+                         [('5', 'RISE_FRACTION'), ('10', 'TASK'), ('10', 'LEFT_PEAK_TORQUE')])
+
+    def test_config_at(self):
+        config, filename = self.write_config_log()
+        config_log = config_util.load_config_log(filename)
+        initial_config = config_log.config_at(-1)
+        self.assertEqual(initial_config['RISE_FRACTION'],
+                         config_util.ConfigurableConstants.RISE_FRACTION)
+        self.assertEqual(config_log.config_at(4.9)['RISE_FRACTION'], initial_config['RISE_FRACTION'])
+        self.assertEqual(config_log.config_at(5)['RISE_FRACTION'], 0.25)
+        self.assertEqual(config_log.value_at('LEFT_PEAK_TORQUE', 9), initial_config['LEFT_PEAK_TORQUE'])
+        final_config = config_log.config_at(100)
+        for key, value in config.__dict__.items():
+            if key not in config_util.UNLOGGED_CONFIG_KEYS:
+                self.assertEqual(final_config[key], value, key)
+        self.assertIs(final_config['TASK'], config_util.Task.STANDINGPERTURBATION)
+
+    def test_join(self):
+        _, filename = self.write_config_log()
+        config_log = config_util.load_config_log(filename)
+        data = pd.DataFrame({'loop_time': [0, 4, 5, 8, 10, 12]})
+        joined = config_log.join(data, keys=['RISE_FRACTION', 'LEFT_PEAK_TORQUE'])
+        initial_config = config_log.config_at(0)
+        self.assertEqual(list(joined['RISE_FRACTION']), [initial_config['RISE_FRACTION']]*2 + [0.25]*4)
+        self.assertEqual(list(joined['LEFT_PEAK_TORQUE']),
+                         [initial_config['LEFT_PEAK_TORQUE']]*4 + [12]*2)
+        self.assertEqual(joined['RISE_FRACTION'].dtype, float)
+        self.assertEqual(list(config_log.join(data.iloc[::-1], keys=['TASK'])['TASK']),
+                         [config_util.Task.STANDINGPERTURBATION]*2 + [initial_config['TASK']]*4)
+
+    def test_load_full_row_config_file(self):
+        filename = 'old_CONFIG.csv'
+        with open(filename, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['loop_time', 'actual_time', 'TASK', 'RISE_FRACTION'])
+            writer.writeheader()
+            writer.writerow({'loop_time': 0, 'actual_time': 1, 'TASK': config_util.Task.WALKING,
+                             'RISE_FRACTION': 0.2})
+            writer.writerow({'loop_time': 3, 'actual_time': 4, 'TASK': config_util.Task.WALKING,
+                             'RISE_FRACTION': 0.3})
+        config_log = config_util.load_config_log(filename)
+        self.assertEqual(config_log.config_at(2), {'TASK': config_util.Task.WALKING,
+                                                   'RISE_FRACTION': 0.2})
+        self.assertEqual(config_log.value_at('RISE_FRACTION', 3), 0.3)
+
+
+class Test_validate_config_updates(unittest.TestCase):
+
+    def test_valid_updates(self):
+        self.assertEqual(
+            config_util.validate_config_updates(
+                {'K_VAL': 400, 'SWING_ONLY': True, 'LEFT_PEAK_TORQUE': 10, 'RISE_FRACTION': 0.25}),
+            {'K_VAL': 400, 'SWING_ONLY': True, 'LEFT_PEAK_TORQUE': 10, 'RISE_FRACTION': 0.25})
+        all_keys = [config_field.name for config_field in dataclasses.fields(
+            config_util.ConfigurableConstants)]
+        self.assertEqual(
+            config_util.validate_config_updates(
+                {'TASK': 'WALKINGMLGAITPHASE', 'HIL_SEED': None, 'VARS_TO_PLOT': ['ankle_angle']},
+                allowed_keys=all_keys),
+            {'TASK': config_util.Task.WALKINGMLGAITPHASE, 'HIL_SEED': None,
+             'VARS_TO_PLOT': ['ankle_angle']})
+
+    def test_invalid_updates(self):
+        for updates in [{'NOT_A_FIELD': 1}, {'loop_time': 1}, {'K_VAL': 1.5}, {'K_VAL': True},
+                        {'RISE_FRACTION': '0.2'}, {'RISE_FRACTION': None}]:
+            with self.assertRaises(ValueError):
+                config_util.validate_config_updates(updates)
+
+    def test_startup_only_keys_rejected(self):
+        for key, value in [('TASK', 'WALKING'), ('STANCE_CONTROL_STYLE', 'GENERICSPLINE'),
+                           ('TARGET_FREQ', 100), ('READ_ONLY', True), ('JETSON_PROTOCOL', 'TEXT'),
+                           ('MAX_ALLOWABLE_CURRENT', 1000), ('SLACK_PREDICTION', 'VELOCITY')]:
+            with self.assertRaisesRegex(ValueError, key):
+                config_util.validate_config_updates({key: value, 'K_VAL': 400})
+
+    def test_runtime_keys_match_update_methods(self):
+        '''Every config key read by an update-from-config method is a runtime key.'''
+        import controllers
+        import gait_state_estimators
+        import state_machines
+        read_keys = set()
+        for module in [controllers, gait_state_estimators, state_machines]:
+            for _, cls in inspect.getmembers(module, inspect.isclass):
+                for name in ['update_ctrl_params_from_config', 'update_params_from_config']:
+                    if name in cls.__dict__:
+                        read_keys.update(re.findall(r'config\.([A-Z_]+)',
+                                                    inspect.getsource(cls.__dict__[name])))
+        self.assertTrue(read_keys)
+        self.assertLessEqual(read_keys, set(config_util.RUNTIME_CONFIG_KEYS))
+        config_keys = [config_field.name for config_field in dataclasses.fields(
+            config_util.ConfigurableConstants)]
+        self.assertLessEqual(set(config_util.RUNTIME_CONFIG_KEYS), set(config_keys))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -79,6 +79,10 @@ MAX_ALLOWABLE_CURRENT_COMMAND = 25000  # mA
 MAX_ALLOWABLE_K_COMMAND = 8000  # Dephy Internal Units
 MAX_ALLOWABLE_B_COMMAND = 5500  # NOT TESTED!
 
+# Exo.DataContainer fields sent to the Jetson gait phase model, in wire order
+ML_FEATURE_NAMES = ['accel_x', 'accel_y', 'accel_z', 'gyro_x', 'gyro_y', 'gyro_z',
+                    'ankle_angle', 'ankle_velocity']
+
 
 class Side(Enum):
     RIGHT = 1
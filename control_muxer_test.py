@@ -0,0 +1,126 @@
+import functools
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import config_util
+import constants
+import control_muxer
+import exoboot
+import ml_util
+from exoboot_test import FAKE_FXE, FakeFlexSEA
+
+SUPPORTED_STYLES = {
+    config_util.Task.WALKING: [config_util.StanceCtrlStyle.FOURPOINTSPLINE,
+                               config_util.StanceCtrlStyle.SAWICKIWICKI,
+                               config_util.StanceCtrlStyle.ITERATIVELEARNINGSPLINE],
+    config_util.Task.WALKINGMLGAITPHASE: [config_util.StanceCtrlStyle.FOURPOINTSPLINE,
+                                          config_util.StanceCtrlStyle.SAWICKIWICKI,
+                                          config_util.StanceCtrlStyle.ITERATIVELEARNINGSPLINE],
+    config_util.Task.BILATERALSTANDINGPERTURBATION: [config_util.StanceCtrlStyle.GENERICIMPEDANCE,
+                                                     config_util.StanceCtrlStyle.FOURPOINTSPLINE,
+                                                     config_util.StanceCtrlStyle.FIVEPOINTSPLINE],
+    config_util.Task.SLIPDETECTFROMSYNC: [config_util.StanceCtrlStyle.GENERICIMPEDANCE,
+                                          config_util.StanceCtrlStyle.FOURPOINTSPLINE,
+                                          config_util.StanceCtrlStyle.FIVEPOINTSPLINE]}
+
+
+class Test_control_muxer(unittest.TestCase):
+
+    def test_every_task_registered(self):
+        for task in config_util.Task:
+            with self.subTest(task=task):
+                self.assertTrue(callable(control_muxer.get_task_builder(task)))
+
+    @mock.patch.dict(control_muxer._task_registry, clear=True)
+    def test_unregistered_task(self):
+        with self.assertRaises(ValueError):
+            control_muxer.get_task_builder(config_util.Task.STANDINGPERTURBATION)
+
+    @mock.patch.dict(control_muxer._task_registry)
+    def test_builder_imported_when_selected(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        module_name = 'throwaway_task_builder'
+        with open(os.path.join(temp_dir.name, module_name + '.py'), 'w') as f:
+            f.write('def build(exo_list, config):\n    return [], []\n')
+        sys.path.insert(0, temp_dir.name)
+        self.addCleanup(sys.path.remove, temp_dir.name)
+        self.addCleanup(sys.modules.pop, module_name, None)
+        control_muxer.register_task(config_util.Task.STANDINGPERTURBATION, module_name)
+        self.assertNotIn(module_name, sys.modules)
+        self.assertIs(control_muxer.get_task_builder(config_util.Task.STANDINGPERTURBATION),
+                      sys.modules[module_name].build)
+
+    def test_close_task_resources(self):
+        closed = []
+        for name in ['first', 'second']:
+            control_muxer.close_on_shutdown(mock.Mock(close=functools.partial(closed.append, name)))
+        control_muxer.close_task_resources()
+        self.assertEqual(closed, ['second', 'first'])
+        control_muxer.close_task_resources()  # Each is closed once
+        self.assertEqual(closed, ['second', 'first'])
+
+
+class Test_task_builders(unittest.TestCase):
+
+    def setUp(self):
+        patchers = [mock.patch.object(exoboot, 'fxs', FakeFlexSEA()),
+                    mock.patch.object(exoboot, 'fxe', FAKE_FXE),
+                    # No Jetson to connect to
+                    mock.patch.object(ml_util, 'JetsonInterface', functools.partial(
+                        ml_util.JetsonInterface, do_set_up_server=False))]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(control_muxer.close_task_resources)
+        self.exo_list = []
+        for side, motor_sign in [(constants.Side.LEFT, -1), (constants.Side.RIGHT, 1)]:
+            exo = exoboot.Exo(dev_id=None, max_allowable_current=20000)
+            exo.side = side
+            exo.motor_sign = motor_sign
+            self.exo_list.append(exo)
+
+    def test_supported_styles_build(self):
+        for task, styles in SUPPORTED_STYLES.items():
+            for style in styles:
+                with self.subTest(task=task, style=style):
+                    config = config_util.ConfigurableConstants(TASK=task,
+                                                               STANCE_CONTROL_STYLE=style)
+                    gait_state_estimator_list, state_machine_list = \
+                        control_muxer.get_gse_and_sm_lists(exo_list=self.exo_list, config=config)
+                    self.assertTrue(gait_state_estimator_list)
+                    self.assertEqual(len(state_machine_list), 2)
+                    if task == config_util.Task.WALKINGMLGAITPHASE:
+                        self.assertIs(control_muxer._resources_to_close[-1],
+                                      gait_state_estimator_list[0].jetson_object)
+
+    def test_standing_perturbation_builds_nothing(self):
+        config = config_util.ConfigurableConstants(TASK=config_util.Task.STANDINGPERTURBATION)
+        self.assertEqual(control_muxer.get_gse_and_sm_lists(exo_list=self.exo_list, config=config),
+                         ([], []))
+
+    def test_swing_only_from_config_for_ml_walking_only(self):
+        for task, expected_swing_only in [(config_util.Task.WALKING, False),
+                                          (config_util.Task.WALKINGMLGAITPHASE, True)]:
+            with self.subTest(task=task):
+                config = config_util.ConfigurableConstants(TASK=task, SWING_ONLY=True)
+                _, state_machine_list = control_muxer.get_gse_and_sm_lists(
+                    exo_list=self.exo_list, config=config)
+                self.assertEqual([state_machine.swing_only for state_machine in state_machine_list],
+                                 [expected_swing_only] * 2)
+
+    def test_unsupported_styles_raise(self):
+        for task, styles in SUPPORTED_STYLES.items():
+            for style in set(config_util.StanceCtrlStyle) - set(styles):
+                with self.subTest(task=task, style=style):
+                    config = config_util.ConfigurableConstants(TASK=task,
+                                                               STANCE_CONTROL_STYLE=style)
+                    with self.assertRaises(ValueError):
+                        control_muxer.get_gse_and_sm_lists(exo_list=self.exo_list, config=config)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,12 @@
 import constants
+import logging
 from exoboot import Exo
-from scipy import signal, interpolate
+import threading
 import time
-import copy
 import filters
 import config_util
+import numpy as np
+import profiles
 import util
 from collections import deque
 from typing import Type
@@ -138,15 +140,48 @@ class StalkController(Controller):
                  Kp: int = constants.DEFAULT_SWING_KP,
                  Ki: int = constants.DEFAULT_SWING_KI,
                  Kd: int = constants.DEFAULT_SWING_KD,
-                 ff: int = constants.DEFAULT_SWING_FF):
+                 ff: int = constants.DEFAULT_SWING_FF,
+                 prediction: Type[config_util.SlackPrediction] = config_util.SlackPrediction.NONE,
+                 prediction_latency: float = 0.02,
+                 prediction_window: int = 8,
+                 prediction_order: int = 2):
+        '''Holds desired_slack by commanding motor angle from ankle angle.
+
+        prediction: config_util.SlackPrediction. If not NONE, the motor angle is commanded for
+            the ankle angle predicted prediction_latency (s) ahead, so that the position loop
+            arrives with the ankle rather than behind it. POLYNOMIAL fits an order
+            prediction_order polynomial to the last prediction_window ankle angles (falling
+            back to VELOCITY until the window fills after each switch to this controller).'''
         self.exo = exo
         self.desired_slack = desired_slack
+        self.prediction = prediction
+        self.prediction_latency = prediction_latency
+        if prediction == config_util.SlackPrediction.POLYNOMIAL:
+            self.extrapolator = filters.PolynomialExtrapolator(
+                window_size=prediction_window, order=prediction_order)
+        else:
+            self.extrapolator = None
         super().update_controller_gains(Kp=Kp, Ki=Ki, Kd=Kd, ff=ff)
 
     def command(self, reset=False):
         if reset:
             super().command_gains()
-        self.exo.command_slack(desired_slack=self.desired_slack)
+            if self.extrapolator is not None:
+                self.extrapolator.clear()
+        self.exo.command_slack(desired_slack=self.desired_slack,
+                               ankle_angle=self.predict_ankle_angle())
+
+    def predict_ankle_angle(self):
+        '''Returns the ankle angle prediction_latency ahead, or None to use the latest.'''
+        data = self.exo.data
+        if self.prediction == config_util.SlackPrediction.NONE:
+            return None
+        if self.extrapolator is not None:
+            self.extrapolator.update(data.state_time, data.ankle_angle)
+            predicted_ankle_angle = self.extrapolator.extrapolate(self.prediction_latency)
+            if predicted_ankle_angle is not None:
+                return predicted_ankle_angle
+        return data.ankle_angle + data.ankle_velocity * self.prediction_latency
 
 
 class GenericSplineController(Controller):
@@ -159,11 +194,34 @@ class GenericSplineController(Controller):
                  Kp: int = constants.DEFAULT_KP,
                  Ki: int = constants.DEFAULT_KI,
                  Kd: int = constants.DEFAULT_KD,
-                 ff: int = constants.DEFAULT_FF):
+                 ff: int = constants.DEFAULT_FF,
+                 use_spline_table: bool = True,
+                 fade_shape: Type[config_util.FadeShape] = config_util.FadeShape.LINEAR,
+                 use_current_table: bool = False):
+        '''Commands torque from a pchip spline through (spline_x, spline_y) vs. gait phase or time.
+
+        use_spline_table: if True, the spline is compiled into a profiles.SplineTable (via the
+            shared profiles.profile_cache) each time it is updated, and evaluated (and
+            cross-faded) from the table with a profiles.ProfileFader; if False, the pchip is
+            evaluated exactly.
+        fade_shape: config_util.FadeShape of the cross-fade after a spline update.
+        use_current_table: if True (needs use_spline_table and use_gait_phase), current is
+            looked up from a profiles.CurrentTable over (gait phase, ankle angle) instead of
+            going through exo.command_torque, except while cross-fading or while the table is
+            being (re)built, in the background, after the spline, exo.max_allowable_current or
+            the exo's calibration changes.'''
+        if use_current_table and not (use_spline_table and use_gait_phase):
+            raise ValueError('use_current_table requires use_spline_table and use_gait_phase')
         self.exo = exo
+        self.use_spline_table = use_spline_table
+        self.use_current_table = use_current_table
+        self.current_table = None  # (key, profiles.CurrentTable), see _get_current_table()
+        self.current_table_key_building = None
+        self.fade_duration = fade_duration
+        self.fade_shape = fade_shape
+        self.profile_fader = profiles.ProfileFader(fade_duration=fade_duration, fade_shape=fade_shape)
         self.spline = None  # Placeholds so update_spline can fill self.last_spline
         self.update_spline(spline_x, spline_y, first_call=True)
-        self.fade_duration = fade_duration
         self.use_gait_phase = use_gait_phase  # if False, use time (s)
         super().update_controller_gains(Kp=Kp, Ki=Ki, Kd=Kd, ff=ff)
         # Fade timer goes from 0 to fade_duration, active if below fade_duration (starts inactive)
@@ -187,7 +245,14 @@ class GenericSplineController(Controller):
         elif phase > self.spline_x[-1]:
             # If phase (elapsed time) is longer than spline is specified, use last spline point
             print('phase is longer than specified spline')
-            desired_torque = self.spline(self.spline_x)
+            desired_torque = self.spline_y[-1]
+        elif (self.use_current_table and not self.profile_fader.is_fading() and
+              self._get_current_table() is not None):
+            self._command_from_current_table(phase=phase, current_table=self.current_table[1])
+            return
+        elif self.use_spline_table:
+            # Fades from the last spline if recently updated
+            desired_torque = self.profile_fader(phase)
         elif time.perf_counter() - self.fade_start_time < self.fade_duration:
             # If fading splines
             desired_torque = self.fade_splines(
@@ -195,6 +260,10 @@ class GenericSplineController(Controller):
         else:
             desired_torque = self.spline(phase)
 
+        self._command_torque(phase=phase, desired_torque=desired_torque)
+
+    def _command_torque(self, phase, desired_torque):
+        '''Sends desired_torque at phase. Child classes can override this to modify it.'''
         self.exo.command_torque(desired_torque)
 
     def update_spline(self, spline_x, spline_y, first_call=False):
@@ -203,15 +272,61 @@ class GenericSplineController(Controller):
             self.spline_y = spline_y
             print('Splines updated: ', 'x = ', spline_x, 'y = ', spline_y)
             self.fade_start_time = time.perf_counter()
-            self.last_spline = copy.deepcopy(self.spline)
-            self.spline = interpolate.pchip(
-                spline_x, spline_y, extrapolate=False)
+            if self.use_spline_table:
+                # Returning to a recent setting (on either side) reuses its compiled table
+                self.spline = profiles.profile_cache.get(spline_x, spline_y)
+                self.profile_fader.set_profile(self.spline, do_fade=not first_call)
+            else:
+                # Splines are replaced, never modified, so the old one needs no copy
+                self.last_spline = self.spline
+                from scipy import interpolate
+                self.spline = interpolate.pchip(
+                    spline_x, spline_y, extrapolate=False)
+
+    def _get_current_table(self):
+        '''Returns the CurrentTable for the current spline, max current and calibration, or None.
+
+        A stale table is rebuilt on a background thread (numpy, tens of ms), and None is
+        returned until it is ready, so the control loop never waits for a build.'''
+        exo = self.exo
+        key = (self.spline, exo.max_allowable_current, exo.calibration_version)
+        built = self.current_table  # (key, CurrentTable), replaced in one assignment
+        if built is not None and built[0] == key:
+            return built[1]
+        if self.current_table_key_building != key:
+            self.current_table_key_building = key
+            threading.Thread(target=self._build_current_table, args=(key,), daemon=True).start()
+        return None
+
+    def _build_current_table(self, key):
+        spline, max_allowable_current, _ = key
+        current_table = profiles.CurrentTable(
+            profile=spline, TR_from_ankle_angle=self.exo.TR_from_ankle_angle,
+            motor_sign=self.exo.motor_sign, max_allowable_current=max_allowable_current)
+        if key == self.current_table_key_building:  # Not superseded while building
+            self.current_table = (key, current_table)
+
+    def _command_from_current_table(self, phase, current_table):
+        '''Same current as exo.command_torque(self.spline(phase)), from one 2-D table lookup.'''
+        exo = self.exo
+        desired_torque = self.spline(phase)
+        ankle_angle = exo.data.ankle_angle
+        if desired_torque > current_table.get_max_torque(ankle_angle):
+            if exo.is_clipping is False:  # Only print once when clipping occurs before reset
+                logging.warning('Torque was clipped!')
+            exo.is_clipping = True
+        else:
+            exo.is_clipping = False
+        exo.command_current(desired_mA=current_table(phase, ankle_angle))
+        exo.data.commanded_torque = desired_torque
 
     def fade_splines(self, phase, fraction):
+        '''Blends exact pchips (use_spline_table=False). Tables are faded by self.profile_fader.'''
+        weight = profiles.get_fade_weight(fraction, self.fade_shape)
         torque_from_last_spline = self.last_spline(phase)
         torque_from_current_spline = self.spline(phase)
-        desired_torque = (1-fraction)*torque_from_last_spline + \
-            fraction*torque_from_current_spline
+        desired_torque = (1-weight)*torque_from_last_spline + \
+            weight*torque_from_current_spline
         return desired_torque
 
 
@@ -232,8 +347,14 @@ class FourPointSplineController(GenericSplineController):
                  fade_duration: float = 5,
                  bias_torque: float = 5,
                  use_gait_phase: bool = True,
-                 peak_hold_time: float = 0):
-        '''Inherits from GenericSplineController, and adds a update_spline_with_list function.'''
+                 peak_hold_time: float = 0,
+                 use_spline_table: bool = True,
+                 fade_shape: Type[config_util.FadeShape] = config_util.FadeShape.LINEAR,
+                 use_current_table: bool = False):
+        '''Inherits from GenericSplineController, and adds a update_spline_with_list function.
+
+        peak_hold_time: if > 0, the peak torque is held this long (same units as the
+            fractions) before falling, and the fall ends peak_hold_time after fall_fraction.'''
         self.exo=exo
         self.left_peak_torque=left_peak_torque
         self.right_peak_torque=right_peak_torque
@@ -250,7 +371,10 @@ class FourPointSplineController(GenericSplineController):
                          spline_y=self._get_spline_y(left_peak_torque,right_peak_torque),
                          Kp=Kp, Ki=Ki, Kd=Kd, ff=ff,
                          fade_duration=fade_duration,
-                         use_gait_phase=use_gait_phase)
+                         use_gait_phase=use_gait_phase,
+                         use_spline_table=use_spline_table,
+                         fade_shape=fade_shape,
+                         use_current_table=use_current_table)
         else:
             super().__init__(exo=exo,
                          spline_x=self._get_spline_x(
@@ -258,7 +382,10 @@ class FourPointSplineController(GenericSplineController):
                          spline_y=self._get_spline_y(left_peak_torque,right_peak_torque),
                          Kp=Kp, Ki=Ki, Kd=Kd, ff=ff,
                          fade_duration=fade_duration,
-                         use_gait_phase=use_gait_phase)
+                         use_gait_phase=use_gait_phase,
+                         use_spline_table=use_spline_table,
+                         fade_shape=fade_shape,
+                         use_current_table=use_current_table)
 
     def update_ctrl_params_from_config(self, config: Type[config_util.ConfigurableConstants]):
         '''Updates controller parameters from the config object.'''
@@ -280,16 +407,21 @@ class FourPointSplineController(GenericSplineController):
                               spline_y=self._get_spline_y(left_peak_torque=config.LEFT_PEAK_TORQUE,right_peak_torque=config.RIGHT_PEAK_TORQUE))
 
     def _get_spline_x(self, rise_fraction, left_peak_fraction,right_peak_fraction, left_fall_fraction, right_fall_fraction) -> list:
+        if self.exo.side == constants.Side.LEFT:
+            peak_fraction, fall_fraction = left_peak_fraction, left_fall_fraction
+        else:
+            peak_fraction, fall_fraction = right_peak_fraction, right_fall_fraction
         if self.peak_hold_time > 0:
-            if self.exo.side == constants.Side.LEFT:
-            	return [0, rise_fraction, left_peak_fraction, left_peak_fraction+self.peak_hold_time, left_fall_fraction, 1]
-            else:
-                return [0,rise_fraction,right_peak_fraction,right_peak_fraction+self.peak_hold_time,right_fall_fraction,1]
+            # The hold is inserted after the peak, so the fall knot moves later by the same
+            # amount and the fall takes as long as without a hold
+            spline_x = [0, rise_fraction, peak_fraction, peak_fraction + self.peak_hold_time,
+                        fall_fraction + self.peak_hold_time, 1]
         else:
-            if self.exo.side == constants.Side.LEFT:
-            	return [0, rise_fraction, left_peak_fraction, left_fall_fraction, 10]
-            else:
-                return [0,rise_fraction,right_peak_fraction,right_fall_fraction,10]
+            spline_x = [0, rise_fraction, peak_fraction, fall_fraction, 10]
+        if any(x1 >= x2 for x1, x2 in zip(spline_x[:-1], spline_x[1:])):
+            raise ValueError('Spline knots must be strictly increasing (check rise, peak and '
+                             'fall fractions and peak_hold_time): ' + str(spline_x))
+        return spline_x
 
     def _get_spline_y(self, left_peak_torque, right_peak_torque) -> list:
         if self.peak_hold_time > 0:
@@ -303,6 +435,107 @@ class FourPointSplineController(GenericSplineController):
             else:
                 return [self.bias_torque, self.bias_torque, right_peak_torque, self.bias_torque, self.bias_torque]
 
+class IterativeLearningSplineController(FourPointSplineController):
+    def __init__(self,
+                 exo: Exo,
+                 num_bins: int = 100,
+                 learning_gain: float = 0.3,
+                 forgetting_factor: float = 0.99,
+                 max_correction: float = 5,
+                 max_stride_duration_change: float = 0.3,
+                 **kwargs):
+        '''FourPointSplineController plus a feedforward torque learned from stride to stride.
+
+        exo.command_torque is open loop, so measured torque (ankle_torque_from_current) has a
+        repeatable error vs. the spline in stance. Each tick, the error of the last command is
+        summed into its gait phase bin; at heel strike (reset=True) the whole correction array
+        is updated at once,
+            correction = clip(forgetting_factor*correction + learning_gain*mean_error, +/-max_correction)
+        and desired torque + correction[bin] is commanded on the next stride. Bins where the
+        command was clipped are not learned from. A stride whose duration changes by more than
+        max_stride_duration_change (fraction), with a slip or with no gait phase, counts as a
+        gait disruption: its errors are dropped and the correction is reset to zero.
+
+        Other keyword arguments are passed to FourPointSplineController (gait phase only,
+        without use_current_table, which bypasses command_torque).'''
+        if not 0 < learning_gain <= 1:
+            raise ValueError('learning_gain must be in (0, 1]')
+        if not 0 <= forgetting_factor <= 1:
+            raise ValueError('forgetting_factor must be in [0, 1]')
+        if kwargs.get('use_current_table') or not kwargs.get('use_gait_phase', True):
+            raise ValueError(
+                'IterativeLearningSplineController needs use_gait_phase and not use_current_table')
+        self.num_bins = num_bins
+        self.learning_gain = learning_gain
+        self.forgetting_factor = forgetting_factor
+        self.max_correction = max_correction
+        self.max_stride_duration_change = max_stride_duration_change
+        self.correction = np.zeros(num_bins)  # Nm, added to the spline
+        self.error_sum = np.zeros(num_bins)  # Nm, this stride
+        self.error_count = np.zeros(num_bins, dtype=int)
+        self.last_bin = None
+        self.last_desired_torque = None
+        self.stride_start_time = None
+        self.last_stride_duration = None
+        self.is_stride_disrupted = False
+        self.do_check_slip = hasattr(exo.data, 'did_slip')
+        self.num_updates = 0
+        self.num_resets = 0
+        super().__init__(exo=exo, **kwargs)
+
+    def command(self, reset=False):
+        if reset:
+            self._update_correction()
+        super().command(reset=reset)
+
+    def _command_torque(self, phase, desired_torque):
+        exo = self.exo
+        if self.last_bin is not None and not exo.is_clipping:
+            self.error_sum[self.last_bin] += self.last_desired_torque - \
+                exo.data.ankle_torque_from_current
+            self.error_count[self.last_bin] += 1
+        if self.do_check_slip and exo.data.did_slip:
+            self.is_stride_disrupted = True
+        if phase is None or phase >= 1:
+            self.is_stride_disrupted = self.is_stride_disrupted or phase is None
+            self.last_bin = None
+            exo.command_torque(desired_torque)
+            return
+        self.last_bin = int(phase * self.num_bins)
+        self.last_desired_torque = desired_torque
+        exo.command_torque(max(0, desired_torque + self.correction[self.last_bin]))
+
+    def _update_correction(self):
+        '''Called at heel strike: learns from the stride that just ended, all bins at once.'''
+        time_now = time.perf_counter()
+        if self.stride_start_time is not None:
+            stride_duration = time_now - self.stride_start_time
+            if self.last_stride_duration is not None:
+                if abs(stride_duration / self.last_stride_duration - 1) > self.max_stride_duration_change:
+                    self.is_stride_disrupted = True
+                if self.is_stride_disrupted:
+                    self.correction[:] = 0
+                    self.num_resets += 1
+                    print('Gait disrupted, iterative learning correction reset on side: ',
+                          self.exo.side)
+                else:
+                    was_commanded = self.error_count > 0
+                    mean_error = np.divide(self.error_sum, self.error_count,
+                                           out=np.zeros(self.num_bins), where=was_commanded)
+                    self.correction[was_commanded] = \
+                        self.forgetting_factor * self.correction[was_commanded] + \
+                        self.learning_gain * mean_error[was_commanded]
+                    np.clip(self.correction, -self.max_correction, self.max_correction,
+                            out=self.correction)
+                    self.num_updates += 1
+            self.last_stride_duration = stride_duration
+        self.stride_start_time = time_now
+        self.error_sum[:] = 0
+        self.error_count[:] = 0
+        self.last_bin = None
+        self.is_stride_disrupted = False
+
+
 class SmoothReelInController(Controller):
     def __init__(self,
                  exo: Exo,
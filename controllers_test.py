@@ -3,6 +3,9 @@ import unittest
 import numpy as np
 from scipy import signal
 import matplotlib.pyplot as plt
+from types import SimpleNamespace
+from unittest import mock
+import constants
 
 
 class Test_PositionController(unittest.TestCase):
@@ -26,5 +29,74 @@ class Test_PositionController(unittest.TestCase):
         spline_controller = controllers.FourPointSplineController(exo)
 
 
+class FakeExo():
+    '''Delivers torque_gain times the commanded torque, read back on the next tick.'''
+
+    def __init__(self, torque_gain: float = 0.8):
+        self.side = constants.Side.LEFT
+        self.data = SimpleNamespace(gait_phase=0, ankle_torque_from_current=0)
+        self.is_clipping = False
+        self.torque_gain = torque_gain
+
+    def update_gains(self, **kwargs):
+        pass
+
+    def command_torque(self, desired_torque):
+        self.data.ankle_torque_from_current = self.torque_gain * desired_torque
+
+
+class Test_FourPointSplineController(unittest.TestCase):
+
+    def test_peak_hold_knots_increasing(self):
+        # Default slip task settings: a 0.1 hold after a 0.53 peak would pass a 0.6 fall
+        controller = controllers.FourPointSplineController(
+            exo=FakeExo(), left_peak_fraction=0.53, left_fall_fraction=0.6,
+            use_gait_phase=False, peak_hold_time=0.1)
+        self.assertEqual(controller._get_spline_x(0.2, 0.53, 0.53, 0.6, 0.6),
+                         [0, 0.2, 0.53, 0.63, 0.7, 1])
+        self.assertAlmostEqual(controller.spline(0.6), controller.left_peak_torque, places=2)
+        self.assertAlmostEqual(controller.spline(0.7), controller.bias_torque, places=2)
+
+    def test_invalid_knots_raise(self):
+        with self.assertRaises(ValueError):
+            controllers.FourPointSplineController(
+                exo=FakeExo(), left_peak_fraction=0.53, left_fall_fraction=0.95,
+                peak_hold_time=0.1)
+
+
+class Test_IterativeLearningSplineController(unittest.TestCase):
+
+    def run_stride(self, controller, exo, stride_duration):
+        errors = []
+        self.time_now += stride_duration
+        with mock.patch('time.perf_counter', return_value=self.time_now):
+            for idx, gait_phase in enumerate(np.arange(0, 0.6, 0.005)):
+                exo.data.gait_phase = gait_phase
+                desired_torque = controller.spline(gait_phase)
+                controller.command(reset=idx == 0)
+                errors.append(desired_torque - exo.data.ankle_torque_from_current)
+        return np.sqrt(np.mean(np.square(errors)))
+
+    def test_learns_and_resets(self):
+        self.time_now = 0
+        exo = FakeExo()
+        controller = controllers.IterativeLearningSplineController(
+            exo=exo, learning_gain=0.5, forgetting_factor=1, max_correction=10,
+            left_peak_torque=20, bias_torque=0, fade_duration=0)
+        rms_errors = [self.run_stride(controller, exo, stride_duration=1) for _ in range(15)]
+        self.assertLess(rms_errors[-1], 0.1 * rms_errors[0])
+        self.assertLessEqual(np.max(np.abs(controller.correction)), 10)
+        self.assertEqual(controller.num_resets, 0)
+        self.run_stride(controller, exo, stride_duration=2)  # Twice as long: disrupted
+        self.assertEqual(controller.num_resets, 1)
+        self.assertFalse(np.any(controller.correction))
+        self.run_stride(controller, exo, stride_duration=2)
+        self.assertEqual(controller.num_resets, 1)
+
+    def test_bounded_gains(self):
+        with self.assertRaises(ValueError):
+            controllers.IterativeLearningSplineController(exo=FakeExo(), learning_gain=1.5)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,137 @@
+'''State machine transition events: an in-memory ring per exo, its file writer, and analysis join.
+
+Each Exo owns a TransitionLog. Its state machine appends (loop_time, state_time, from_state,
+to_state, trigger) on every transition, with names interned to ints when the transition table
+is compiled, so an append is a few list writes. An EventLogWriter thread drains the logs
+to compact _EVENTS.csv files next to the exo data files, and join_events() attaches
+them back to exo data by time for analysis.'''
+import csv
+import threading
+
+import numpy as np
+
+EVENT_FIELDS = ['loop_time', 'state_time', 'from_state', 'to_state', 'trigger']
+
+
+class TransitionLog():
+    def __init__(self, capacity: int = 1024):
+        '''Single-producer, single-consumer ring of transition events.
+
+        The main loop is the only writer and the EventLogWriter thread the only reader; as in
+        gpio_util.EdgeBuffer, the writer fills a slot before publishing it by incrementing
+        write_count. If the reader falls more than capacity events behind, the oldest events
+        are dropped and counted.'''
+        self.capacity = capacity
+        self.loop_times = [0.0] * capacity
+        self.state_times = [0.0] * capacity
+        self.from_codes = [0] * capacity
+        self.to_codes = [0] * capacity
+        self.trigger_codes = [0] * capacity
+        self.names = []  # Code -> name, append only
+        self._codes = {}  # Name -> code
+        self.write_count = 0
+        self.read_count = 0
+        self.num_dropped = 0
+
+    def get_code(self, name: str) -> int:
+        '''Interns a state or trigger name. Call while setting up, not every tick.'''
+        if name not in self._codes:
+            self._codes[name] = len(self.names)
+            self.names.append(name)
+        return self._codes[name]
+
+    def append(self, loop_time: float, state_time: float, from_code: int, to_code: int,
+               trigger_code: int):
+        '''Called from the main loop only.'''
+        idx = self.write_count % self.capacity
+        self.loop_times[idx] = loop_time
+        self.state_times[idx] = state_time
+        self.from_codes[idx] = from_code
+        self.to_codes[idx] = to_code
+        self.trigger_codes[idx] = trigger_code
+        self.write_count += 1  # Publishes the slot
+
+    def drain(self) -> list:
+        '''Returns events since the last drain as [(loop_time, state_time, from_state, to_state,
+        trigger), ...], oldest first, with names decoded.'''
+        write_count = self.write_count
+        if write_count - self.read_count > self.capacity:
+            self.num_dropped += write_count - self.read_count - self.capacity
+            self.read_count = write_count - self.capacity
+        names = self.names
+        events = []
+        for count in range(self.read_count, write_count):
+            idx = count % self.capacity
+            events.append((self.loop_times[idx], self.state_times[idx], names[self.from_codes[idx]],
+                           names[self.to_codes[idx]], names[self.trigger_codes[idx]]))
+        self.read_count = write_count
+        return events
+
+
+class EventLogWriter(threading.Thread):
+    def __init__(self,
+                 transition_logs: list,
+                 filenames: list,
+                 flush_period: float = 0.5,
+                 name='event-log-writer-thread'):
+        '''Every flush_period (s), drains each TransitionLog to its events csv file.'''
+        super().__init__(name=name)
+        self.daemon = True  # Thread property
+        self.transition_logs = transition_logs
+        self.flush_period = flush_period
+        self.files = [open(filename, 'w', newline='') for filename in filenames]
+        self.writers = [csv.writer(f) for f in self.files]
+        for writer in self.writers:
+            writer.writerow(EVENT_FIELDS)
+        self.stop_event = threading.Event()
+        self.start()  # Starts the run() function
+
+    # This run function overrides the run() function in threading.Thread
+    def run(self):
+        while not self.stop_event.wait(timeout=self.flush_period):
+            self.flush()
+
+    def flush(self):
+        for transition_log, writer, f in zip(self.transition_logs, self.writers, self.files):
+            events = transition_log.drain()
+            if events:
+                writer.writerows(events)
+                f.flush()
+
+    def close(self):
+        '''Stops the thread, writes any remaining events, and closes the files.'''
+        self.stop_event.set()
+        self.join()
+        self.flush()
+        for transition_log, f in zip(self.transition_logs, self.files):
+            if transition_log.num_dropped:
+                print('Transition events dropped: ', transition_log.num_dropped)
+            f.close()
+
+
+def get_events_filename(data_filename: str) -> str:
+    '''exo_data/..._LEFT.csv -> exo_data/..._LEFT_EVENTS.csv'''
+    return data_filename[:-len('.csv')] + '_EVENTS.csv'
+
+
+def join_events(data, events, on: str = 'state_time'):
+    '''Adds state (the to_state of the last event at or before each row) and event (the
+    trigger of the last event since the previous row, else None) to a pandas
+    DataFrame of exo data, from a DataFrame of events (e.g., pd.read_csv of an events file).
+
+    Both are sorted by on, so this is a binary search per event rather than a scan.'''
+    data_times = data[on].to_numpy()
+    event_times = events[on].to_numpy()
+    # Row at or before each data row, for the state
+    state_idxs = np.searchsorted(event_times, data_times, side='right') - 1
+    states = events['to_state'].to_numpy(dtype=object)[np.maximum(state_idxs, 0)]
+    states[state_idxs < 0] = None
+    # First data row at or after each event, for the event marker
+    row_idxs = np.searchsorted(data_times, event_times, side='left')
+    is_in_range = row_idxs < len(data_times)
+    event_markers = np.full(len(data_times), None, dtype=object)
+    event_markers[row_idxs[is_in_range]] = events['trigger'].to_numpy(dtype=object)[is_in_range]
+    joined = data.copy()
+    joined['state'] = states
+    joined['event'] = event_markers
+    return joined
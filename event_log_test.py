@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+import event_log
+
+
+class Test_event_log(unittest.TestCase):
+
+    def test_TransitionLog_overflow(self):
+        transition_log = event_log.TransitionLog(capacity=4)
+        swing = transition_log.get_code('swing')
+        stance = transition_log.get_code('stance')
+        trigger = transition_log.get_code('did_heel_strike')
+        self.assertEqual(transition_log.get_code('swing'), swing)
+        for i in range(10):
+            transition_log.append(i, i + 0.5, swing, stance, trigger)
+        events = transition_log.drain()
+        self.assertEqual([event[0] for event in events], [6, 7, 8, 9])
+        self.assertEqual(events[0], (6, 6.5, 'swing', 'stance', 'did_heel_strike'))
+        self.assertEqual(transition_log.num_dropped, 6)
+        self.assertEqual(transition_log.drain(), [])
+
+    def test_write_and_join(self):
+        transition_log = event_log.TransitionLog()
+        codes = [transition_log.get_code(name) for name in ['swing', 'stance', 'start', 'hs', 'to']]
+        transition_log.append(0, 1.0, codes[0], codes[0], codes[2])
+        transition_log.append(0.5, 1.5, codes[0], codes[1], codes[3])
+        transition_log.append(0.81, 1.81, codes[1], codes[0], codes[4])
+        with tempfile.TemporaryDirectory() as folder:
+            filename = event_log.get_events_filename(os.path.join(folder, 'x_LEFT.csv'))
+            self.assertTrue(filename.endswith('x_LEFT_EVENTS.csv'))
+            writer = event_log.EventLogWriter(transition_logs=[transition_log],
+                                              filenames=[filename], flush_period=0.01)
+            writer.close()
+            events = pd.read_csv(filename)
+        data = pd.DataFrame({'state_time': [0.9, 1.0, 1.2, 1.5, 1.7, 1.9]})
+        joined = event_log.join_events(data, events)
+        self.assertEqual(joined.state.fillna('').tolist(),
+                         ['', 'swing', 'swing', 'stance', 'stance', 'swing'])
+        self.assertEqual(joined.event.fillna('').tolist(), ['', 'start', '', 'hs', '', 'to'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,26 +5,41 @@ import sys
 import time
 import warnings
 from dataclasses import dataclass, field, InitVar
-from scipy import interpolate
 from typing import Type
 
 import numpy as np
 
 import config_util
 import constants
+import event_log
 import filters
-from flexsea import fxEnums as fxe
-from flexsea import flexsea as flex
-from flexsea import fxUtils as fxu
+import gpio_util
+import util
 
-# Instantiate Dephy's FlexSEA object, which contains important functions
-fxs = flex.FlexSEA()
+# Dephy's FlexSEA object, which contains important functions, and its enums. flexsea is
+# only imported (by get_flexsea(), from connect_to_exos) when exos are connected, so that
+# analysis code can import this module on a computer without the Dephy library.
+fxs = None
+fxe = None
+
+
+def get_flexsea():
+    '''Imports flexsea and instantiates Dephy's FlexSEA object, on the first call.'''
+    global fxs, fxe
+    if fxs is None:
+        from flexsea import fxEnums
+        from flexsea import flexsea as flex
+        fxe = fxEnums
+        fxs = flex.FlexSEA()
+    return fxs
 
 
 def connect_to_exos(file_ID: str,
                     config: Type[config_util.ConfigurableConstants],
                     sync_detector=None):
     '''Connect to Exos, instantiate Exo objects.'''
+    from flexsea import fxUtils as fxu
+    get_flexsea()
 
     # Load Ports and baud rate
     if fxu.is_win():		# Need for WebAgg server to work in Python 3.8
@@ -53,7 +68,9 @@ def connect_to_exos(file_ID: str,
                                 do_include_did_slip=config.DO_DETECT_SLIP,
                                 max_allowable_current=config.MAX_ALLOWABLE_CURRENT,
                                 do_include_gen_vars=config.DO_INCLUDE_GEN_VARS,
-                                sync_detector=sync_detector))
+                                sync_detector=sync_detector,
+                                use_gpio_edge_callbacks=config.USE_GPIO_EDGE_CALLBACKS,
+                                write_refresh_interval=config.WRITE_REFRESH_INTERVAL))
         except IOError:
             print('Unable to open exo on port: ', port,
                   ' This is okay if only one exo is connected!')
@@ -72,13 +89,22 @@ class Exo():
                  do_read_fsrs: bool = False,
                  do_include_did_slip: bool = False,
                  do_include_gen_vars: bool = False,
-                 sync_detector=None):
+                 sync_detector=None,
+                 use_gpio_edge_callbacks: bool = False,
+                 write_refresh_interval: float = None):
         '''Exo object is the primary interface with the Dephy ankle exos, and corresponds to a single physical exoboot.
         Args:
             dev_id: int. Unique integer to identify the exo in flexsea's library. Returned by connect_to_exo
             file_ID: str. Unique string added to filename. If None, no file will be saved.
             do_read_fsrs: bool indicating whether to read FSRs.
-            sync_detector: gpiozero class for sync line, created in config_util '''
+            sync_detector: gpiozero class for sync line, created in config_util
+            use_gpio_edge_callbacks: bool. If True, FSRs are gpio_util.EdgeRecorders updated by
+                callbacks, rather than being polled every read_data().
+            write_refresh_interval: float (s). If not None, gains and motor commands identical to
+                the last ones sent are not re-sent over serial, unless this long has passed since
+                they were. Skipped gains are still sent before a command that changes control mode,
+                as controllers set their gains on reset and then switch mode. If None (default),
+                everything is sent.'''
         self.dev_id = dev_id
         self.max_allowable_current = max_allowable_current
         self.file_ID = file_ID
@@ -105,26 +131,40 @@ class Exo():
         self.ankle_velocity_filter = filters.Butterworth(
             N=2, Wn=10, fs=target_freq)
         if self.do_read_fsrs:
+            from flexsea import fxUtils as fxu
             if fxu.is_pi() or fxu.is_pi64():
-                import gpiozero  # pylint: disable=import-error
                 if self.side == constants.Side.LEFT:
-                    self.heel_fsr_detector = gpiozero.InputDevice(
-                        pin=constants.LEFT_HEEL_FSR_PIN, pull_up=True)
-                    self.toe_fsr_detector = gpiozero.InputDevice(
-                        pin=constants.LEFT_TOE_FSR_PIN, pull_up=True)
+                    heel_pin = constants.LEFT_HEEL_FSR_PIN
+                    toe_pin = constants.LEFT_TOE_FSR_PIN
                 else:
-                    self.heel_fsr_detector = gpiozero.InputDevice(
-                        pin=constants.RIGHT_HEEL_FSR_PIN, pull_up=True)
-                    self.toe_fsr_detector = gpiozero.InputDevice(
-                        pin=constants.RIGHT_TOE_FSR_PIN, pull_up=True)
+                    heel_pin = constants.RIGHT_HEEL_FSR_PIN
+                    toe_pin = constants.RIGHT_TOE_FSR_PIN
+                self.heel_fsr_detector = gpio_util.create_input_device(
+                    pin=heel_pin, pull_up=True, use_edge_callbacks=use_gpio_edge_callbacks)
+                self.toe_fsr_detector = gpio_util.create_input_device(
+                    pin=toe_pin, pull_up=True, use_edge_callbacks=use_gpio_edge_callbacks)
             else:
                 raise Exception('Can only use FSRs with rapberry pi!')
 
         self.data = self.DataContainer(
             do_include_FSRs=do_read_fsrs, do_include_did_slip=do_include_did_slip,
             do_include_gen_vars=do_include_gen_vars, do_include_sync=self.do_include_sync)
+        self.feature_history = None  # util.FeatureHistory, see enable_feature_history()
+        self.transition_log = event_log.TransitionLog()  # Appended to by this exo's state machine
         self.has_calibrated = False
+        self.calibration_version = 0  # Incremented by each calibration, so tables can be rebuilt
         self.is_clipping = False
+        # Last serial writes, for skipping redundant ones (see write_refresh_interval)
+        self.write_refresh_interval = write_refresh_interval
+        self.last_sent_gains = None
+        self.last_gains_send_time = None
+        self.last_sent_command = None  # (ctrl_mode, value)
+        self.last_command_send_time = None
+        self.has_suppressed_gains = False  # Since the last motor command
+        self.num_gain_writes = 0
+        self.num_suppressed_gain_writes = 0
+        self.num_command_writes = 0
+        self.num_suppressed_command_writes = 0
         if self.file_ID is not None:
             self.setup_data_writer(file_ID=file_ID)
         if self.dev_id is not None:
@@ -134,6 +174,7 @@ class Exo():
                               k_val=0,
                               b_val=0,
                               ff=constants.DEFAULT_FF)
+            from scipy import interpolate
             self.TR_from_ankle_angle = interpolate.PchipInterpolator(
                 constants.ANKLE_PTS, self.motor_sign*constants.TR_PTS)
 
@@ -190,6 +231,8 @@ class Exo():
                 self.sync = True
 
     def close(self):
+        print('Serial writes on side', self.side, ': ', self.get_write_stats())
+        self.write_refresh_interval = None  # Always send the shutdown commands
         self.update_gains()
         self.command_current(desired_mA=0)
         time.sleep(0.1)
@@ -219,8 +262,46 @@ class Exo():
             self.b_val = b_val
         if ff is not None:
             self.ff = ff
+        gains = (self.Kp, self.Ki, self.Kd, self.k_val, self.b_val, self.ff)
+        time_now = time.perf_counter()
+        if (self.write_refresh_interval is not None and gains == self.last_sent_gains and
+                time_now - self.last_gains_send_time < self.write_refresh_interval):
+            self.num_suppressed_gain_writes += 1
+            self.has_suppressed_gains = True
+            return
+        self._send_gains(gains=gains, time_now=time_now)
+
+    def _send_gains(self, gains: tuple, time_now: float):
         fxs.set_gains(dev_id=self.dev_id, kp=self.Kp, ki=self.Ki,
                       kd=self.Kd, k_val=self.k_val, b_val=self.b_val, ff=self.ff)
+        self.last_sent_gains = gains
+        self.last_gains_send_time = time_now
+        self.has_suppressed_gains = False
+        self.num_gain_writes += 1
+
+    def _send_motor_command(self, ctrl_mode, value):
+        '''Sends a motor command, unless it repeats the last one within write_refresh_interval.'''
+        time_now = time.perf_counter()
+        if self.has_suppressed_gains:
+            self.has_suppressed_gains = False
+            if self.last_sent_command is None or self.last_sent_command[0] != ctrl_mode:
+                # Gains set for a new control mode must reach the Actpack, even if unchanged
+                self._send_gains(gains=self.last_sent_gains, time_now=time_now)
+        if (self.write_refresh_interval is not None and ctrl_mode != fxe.FX_NONE and
+                self.last_sent_command is not None and
+                self.last_sent_command[0] == ctrl_mode and self.last_sent_command[1] == value and
+                time_now - self.last_command_send_time < self.write_refresh_interval):
+            self.num_suppressed_command_writes += 1
+            return
+        fxs.send_motor_command(dev_id=self.dev_id, ctrl_mode=ctrl_mode, value=value)
+        self.last_sent_command = (ctrl_mode, value)
+        self.last_command_send_time = time_now
+        self.num_command_writes += 1
+
+    def get_write_stats(self) -> str:
+        return 'gains sent %d, suppressed %d; commands sent %d, suppressed %d' % (
+            self.num_gain_writes, self.num_suppressed_gain_writes,
+            self.num_command_writes, self.num_suppressed_command_writes)
 
     def read_data(self, loop_time=None):
         '''Read data from Dephy Actpack, store in exo.data Data Container.
@@ -277,11 +358,26 @@ class Exo():
             self.data.ankle_velocity = self.ankle_velocity_filter.filter(
                 angular_velocity)
 
+        # In edge callback mode, value is the level cached by the last edge (no GPIO read)
         if self.do_read_fsrs:
             self.data.heel_fsr = self.heel_fsr_detector.value
             self.data.toe_fsr = self.toe_fsr_detector.value
         if self.do_include_sync:
             self.data.sync = self.sync_detector.value
+        if self.feature_history is not None:
+            self.feature_history.update(self.data)
+
+    def enable_feature_history(self, size: int):
+        '''Keeps the last size samples of constants.ML_FEATURE_NAMES, updated in read_data().
+
+        Can be called by several users (e.g., Jetson sender and local model); the history is
+        kept at the largest size requested. The same object is always returned (grown in
+        place), so earlier callers keep seeing new samples.'''
+        if self.feature_history is None:
+            self.feature_history = util.FeatureHistory(size=size)
+        else:
+            self.feature_history.resize(size)
+        return self.feature_history
 
     def get_batt_voltage(self):
         actpack_data = fxs.read_device(self.dev_id)
@@ -336,8 +432,7 @@ class Exo():
             self.command_controller_off()
             raise ValueError(
                 'abs(desired_mA) must be < config.max_allowable_current')
-        fxs.send_motor_command(
-            dev_id=self.dev_id, ctrl_mode=fxe.FX_CURRENT, value=desired_mA)
+        self._send_motor_command(ctrl_mode=fxe.FX_CURRENT, value=desired_mA)
         self.data.commanded_current = desired_mA
         self.data.commanded_position = None
 
@@ -346,16 +441,14 @@ class Exo():
         if abs(desired_mV) > constants.MAX_ALLOWABLE_VOLTAGE_COMMAND:
             raise ValueError(
                 'abs(desired_mV) must be < constants.MAX_ALLOWABLE_VOLTAGE_COMMAND')
-        fxs.send_motor_command(
-            dev_id=self.dev_id, ctrl_mode=fxe.FX_VOLTAGE, value=desired_mV)
+        self._send_motor_command(ctrl_mode=fxe.FX_VOLTAGE, value=desired_mV)
         self.data.commanded_current = None
         self.data.commanded_position = None
         self.data.commanded_torque = None
 
     def command_motor_angle(self, desired_motor_angle: int):
         '''Commands motor angle (counts). Pay attention to the sign!'''
-        fxs.send_motor_command(
-            dev_id=self.dev_id, ctrl_mode=fxe.FX_POSITION, value=desired_motor_angle)
+        self._send_motor_command(ctrl_mode=fxe.FX_POSITION, value=desired_motor_angle)
         self.data.commanded_current = None
         self.data.commanded_position = desired_motor_angle
         self.data.commanded_torque = None
@@ -372,8 +465,7 @@ class Exo():
         if self.k_val != k_val or self.b_val != b_val:
             # Only send gains when necessary
             self.update_gains(k_val=int(k_val), b_val=int(b_val))
-        fxs.send_motor_command(
-            dev_id=self.dev_id, ctrl_mode=fxe.FX_IMPEDANCE, value=int(theta0))
+        self._send_motor_command(ctrl_mode=fxe.FX_IMPEDANCE, value=int(theta0))
         self.data.commanded_current = None
         self.data.commanded_position = None
         self.data.commanded_torque = None
@@ -421,20 +513,21 @@ class Exo():
             theta0=theta0_motor, k_val=K_dephy, b_val=0)
 
     def command_controller_off(self):
-        fxs.send_motor_command(
-            dev_id=self.dev_id, ctrl_mode=fxe.FX_NONE, value=0)
+        self._send_motor_command(ctrl_mode=fxe.FX_NONE, value=0)
 
-    def command_slack(self, desired_slack=10000):
+    def command_slack(self, desired_slack=10000, ankle_angle: float = None):
         if not self.has_calibrated:
             raise ValueError(
                 'Must perform standing calibration before performing this task')
-        '''Commands position based on desired slack (motor counts)'''
+        '''Commands position based on desired slack (motor counts), at ankle_angle (default: latest)'''
         if desired_slack < 0:
             raise ValueError('Desired slack must be positive')
+        if ankle_angle is None:
+            ankle_angle = self.data.ankle_angle
         # Desired motor angle requires estimating motor angle from ankle angle and adding/subtracting slack
         desired_motor_angle = int(
             -1 * self.motor_sign * desired_slack +
-            self.ankle_angle_to_motor_angle(self.data.ankle_angle))
+            self.ankle_angle_to_motor_angle(ankle_angle))
         self.command_motor_angle(
             desired_motor_angle=desired_motor_angle)
 
@@ -501,6 +594,7 @@ class Exo():
         self.has_calibrated = True
         self.motor_offset = (self.data.motor_angle -
                              self.ankle_angle_to_motor_angle(self.data.ankle_angle))
+        self.calibration_version += 1
         for ramp_down_value in np.arange(1, 0, -0.01):
             time.sleep(0.01)
             self.command_voltage(desired_mV=ramp_down_value *
@@ -0,0 +1,98 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import constants
+import exoboot
+
+FAKE_FXE = SimpleNamespace(FX_NONE=0, FX_CURRENT=1, FX_VOLTAGE=2, FX_POSITION=3, FX_IMPEDANCE=4)
+
+
+class FakeFlexSEA():
+    '''Records writes, in order, as (name, ctrl_mode or None, value or gains).'''
+
+    def __init__(self):
+        self.writes = []
+
+    def set_gains(self, dev_id, kp, ki, kd, k_val, b_val, ff):
+        self.writes.append(('gains', None, (kp, ki, kd, k_val, b_val, ff)))
+
+    def send_motor_command(self, dev_id, ctrl_mode, value):
+        self.writes.append(('command', ctrl_mode, value))
+
+
+class Test_Exo_write_suppression(unittest.TestCase):
+
+    def setUp(self):
+        self.fxs = FakeFlexSEA()
+        patchers = [mock.patch.object(exoboot, 'fxs', self.fxs),
+                    mock.patch.object(exoboot, 'fxe', FAKE_FXE),
+                    mock.patch('time.perf_counter', side_effect=lambda: self.time_now)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.time_now = 0
+        self.exo = exoboot.Exo(dev_id=None, max_allowable_current=20000,
+                               write_refresh_interval=0.1)
+        self.exo.side = constants.Side.LEFT
+        self.exo.motor_sign = -1
+        self.exo.Kp, self.exo.Ki, self.exo.Kd, self.exo.k_val, self.exo.b_val, self.exo.ff = \
+            (40, 400, 0, 0, 0, 128)
+
+    def test_repeats_suppressed_until_refresh(self):
+        for _ in range(3):
+            self.exo.update_gains()
+            self.exo.command_current(desired_mA=1000)
+            self.time_now += 0.03
+        self.assertEqual([write[0] for write in self.fxs.writes], ['gains', 'command'])
+        self.exo.command_current(desired_mA=1200)  # Changed value is always sent
+        self.time_now = 0.2  # Past the refresh interval
+        self.exo.update_gains()
+        self.exo.command_current(desired_mA=1200)
+        self.assertEqual(self.fxs.writes[2:], [('command', FAKE_FXE.FX_CURRENT, 1200),
+                                               ('gains', None, (40, 400, 0, 0, 0, 128)),
+                                               ('command', FAKE_FXE.FX_CURRENT, 1200)])
+        self.assertEqual(self.exo.get_write_stats(),
+                         'gains sent 2, suppressed 2; commands sent 3, suppressed 2')
+
+    def test_gains_resent_on_mode_change(self):
+        self.exo.update_gains()
+        self.exo.command_motor_angle(desired_motor_angle=500)
+        self.exo.update_gains()  # Controller reset with identical gains...
+        self.exo.command_current(desired_mA=1000)  # ...then a new control mode
+        self.assertEqual([write[:2] for write in self.fxs.writes],
+                         [('gains', None), ('command', FAKE_FXE.FX_POSITION),
+                          ('gains', None), ('command', FAKE_FXE.FX_CURRENT)])
+        # Same mode: the repeated gains stay suppressed
+        self.exo.update_gains()
+        self.exo.command_current(desired_mA=900)
+        self.assertEqual([write[:2] for write in self.fxs.writes[4:]],
+                         [('command', FAKE_FXE.FX_CURRENT)])
+
+    def test_everything_sent_without_interval(self):
+        self.exo.write_refresh_interval = None
+        for _ in range(3):
+            self.exo.update_gains()
+            self.exo.command_current(desired_mA=1000)
+        self.assertEqual(len(self.fxs.writes), 6)
+
+
+
+class Test_Exo_feature_history(unittest.TestCase):
+
+    def test_history_grown_in_place(self):
+        with mock.patch.object(exoboot, 'fxs', FakeFlexSEA()), \
+                mock.patch.object(exoboot, 'fxe', FAKE_FXE):
+            exo = exoboot.Exo(dev_id=None, max_allowable_current=20000)
+        first = exo.enable_feature_history(size=2)
+        exo.feature_history.update(exo.data)
+        second = exo.enable_feature_history(size=10)
+        self.assertIs(first, second)
+        self.assertEqual(first.size, 10)
+        self.assertEqual(first.num_samples, 1)
+        self.assertIs(exo.enable_feature_history(size=4), first)
+        self.assertEqual(first.size, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
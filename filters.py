@@ -1,4 +1,3 @@
-from scipy import signal
 import numpy as np
 import collections
 
@@ -37,6 +36,8 @@ class Butterworth():
             self._Wn = self.Wn/(self.fs/2)
         else:
             self._Wn = Wn
+        from scipy import signal  # Deferred until a filter is made, as it is slow to import
+        self._sosfilt = signal.sosfilt
         self.sos = signal.butter(N=self.N, Wn=self._Wn,
                                  btype=self.btype, output='sos')
         self.zi = signal.sosfilt_zi(self.sos)
@@ -46,7 +47,7 @@ class Butterworth():
         if self.first_value:
             self.zi = self.zi*new_val
             self.first_value = False
-        filtered_val, self.zi = signal.sosfilt(
+        filtered_val, self.zi = self._sosfilt(
             sos=self.sos, x=[new_val], zi=self.zi)
         return filtered_val[0]
 
@@ -54,6 +55,51 @@ class Butterworth():
         self.__init__(N=self.N, Wn=self._Wn)
 
 
+class ButterworthBank(Filter):
+    '''Real-time Butterworth filter applied to an N-channel vector with shared coefficients.
+
+    Equivalent to num_channels separate Butterworth filters, but all channels are
+    stepped with a single sosfilt call on a single state array of shape
+    (n_sections, num_channels, 2).'''
+
+    def __init__(self, num_channels: int, N: int, Wn: float, btype='low', fs=None):
+        '''
+        num_channels: number of channels filtered per call to filter()
+        N, Wn, btype, fs: see Butterworth
+        '''
+        self.num_channels = num_channels
+        self.N = N
+        self.fs = fs
+        self.Wn = Wn
+        self.btype = btype
+        if self.fs is not None:
+            self._Wn = self.Wn/(self.fs/2)
+        else:
+            self._Wn = Wn
+        from scipy import signal  # Deferred until a filter is made, as it is slow to import
+        self._sosfilt = signal.sosfilt
+        self.sos = signal.butter(N=self.N, Wn=self._Wn,
+                                 btype=self.btype, output='sos')
+        self._zi_unit = signal.sosfilt_zi(self.sos)[:, np.newaxis, :]
+        self.zi = np.zeros((self.sos.shape[0], num_channels, 2))
+        self._x = np.zeros((num_channels, 1))  # Reused input column
+        self.first_value = True
+
+    def filter(self, new_vals) -> np.ndarray:
+        '''Takes the newest value of each channel, returns filtered values (length num_channels).'''
+        self._x[:, 0] = new_vals
+        if self.first_value:
+            self.zi = self._zi_unit*self._x.T[:, :, np.newaxis]
+            self.first_value = False
+        filtered_vals, self.zi = self._sosfilt(
+            sos=self.sos, x=self._x, axis=-1, zi=self.zi)
+        return filtered_vals[:, 0]
+
+    def restart(self):
+        self.zi[:] = 0
+        self.first_value = True
+
+
 class MovingAverage(Filter):
     '''Implements a real-time moving average filter.'''
 
@@ -64,3 +110,50 @@ class MovingAverage(Filter):
         # TODO: Optimize for efficiency if window size is large
         self.deque.append(new_val)
         return np.mean(self.deque)
+
+
+class PolynomialExtrapolator():
+    '''Predicts a signal a short time ahead from a polynomial fit over its newest samples.
+
+    Samples go in a ring buffer written twice (like util.FeatureHistory), so the window is
+    always one contiguous slice. The least-squares fit is done in sample-index units with a
+    pseudo-inverse computed once, and the horizon is converted to samples using the window's
+    mean sample period, so each prediction is a small matrix-vector product.'''
+
+    def __init__(self, window_size: int = 8, order: int = 2):
+        if order >= window_size:
+            raise ValueError('order must be less than window_size')
+        self.window_size = window_size
+        self.order = order
+        sample_idxs = np.arange(window_size) - (window_size - 1)  # Newest sample at 0
+        self._pinv = np.linalg.pinv(np.vander(sample_idxs, order + 1))
+        self._times = np.zeros(2*window_size)
+        self._values = np.zeros(2*window_size)
+        self._idx = 0  # Next slot to write
+        self.num_samples = 0
+        self.last_time = None
+
+    def update(self, time: float, value: float):
+        '''Adds a sample. Repeated timestamps (no new data) are ignored.'''
+        if time == self.last_time:
+            return
+        self.last_time = time
+        self._times[self._idx] = self._times[self._idx + self.window_size] = time
+        self._values[self._idx] = self._values[self._idx + self.window_size] = value
+        self._idx = (self._idx + 1) % self.window_size
+        self.num_samples += 1
+
+    def extrapolate(self, horizon: float):
+        '''Returns the fit evaluated horizon (s) after the newest sample, or None if not full.'''
+        if self.num_samples < self.window_size:
+            return None
+        end = self._idx + self.window_size
+        times = self._times[end - self.window_size:end]
+        sample_period = (times[-1] - times[0]) / (self.window_size - 1)
+        coefficients = self._pinv @ self._values[end - self.window_size:end]
+        return float(np.polyval(coefficients, horizon / sample_period))
+
+    def clear(self):
+        self._idx = 0
+        self.num_samples = 0
+        self.last_time = None
@@ -0,0 +1,32 @@
+'''Times one 6-channel ButterworthBank call against six scalar Butterworth calls.
+
+Run: python filters_benchmark.py'''
+import timeit
+
+import numpy as np
+
+import filters
+
+NUM_CHANNELS = 6  # 3 accel axes x 2 exos, as in BilateralSlipDetectorIMU
+NUM_TICKS = 5000
+
+if __name__ == '__main__':
+    x = np.random.default_rng(0).normal(size=(NUM_TICKS, NUM_CHANNELS)).tolist()
+
+    scalar_filters = [filters.Butterworth(N=2, Wn=0.01, btype='high')
+                      for _ in range(NUM_CHANNELS)]
+    bank = filters.ButterworthBank(
+        num_channels=NUM_CHANNELS, N=2, Wn=0.01, btype='high')
+
+    def run_scalar():
+        for new_vals in x:
+            for filt, val in zip(scalar_filters, new_vals):
+                filt.filter(val)
+
+    def run_bank():
+        for new_vals in x:
+            bank.filter(new_vals)
+
+    for name, fn in [('6 x Butterworth', run_scalar), ('ButterworthBank(6)', run_bank)]:
+        seconds = min(timeit.repeat(fn, number=1, repeat=3))
+        print('%-20s %8.2f us/tick' % (name, 1e6*seconds/NUM_TICKS))
@@ -23,6 +23,18 @@ class Test_custom_filters(unittest.TestCase):
 
         self.assertListEqual(y.tolist(), y_real_time_filter)
 
+    def test_ButterworthBank(self):
+        # Ensure the bank matches one scalar Butterworth per channel
+        x = np.random.default_rng(0).normal(size=(300, 6)) + np.arange(6)
+        scalar_filters = [filters.Butterworth(N=2, Wn=0.01, btype='high')
+                          for _ in range(6)]
+        bank = filters.ButterworthBank(num_channels=6, N=2, Wn=0.01, btype='high')
+        for new_vals in x:
+            y_scalar = [filt.filter(val)
+                        for filt, val in zip(scalar_filters, new_vals)]
+            y_bank = bank.filter(new_vals)
+            np.testing.assert_allclose(y_bank, y_scalar, rtol=1e-10, atol=1e-12)
+
     def test_MovingAverageFilter(self):
         test_filter = filters.MovingAverage(window_size=3)
         test_signal = [0, 1, 5, 3, 4, -10, 3, 6, 0]
@@ -33,6 +45,18 @@ class Test_custom_filters(unittest.TestCase):
         for true_val, test_val in zip(correct_answer, filtered_answer):
             self.assertAlmostEqual(true_val, test_val)
 
+    def test_PolynomialExtrapolator(self):
+        extrapolator = filters.PolynomialExtrapolator(window_size=6, order=2)
+        quadratic = np.poly1d([3, -2, 1])
+        times = 0.005 * np.arange(10) + 0.0001 * np.sin(np.arange(10))  # Slight jitter
+        self.assertIsNone(extrapolator.extrapolate(0.01))
+        for t in times:
+            extrapolator.update(t, quadratic(t))
+            extrapolator.update(t, quadratic(t))  # Repeated samples are ignored
+        self.assertAlmostEqual(extrapolator.extrapolate(0.02), quadratic(times[-1] + 0.02), places=3)
+        extrapolator.clear()
+        self.assertIsNone(extrapolator.extrapolate(0.01))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,14 +1,14 @@
 import numpy as np
 import filters
 import exoboot
-from scipy import signal
 from collections import deque
 import time
 import constants
-from typing import Type
+from typing import Type, TYPE_CHECKING
 import util
 import config_util
-import ml_util
+if TYPE_CHECKING:
+    import ml_util  # Only for type hints, so walking tasks don't import the Jetson stack
 from exoboot import Exo
 
 
@@ -45,10 +45,37 @@ class MLGaitStateEstimator():
     def __init__(self,
                  side: Type[constants.Side],
                  data_container: Type[exoboot.Exo.DataContainer],
-                 jetson_interface: Type[ml_util.JetsonInterface],
-                 do_print_heel_strikes=True):
-        '''Looks at the exo data, applies logic to detect HS, gait phase, and TO, and adds to exo.data'''
+                 jetson_interface: Type['ml_util.JetsonInterface'],
+                 do_print_heel_strikes=True,
+                 max_prediction_age: float = None,
+                 do_extrapolate_phase: bool = False,
+                 local_model: Type['ml_util.LocalGaitPhaseModel'] = None,
+                 feature_history: Type[util.FeatureHistory] = None):
+        '''Looks at the exo data, applies logic to detect HS, gait phase, and TO, and adds to exo.data
+
+        max_prediction_age: predictions older than this (s, since their features were sampled)
+            are rejected, and gait_phase is set to None. If None, predictions never expire.
+        do_extrapolate_phase: if True, gait phase is advanced by the prediction's age times the
+            phase rate estimated from recent predictions.
+        local_model: optional on-device model, used automatically while the Jetson has no
+            fresh prediction for this side.
+        feature_history: the exo's util.FeatureHistory (see Exo.enable_feature_history), for
+            the local model and Jetson window requests. If None and one is needed, one is
+            kept here, updated from data_container in detect().'''
         self.side = side
+        self.local_model = local_model
+        window_size = max(jetson_interface.window_size,
+                          local_model.window_size if local_model is not None else 0)
+        self.do_update_feature_history = feature_history is None and window_size > 0
+        if self.do_update_feature_history:
+            feature_history = util.FeatureHistory(size=window_size)
+        self.feature_history = feature_history
+        self.is_using_local_model = False
+        self.max_prediction_age = max_prediction_age
+        self.do_extrapolate_phase = do_extrapolate_phase
+        self.phase_rate_filter = filters.MovingAverage(window_size=10)
+        self.phase_rate = None  # gait phase / s
+        self.last_prediction = None
         self.data = data_container
         self.do_print_heel_strikes = do_print_heel_strikes
         self.last_is_stance = False
@@ -71,21 +98,32 @@ class MLGaitStateEstimator():
         gait_phase_estimator = StrideAverageGaitPhaseEstimator(
             num_strides_required=default_config.NUM_STRIDES_REQUIRED)
         toe_off_detector = GaitPhaseBasedToeOffDetector(
-            right_fraction_of_gait=default_config.RIGHT_TOE_OFF_FRACTION,left_fraction_of_gait=default_config.LEFT_TOE_OFF_FRACTION)
+            right_fraction_of_gait=default_config.RIGHT_TOE_OFF_FRACTION,left_fraction_of_gait=default_config.LEFT_TOE_OFF_FRACTION,
+            side=side)
         self.parallel_tbe = GaitStateEstimator(
             data_container=self.fake_data, heel_strike_detector=heel_strike_detector,
             gait_phase_estimator=gait_phase_estimator, toe_off_detector=toe_off_detector)
 
     def detect(self):
+        if self.do_update_feature_history:
+            self.feature_history.update(self.data)
         self.jetson_object.package_and_send_message(
-            side=self.side, data_container=self.data)
+            side=self.side, data_container=self.data, feature_history=self.feature_history)
         self.jetson_object.grab_message_and_parse()
-        my_gait_phase_info = self.jetson_object.get_most_recent_gait_phase(
-            side=self.side)
-        if my_gait_phase_info is not None:
-            gait_phase, is_stance = my_gait_phase_info
+        gait_phase_info = self._get_jetson_gait_phase()
+        if gait_phase_info is None and self.local_model is not None:
+            gait_phase_info = self.local_model.predict(self.feature_history)
+            self._set_is_using_local_model(gait_phase_info is not None)
         else:
+            self._set_is_using_local_model(False)
+        if gait_phase_info is None:
+            if self.last_prediction is not None:
+                # Stale (e.g., Jetson link down): no gait phase, so the state machine falls back to swing
+                self.data.gait_phase = None
+                self.data.did_heel_strike = False
+                self.data.did_toe_off = False
             return
+        gait_phase, is_stance = gait_phase_info
         if gait_phase < 0:
             gait_phase = 0
         if gait_phase > 1:
@@ -117,8 +155,52 @@ class MLGaitStateEstimator():
         if self.do_print_heel_strikes and self.data.did_heel_strike:
             print('heel strike detected on side: ', self.side)
 
+    def _get_jetson_gait_phase(self):
+        '''Returns (gait_phase, is_stance) from the newest fresh Jetson prediction, or None.'''
+        prediction = self.jetson_object.get_most_recent_prediction(
+            side=self.side)
+        if prediction is None:
+            return None
+        self._update_phase_rate(prediction)
+        age = self.get_age(prediction)
+        if self.max_prediction_age is not None and age > self.max_prediction_age:
+            return None
+        gait_phase = prediction.gait_phase
+        if self.do_extrapolate_phase and self.phase_rate is not None:
+            gait_phase = gait_phase + self.phase_rate*age
+        return gait_phase, prediction.is_stance
+
+    def _set_is_using_local_model(self, is_using_local_model: bool):
+        if is_using_local_model != self.is_using_local_model:
+            if is_using_local_model:
+                print('No fresh Jetson prediction, using local model on side: ', self.side)
+            else:
+                print('Stopped using local model on side: ', self.side)
+            self.is_using_local_model = is_using_local_model
+
+    def _update_phase_rate(self, prediction: Type['ml_util.Prediction']):
+        '''Estimates d(gait phase)/dt from consecutive new predictions, skipping wraps at heel strike.'''
+        last_prediction = self.last_prediction
+        if last_prediction is prediction:
+            return
+        self.last_prediction = prediction
+        if last_prediction is None or prediction.send_time is None or last_prediction.send_time is None:
+            return
+        d_phase = prediction.gait_phase - last_prediction.gait_phase
+        d_time = prediction.send_time - last_prediction.send_time
+        if d_phase > 0 and d_time > 0:
+            self.phase_rate = self.phase_rate_filter.filter(d_phase / d_time)
+
+    def get_age(self, prediction: Type['ml_util.Prediction']) -> float:
+        '''Age from when the features were sampled, or from receipt if the protocol has no send time.'''
+        if prediction.send_time is not None:
+            return time.perf_counter() - prediction.send_time
+        else:
+            return time.perf_counter() - prediction.recv_time
+
     def update_params_from_config(self, config: Type[config_util.ConfigurableConstants]):
-        pass
+        self.max_prediction_age = config.ML_MAX_PREDICTION_AGE
+        self.do_extrapolate_phase = config.ML_DO_EXTRAPOLATE_PHASE
 
 
 class GyroHeelStrikeDetector():
@@ -144,16 +226,20 @@ class GyroHeelStrikeDetector():
 
 
 class GaitPhaseBasedToeOffDetector():
-    def __init__(self, exo: Exo , right_fraction_of_gait, left_fraction_of_gait):
-        '''Uses gait phase estimated from heel strikes to estimate toe-off.'''
-        self.exo=exo
+    def __init__(self, exo: Exo = None, right_fraction_of_gait=0.6, left_fraction_of_gait=0.6,
+                 side: Type[constants.Side] = None):
+        '''Uses gait phase estimated from heel strikes to estimate toe-off.
+
+        The side is taken from exo, or from side if no exo is available.'''
+        self.exo = exo
+        self.side = exo.side if exo is not None else side
         self.right_fraction_of_gait = right_fraction_of_gait
         self.left_fraction_of_gait = left_fraction_of_gait
         self.has_toe_off_occurred = False
 
     def detect(self, data: Type[exoboot.Exo.DataContainer]):
         gait_phase = data.gait_phase
-        if self.exo.side == constants.Side.LEFT:
+        if self.side == constants.Side.LEFT:
             if gait_phase is None:
                 did_toe_off = False
             else:
@@ -241,14 +327,18 @@ class BilateralSlipDetectorParent():
         print('Slip detection active: ', False)
         self.update_delay(delay_ms=delay_ms)
         self.refractory_timer = util.DelayTimer(time_out, true_until=True)
+        # Children may set this (time.perf_counter()) in detect_slip() if the true onset is known
+        self.slip_onset_time = None
 
     def detect(self):
         for exo in self.exo_list:
             exo.data.gen_var1 = False
+        self.slip_onset_time = None
         slip_detected = self.detect_slip()
         if self.slip_detect_active:
             if slip_detected:
-                self.delay_timer.start()
+                # Delay is measured from the true onset if known, otherwise from now
+                self.delay_timer.start(start_time=self.slip_onset_time)
                 for exo in self.exo_list:
                     exo.data.gen_var1 = True
                 print('sync recieved')
@@ -286,12 +376,18 @@ class BilateralSlipDetectorFromSync(BilateralSlipDetectorParent):
                  exo_2: Type[exoboot.Exo],
                  delay_ms,
                  time_out=5,
-                 use_rising_edge=True):
+                 use_rising_edge=True,
+                 sync_edge_recorder=None):
+        '''If sync_edge_recorder (gpio_util.EdgeRecorder) is passed, slips are detected from the
+        timestamped edges it recorded, rather than from the sampled exo.data.sync level.'''
         super().__init__(exo_1=exo_1, exo_2=exo_2, delay_ms=delay_ms, time_out=time_out)
         self.use_rising_edge = use_rising_edge
+        self.sync_edge_recorder = sync_edge_recorder
         self.last_sync = True
 
     def detect_slip(self):
+        if self.sync_edge_recorder is not None:
+            return self._detect_slip_from_edges()
         if self.refractory_timer.check():  # if recent slip, hold last_sync
             slip_detected = False
             if self.use_rising_edge:
@@ -313,6 +409,22 @@ class BilateralSlipDetectorFromSync(BilateralSlipDetectorParent):
             self.last_sync = exo.data.sync
         return slip_detected
 
+    def _detect_slip_from_edges(self):
+        '''Uses the first qualifying edge since the last tick, with refractory period from edge time.'''
+        slip_detected = False
+        for edge_time, level in self.sync_edge_recorder.drain():
+            if level != self.use_rising_edge:
+                continue
+            refractory_start = self.refractory_timer.start_time
+            if (refractory_start is not None and
+                    edge_time < refractory_start + self.refractory_timer.delay_time):
+                continue
+            if not slip_detected:
+                slip_detected = True
+                self.slip_onset_time = edge_time
+                self.refractory_timer.start(start_time=edge_time)
+        return slip_detected
+
 
 class BilateralSlipDetectorIMU(BilateralSlipDetectorParent):
     def __init__(self,
@@ -329,23 +441,25 @@ class BilateralSlipDetectorIMU(BilateralSlipDetectorParent):
         self.max_acc_y = max_acc_y
         self.max_acc_z = max_acc_z
         self.do_filter_accels = do_filter_accels
-        self.filter_list = [[
-            filters.Butterworth(N=2, Wn=0.01, btype='high'),
-            filters.Butterworth(N=2, Wn=0.01, btype='high'),
-            filters.Butterworth(N=2, Wn=0.01, btype='high')],
-            [filters.Butterworth(N=2, Wn=0.01, btype='high'),
-             filters.Butterworth(N=2, Wn=0.01, btype='high'),
-             filters.Butterworth(N=2, Wn=0.01, btype='high')]]
+        # One 6-channel bank: [accel_x, accel_y, accel_z] for exo_1, then for exo_2
+        self.accel_filter = filters.ButterworthBank(
+            num_channels=6, N=2, Wn=0.01, btype='high')
+        self.accel_vals = [0.0] * 6
         self.shuffling_timer = util.DelayTimer(
             delay_time=required_seconds_of_stillness,
             true_until=True)
 
     def detect_slip(self):
-        for exo, filt in zip(self.exo_list, self.filter_list):
+        for i, exo in enumerate(self.exo_list):
+            self.accel_vals[3*i] = exo.data.accel_x
+            self.accel_vals[3*i+1] = exo.data.accel_y-1
+            self.accel_vals[3*i+2] = exo.data.accel_z
+        filtered_accels = self.accel_filter.filter(self.accel_vals)
+        for i, exo in enumerate(self.exo_list):
             data = exo.data
-            accel_x = filt[0].filter(data.accel_x)
-            accel_y = filt[1].filter(data.accel_y-1)
-            accel_z = filt[2].filter(data.accel_z)
+            accel_x = filtered_accels[3*i]
+            accel_y = filtered_accels[3*i+1]
+            accel_z = filtered_accels[3*i+2]
             data.gen_var1 = accel_x
             data.gen_var2 = accel_y
             data.gen_var3 = accel_z
@@ -1,9 +1,14 @@
 import numpy as np
 import gait_state_estimators
 import unittest
+from types import SimpleNamespace
+from unittest import mock
 import matplotlib.pyplot as plt
 from exoboot import Exo
+import constants
 import filters
+import gpio_util
+import ml_util
 
 
 class TestGaitEventDetectors(unittest.TestCase):
@@ -60,5 +65,116 @@ class TestGaitEventDetectors(unittest.TestCase):
         plt.show()
 
 
+
+class TestBilateralSlipDetectorFromSync(unittest.TestCase):
+
+    def setUp(self):
+        self.time_now = 0
+        patcher = mock.patch('time.perf_counter', side_effect=lambda: self.time_now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sync_device = gpio_util.SimulatedInputDevice(pin=16)
+        self.exo_list = [SimpleNamespace(data=SimpleNamespace(gen_var1=False, did_slip=False))
+                         for _ in range(2)]
+        self.slip_detector = gait_state_estimators.BilateralSlipDetectorFromSync(
+            exo_1=self.exo_list[0], exo_2=self.exo_list[1], delay_ms=50, time_out=1,
+            sync_edge_recorder=gpio_util.EdgeRecorder(device=self.sync_device))
+        self.slip_detector.slip_detect_active = True
+
+    def drive(self, edge_time, value):
+        self.time_now = edge_time
+        self.sync_device.drive(value)
+
+    def tick(self, loop_time):
+        self.time_now = loop_time
+        self.slip_detector.detect()
+        return self.exo_list[0].data.gen_var1, self.exo_list[0].data.did_slip
+
+    def test_timers_start_at_edge_time(self):
+        self.drive(edge_time=1.0, value=True)
+        # The tick after the edge comes 40 ms late: both timers still start at the edge
+        self.assertEqual(self.tick(loop_time=1.04), (True, False))
+        self.assertEqual(self.slip_detector.slip_onset_time, 1.0)
+        self.assertEqual(self.slip_detector.delay_timer.start_time, 1.0)
+        self.assertEqual(self.slip_detector.refractory_timer.start_time, 1.0)
+        self.assertEqual(self.tick(loop_time=1.049), (False, False))
+        self.assertEqual(self.tick(loop_time=1.051), (False, True))  # 50 ms after the edge
+        self.assertEqual(self.tick(loop_time=1.06), (False, False))
+        # Rising edges are ignored for time_out after the first edge...
+        self.drive(edge_time=1.5, value=False)
+        self.drive(edge_time=1.99, value=True)
+        self.assertEqual(self.tick(loop_time=2.01), (False, False))
+        # ...but not for time_out after the late tick that saw it (1.04 + 1 s)
+        self.drive(edge_time=2.02, value=False)
+        self.drive(edge_time=2.03, value=True)
+        self.assertEqual(self.tick(loop_time=2.05), (True, False))
+        self.assertEqual(self.slip_detector.refractory_timer.start_time, 2.03)
+        self.assertEqual(self.tick(loop_time=2.081), (False, True))
+
+
+
+class FakeJetsonInterface():
+    '''Returns whatever prediction the test sets, like JetsonInterface with no socket.'''
+
+    def __init__(self):
+        self.window_size = 0
+        self.prediction = None
+
+    def package_and_send_message(self, side, data_container, feature_history=None):
+        pass
+
+    def grab_message_and_parse(self):
+        pass
+
+    def get_most_recent_prediction(self, side):
+        return self.prediction
+
+
+class TestMLGaitStateEstimator(unittest.TestCase):
+
+    def setUp(self):
+        self.time_now = 0
+        patcher = mock.patch('time.perf_counter', side_effect=lambda: self.time_now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.jetson_interface = FakeJetsonInterface()
+        self.data = Exo.DataContainer()
+        self.estimator = gait_state_estimators.MLGaitStateEstimator(
+            side=constants.Side.LEFT, data_container=self.data,
+            jetson_interface=self.jetson_interface, do_print_heel_strikes=False,
+            max_prediction_age=0.05, do_extrapolate_phase=True)
+
+    def tick(self, loop_time, prediction):
+        self.time_now = loop_time
+        self.jetson_interface.prediction = prediction
+        self.estimator.detect()
+        return self.data.gait_phase
+
+    def test_rejects_stale(self):
+        self.assertAlmostEqual(self.tick(1.0, ml_util.Prediction(0.1, True, 1, 0.99, 1.0)), 0.1)
+        # Phase rate from the first two predictions: 0.02 phase per 0.02 s; 0.01 s to extrapolate
+        newest = ml_util.Prediction(0.12, True, 2, 1.01, 1.02)
+        self.assertAlmostEqual(self.tick(1.02, newest), 0.13)
+        self.assertAlmostEqual(self.estimator.phase_rate, 1.0)
+        self.assertAlmostEqual(self.tick(1.03, newest), 0.14)
+        # Older than max_prediction_age (from send_time): rejected
+        self.assertAlmostEqual(self.tick(1.055, newest), 0.165)
+        self.assertIsNone(self.tick(1.07, newest))
+        self.assertFalse(self.data.did_heel_strike)
+        # A fresh prediction is used again, with the phase rate updated from it
+        phase_rate = (1.0 + 0.1 / 0.1) / 2
+        self.assertAlmostEqual(self.tick(1.12, ml_util.Prediction(0.22, True, 3, 1.11, 1.115)),
+                               0.22 + phase_rate * 0.01)
+
+    def test_text_age_from_recv_time(self):
+        # TEXT replies not matched to a request have no send time: age is counted from receipt
+        first = ml_util.Prediction(0.3, False, None, None, 1.0)
+        self.assertAlmostEqual(self.tick(1.04, first), 0.3)  # No phase rate to extrapolate with
+        self.assertIsNone(self.tick(1.06, first))
+        second = ml_util.Prediction(0.35, False, None, None, 1.05)
+        self.assertAlmostEqual(self.tick(1.07, second), 0.35)
+        self.assertIsNone(self.estimator.phase_rate)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,112 @@
+'''Edge-driven GPIO inputs (FSRs, sync line) and an off-Pi stand-in for testing.
+
+Polling gpiozero's InputDevice.value every tick costs a GPIO read per input per
+loop, and only resolves edges to the loop period. In edge mode, gpiozero calls
+back on each transition (from its own thread), and the timestamp is written to a
+lock-free EdgeBuffer that the main loop drains.'''
+import time
+
+
+class EdgeBuffer():
+    def __init__(self, capacity: int = 64):
+        '''Single-producer, single-consumer ring of (timestamp, level) edges.
+
+        The GPIO callback thread is the only writer and the main loop is the only reader,
+        so no lock is needed: the writer fills a slot before publishing it by incrementing
+        write_count, and the reader only reads slots below write_count. If the reader
+        falls more than capacity edges behind, the oldest edges are dropped and counted.'''
+        self.capacity = capacity
+        self.times = [0.0] * capacity
+        self.levels = [False] * capacity
+        self.write_count = 0
+        self.read_count = 0
+        self.num_dropped = 0
+
+    def push(self, edge_time: float, level: bool):
+        '''Called from the GPIO callback thread only.'''
+        idx = self.write_count % self.capacity
+        self.times[idx] = edge_time
+        self.levels[idx] = level
+        self.write_count += 1  # Publishes the slot
+
+    def drain(self) -> list:
+        '''Called from the main loop only. Returns [(time, level), ...], oldest first.'''
+        write_count = self.write_count
+        if write_count - self.read_count > self.capacity:
+            self.num_dropped += write_count - self.read_count - self.capacity
+            self.read_count = write_count - self.capacity
+        edges = []
+        for count in range(self.read_count, write_count):
+            idx = count % self.capacity
+            edges.append((self.times[idx], self.levels[idx]))
+        self.read_count = write_count
+        return edges
+
+    def clear(self):
+        self.read_count = self.write_count
+
+
+class EdgeRecorder():
+    def __init__(self, device, buffer_capacity: int = 64):
+        '''Wraps a gpiozero DigitalInputDevice (or SimulatedInputDevice), recording edges.
+
+        Exposes value and close() so it can stand in for the polled device in Exo, but
+        value returns the level cached by the last callback rather than reading the pin.'''
+        self.device = device
+        self.edge_buffer = EdgeBuffer(capacity=buffer_capacity)
+        self._value = bool(device.value)
+        device.when_activated = self._on_activated
+        device.when_deactivated = self._on_deactivated
+
+    @property
+    def value(self) -> bool:
+        return self._value
+
+    def _on_activated(self):
+        self._value = True
+        self.edge_buffer.push(edge_time=time.perf_counter(), level=True)
+
+    def _on_deactivated(self):
+        self._value = False
+        self.edge_buffer.push(edge_time=time.perf_counter(), level=False)
+
+    def drain(self) -> list:
+        '''Returns edges since the last drain as [(perf_counter time, level), ...].'''
+        return self.edge_buffer.drain()
+
+    def close(self):
+        self.device.when_activated = None
+        self.device.when_deactivated = None
+        self.device.close()
+
+
+class SimulatedInputDevice():
+    def __init__(self, pin: int = None, pull_up: bool = False, initial_value: bool = False):
+        '''Off-Pi stand-in for a gpiozero DigitalInputDevice. Call drive() to change the level.'''
+        self.pin = pin
+        self.pull_up = pull_up
+        self.value = initial_value
+        self.when_activated = None
+        self.when_deactivated = None
+        self.closed = False
+
+    def drive(self, value: bool):
+        '''Sets the input level, firing callbacks (synchronously) on a change.'''
+        if bool(value) == bool(self.value):
+            return
+        self.value = bool(value)
+        callback = self.when_activated if self.value else self.when_deactivated
+        if callback is not None:
+            callback()
+
+    def close(self):
+        self.closed = True
+
+
+def create_input_device(pin: int, pull_up: bool, use_edge_callbacks: bool = False):
+    '''Returns a polled gpiozero InputDevice, or an EdgeRecorder if use_edge_callbacks.'''
+    import gpiozero  # pylint: disable=import-error
+    if use_edge_callbacks:
+        return EdgeRecorder(device=gpiozero.DigitalInputDevice(pin=pin, pull_up=pull_up))
+    else:
+        return gpiozero.InputDevice(pin=pin, pull_up=pull_up)
@@ -0,0 +1,38 @@
+import unittest
+import time
+
+import gpio_util
+
+
+class Test_gpio_util(unittest.TestCase):
+
+    def test_EdgeRecorder(self):
+        device = gpio_util.SimulatedInputDevice(pin=16)
+        recorder = gpio_util.EdgeRecorder(device=device)
+        self.assertFalse(recorder.value)
+        t0 = time.perf_counter()
+        device.drive(True)
+        device.drive(True)  # No change, no edge
+        device.drive(False)
+        device.drive(True)
+        self.assertTrue(recorder.value)
+        edges = recorder.drain()
+        self.assertEqual([level for _, level in edges], [True, False, True])
+        edge_times = [edge_time for edge_time, _ in edges]
+        self.assertEqual(edge_times, sorted(edge_times))
+        self.assertGreaterEqual(edge_times[0], t0)
+        self.assertEqual(recorder.drain(), [])
+        recorder.close()
+        self.assertTrue(device.closed)
+
+    def test_EdgeBuffer_overflow(self):
+        edge_buffer = gpio_util.EdgeBuffer(capacity=4)
+        for i in range(10):
+            edge_buffer.push(edge_time=i, level=bool(i % 2))
+        edges = edge_buffer.drain()
+        self.assertEqual([edge_time for edge_time, _ in edges], [6, 7, 8, 9])
+        self.assertEqual(edge_buffer.num_dropped, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,318 @@
+'''Online human-in-the-loop optimization of controller parameters (e.g., the 4 point spline).
+
+The main loop calls HILOptimizer.update(exo_list) once per tick, which only accumulates a
+per-stride cost for each exo and, at each heel strike, queues it tagged with the exo's side.
+A background thread averages each side's costs over a candidate, then averages the sides
+with equal weight, updates a CMA-ES model between candidates, and pushes the
+next candidate into the config under the shared lock, setting new_params_event. The main
+loop then applies it with update_ctrl_params_from_config(), like a ParameterPasser update,
+so it also lands in the config file. Every evaluated candidate is logged to a _HIL.csv file.'''
+import csv
+import math
+import queue
+import threading
+import time
+from typing import Type
+
+import numpy as np
+
+import config_util
+
+
+class CMAES():
+    def __init__(self, x0, sigma0: float, population_size: int = None, seed: int = None):
+        '''Covariance matrix adaptation evolution strategy, minimizing cost.
+
+        Follows Hansen's "The CMA Evolution Strategy: A Tutorial" (rank-one and rank-mu
+        updates, cumulative step size adaptation). Call ask() for a population of candidates,
+        then tell() their costs.'''
+        self.mean = np.array(x0, dtype=float)
+        self.n = n = len(self.mean)
+        self.sigma = sigma0
+        self.population_size = population_size if population_size is not None else \
+            4 + int(3 * math.log(n))
+        self.mu = self.population_size // 2
+        weights = math.log(self.mu + 0.5) - np.log(np.arange(1, self.mu + 1))
+        self.weights = weights / np.sum(weights)
+        self.mu_eff = 1 / np.sum(self.weights**2)
+        self.c_c = (4 + self.mu_eff / n) / (n + 4 + 2 * self.mu_eff / n)
+        self.c_s = (self.mu_eff + 2) / (n + self.mu_eff + 5)
+        self.c_1 = 2 / ((n + 1.3)**2 + self.mu_eff)
+        self.c_mu = min(1 - self.c_1,
+                        2 * (self.mu_eff - 2 + 1 / self.mu_eff) / ((n + 2)**2 + self.mu_eff))
+        self.d_s = 1 + 2 * max(0, math.sqrt((self.mu_eff - 1) / (n + 1)) - 1) + self.c_s
+        self.chi_n = math.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n**2))
+        self.C = np.eye(n)
+        self.B = np.eye(n)
+        self.D = np.ones(n)
+        self.p_c = np.zeros(n)
+        self.p_s = np.zeros(n)
+        self.generation = 0
+        self.random = np.random.default_rng(seed)
+
+    def ask(self) -> np.ndarray:
+        '''Returns a (population_size, n) array of candidates.'''
+        z = self.random.standard_normal((self.population_size, self.n))
+        return self.mean + self.sigma * (z * self.D) @ self.B.T
+
+    def tell(self, candidates, costs):
+        '''Updates the model from candidates (population_size, n) and their costs.'''
+        candidates = np.asarray(candidates, dtype=float)
+        best = np.argsort(costs)[:self.mu]
+        y = (candidates[best] - self.mean) / self.sigma
+        y_w = self.weights @ y
+        self.mean = self.mean + self.sigma * y_w
+
+        C_inv_sqrt = (self.B / self.D) @ self.B.T
+        self.p_s = (1 - self.c_s) * self.p_s + \
+            math.sqrt(self.c_s * (2 - self.c_s) * self.mu_eff) * (C_inv_sqrt @ y_w)
+        p_s_norm = np.linalg.norm(self.p_s)
+        h_s = p_s_norm / math.sqrt(1 - (1 - self.c_s)**(2 * (self.generation + 1))) < \
+            (1.4 + 2 / (self.n + 1)) * self.chi_n
+        self.p_c = (1 - self.c_c) * self.p_c + \
+            h_s * math.sqrt(self.c_c * (2 - self.c_c) * self.mu_eff) * y_w
+        self.C = (1 - self.c_1 - self.c_mu) * self.C + \
+            self.c_1 * (np.outer(self.p_c, self.p_c) +
+                        (1 - h_s) * self.c_c * (2 - self.c_c) * self.C) + \
+            self.c_mu * (y.T * self.weights) @ y
+        self.sigma *= math.exp((self.c_s / self.d_s) * (p_s_norm / self.chi_n - 1))
+
+        self.C = np.triu(self.C) + np.triu(self.C, 1).T  # Keep symmetric
+        eigenvalues, self.B = np.linalg.eigh(self.C)
+        self.D = np.sqrt(np.maximum(eigenvalues, 1e-20))
+        self.generation += 1
+
+
+class StrideCostMeter():
+    def __init__(self, cost_type: Type[config_util.HILCost]):
+        '''Accumulates one exo's cost over a stride, in O(1) per tick.
+
+        TORQUE_TRACKING is the RMS tracking error divided by the stride's peak commanded
+        torque, so lowering the peak torque does not lower the cost by itself.'''
+        self.cost_type = cost_type
+        self.sum = 0
+        self.num_samples = 0
+        self.peak_commanded_torque = 0
+        self.is_first_stride = True
+
+    def update(self, data, external_sample: float = None):
+        '''Adds a tick of exo data. Returns the finished stride's cost at heel strike, else None.'''
+        stride_cost = None
+        if data.did_heel_strike:
+            if not self.is_first_stride and self.num_samples > 0:
+                stride_cost = self.get_cost()
+            self.is_first_stride = False
+            self.sum = 0
+            self.num_samples = 0
+            self.peak_commanded_torque = 0
+        if self.cost_type == config_util.HILCost.TORQUE_TRACKING:
+            if data.commanded_torque is not None:
+                self.sum += (data.commanded_torque - data.ankle_torque_from_current)**2
+                self.num_samples += 1
+                self.peak_commanded_torque = max(self.peak_commanded_torque,
+                                                 abs(data.commanded_torque))
+        elif external_sample is not None:
+            self.sum += external_sample
+            self.num_samples += 1
+        return stride_cost
+
+    def get_cost(self) -> float:
+        '''Returns None for a TORQUE_TRACKING stride with no torque commanded.'''
+        if self.cost_type == config_util.HILCost.TORQUE_TRACKING:
+            if self.peak_commanded_torque == 0:
+                return None
+            return math.sqrt(self.sum / self.num_samples) / self.peak_commanded_torque
+        return self.sum / self.num_samples
+
+    def reset(self):
+        self.sum = 0
+        self.num_samples = 0
+        self.peak_commanded_torque = 0
+        self.is_first_stride = True
+
+
+def apply_parameters(config: Type[config_util.ConfigurableConstants], parameters: dict):
+    '''Writes {name: value} to config. Names without a LEFT_/RIGHT_ field set both sides.'''
+    for name, value in parameters.items():
+        if hasattr(config, name):
+            setattr(config, name, value)
+        else:
+            setattr(config, 'LEFT_' + name, value)
+            setattr(config, 'RIGHT_' + name, value)
+
+
+def get_parameters(config: Type[config_util.ConfigurableConstants], names) -> dict:
+    '''Reads current values of names from config (LEFT_ side for two-sided parameters).'''
+    return {name: getattr(config, name) if hasattr(config, name) else getattr(config, 'LEFT_' + name)
+            for name in names}
+
+
+class HILOptimizer(threading.Thread):
+    def __init__(self,
+                 lock: Type[threading.Lock],
+                 config: Type[config_util.ConfigurableConstants],
+                 new_params_event: Type[threading.Event],
+                 file_ID: str = None,
+                 name='hil-optimizer-thread'):
+        '''Optimizes config.HIL_PARAMETER_BOUNDS parameters to minimize config.HIL_COST.
+
+        Starts from the parameters already in config. CMA-ES runs in a normalized space where
+        each parameter's bounds map to [0, 1]; candidates are clipped to the bounds.
+        If file_ID is given, candidates are logged to exo_data/<date>_<file_ID>_HIL.csv.'''
+        super().__init__(name=name)
+        self.daemon = True  # Thread property
+        self.lock = lock
+        self.config = config
+        self.new_params_event = new_params_event
+        self.parameter_names = list(config.HIL_PARAMETER_BOUNDS.keys())
+        bounds = np.array([config.HIL_PARAMETER_BOUNDS[name] for name in self.parameter_names],
+                          dtype=float)
+        self.lower_bounds = bounds[:, 0]
+        self.ranges = bounds[:, 1] - bounds[:, 0]
+        self.strides_per_candidate = config.HIL_STRIDES_PER_CANDIDATE
+        self.strides_to_skip = config.HIL_STRIDES_TO_SKIP
+        self.num_generations = config.HIL_NUM_GENERATIONS
+        x0 = self._normalize(list(get_parameters(config, self.parameter_names).values()))
+        self.cma = CMAES(x0=np.clip(x0, 0, 1), sigma0=config.HIL_INITIAL_SIGMA,
+                         population_size=config.HIL_POPULATION_SIZE, seed=config.HIL_SEED)
+        self.cost_type = config.HIL_COST
+        self.cost_meters = {}  # exo side: StrideCostMeter, for each side update() has seen
+        self.external_samples = queue.SimpleQueue()  # From add_external_cost(), on any thread
+        self.stride_queue = queue.Queue()
+        self.stop_event = threading.Event()
+        self.is_done = False
+        self.loop_time = 0
+        self.best_cost = None
+        self.best_parameters = None
+
+        if file_ID is not None:
+            filename = 'exo_data/' + time.strftime("%Y%m%d_%H%M_") + file_ID + '_HIL.csv'
+            self.my_file = open(filename, 'w', newline='')
+            self.writer = csv.writer(self.my_file)
+            self.writer.writerow(['generation', 'candidate', *self.parameter_names, 'cost',
+                                  'num_strides', 'sigma', 'loop_time'])
+        else:
+            self.my_file = None
+        self.start()  # Starts the run() function
+
+    def update(self, exo_list):
+        '''Called from the main loop each tick, after gait event detection.'''
+        if self.is_done:
+            return
+        try:
+            external_sample = self.external_samples.get_nowait()  # One per tick
+        except queue.Empty:
+            external_sample = None
+        for exo in exo_list:
+            self.loop_time = exo.data.loop_time
+            if exo.side not in self.cost_meters:
+                self.cost_meters[exo.side] = StrideCostMeter(cost_type=self.cost_type)
+            stride_cost = self.cost_meters[exo.side].update(
+                data=exo.data, external_sample=external_sample)
+            if stride_cost is not None:
+                self.stride_queue.put_nowait((exo.side, stride_cost))
+
+    def add_external_cost(self, value: float):
+        '''Supplies a cost sample (e.g., from a metabolic cart) for HILCost.EXTERNAL. Safe to
+        call from any thread, e.g. the NetworkParameterPasser's.'''
+        self.external_samples.put(value)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def close(self):
+        self.stop()
+        self.join(timeout=1)
+        if self.my_file is not None:
+            self.my_file.close()
+        if self.best_parameters is not None:
+            print('HIL best candidate: ', self.best_parameters, 'cost: ', self.best_cost)
+
+    # This run function overrides the run() function in threading.Thread
+    def run(self):
+        while not self.stop_event.is_set() and not self.is_done:
+            candidates = np.clip(self.cma.ask(), 0, 1)
+            costs = []
+            for candidate_idx, candidate in enumerate(candidates):
+                stride_costs = self._evaluate(candidate)
+                if stride_costs is None:
+                    return  # Stopped mid-candidate
+                # Each side weighs the same, however many strides it took
+                cost = float(np.mean([np.mean(side_costs) for side_costs in stride_costs.values()]))
+                costs.append(cost)
+                self._log(candidate_idx=candidate_idx, candidate=candidate, cost=cost,
+                          num_strides=sum(len(side_costs) for side_costs in stride_costs.values()))
+            self.cma.tell(candidates, costs)
+            print('HIL generation ', self.cma.generation, ' done. Best cost: ', min(costs),
+                  ' sigma: ', self.cma.sigma)
+            if self.num_generations is not None and self.cma.generation >= self.num_generations:
+                self._push_parameters(np.clip(self.cma.mean, 0, 1))
+                self.is_done = True
+                print('HIL optimization done. Applied mean: ', self._denormalize_dict(
+                    np.clip(self.cma.mean, 0, 1)))
+
+    def _evaluate(self, candidate):
+        '''Applies candidate and returns its stride costs as {side: [cost, ...]}, or None if
+        stopped. Waits for strides_per_candidate strides from every side, after skipping
+        strides_to_skip per side.'''
+        self._push_parameters(candidate)
+        self._clear_queue()
+        num_skipped = {}
+        stride_costs = {}
+        while not self._has_enough_strides(stride_costs):
+            side_and_cost = self._get_stride_cost()
+            if side_and_cost is None:
+                return None
+            side, stride_cost = side_and_cost
+            if num_skipped.get(side, 0) < self.strides_to_skip:
+                num_skipped[side] = num_skipped.get(side, 0) + 1
+                continue
+            stride_costs.setdefault(side, []).append(stride_cost)
+        return stride_costs
+
+    def _has_enough_strides(self, stride_costs: dict) -> bool:
+        sides = list(self.cost_meters)  # Written by the main loop
+        return bool(sides) and all(len(stride_costs.get(side, [])) >= self.strides_per_candidate
+                                   for side in sides)
+
+    def _get_stride_cost(self):
+        while not self.stop_event.is_set():
+            try:
+                return self.stride_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def _clear_queue(self):
+        while True:
+            try:
+                self.stride_queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def _push_parameters(self, candidate):
+        parameters = self._denormalize_dict(candidate)
+        self.lock.acquire()
+        apply_parameters(config=self.config, parameters=parameters)
+        self.new_params_event.set()
+        self.lock.release()
+
+    def _log(self, candidate_idx, candidate, cost, num_strides):
+        parameters = self._denormalize(candidate)
+        if self.best_cost is None or cost < self.best_cost:
+            self.best_cost = cost
+            self.best_parameters = self._denormalize_dict(candidate)
+        if self.my_file is not None:
+            self.writer.writerow([self.cma.generation, candidate_idx, *parameters, cost,
+                                  num_strides, self.cma.sigma, self.loop_time])
+            self.my_file.flush()
+
+    def _normalize(self, parameters):
+        return (np.asarray(parameters, dtype=float) - self.lower_bounds) / self.ranges
+
+    def _denormalize(self, x):
+        return self.lower_bounds + np.asarray(x) * self.ranges
+
+    def _denormalize_dict(self, x) -> dict:
+        return {name: float(value)
+                for name, value in zip(self.parameter_names, self._denormalize(x))}
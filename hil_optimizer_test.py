@@ -0,0 +1,137 @@
+import unittest
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+import config_util
+import hil_optimizer
+
+
+class Test_hil_optimizer(unittest.TestCase):
+
+    def test_CMAES_minimizes_quadratic(self):
+        target = np.array([0.3, 0.7, 0.5])
+        cma = hil_optimizer.CMAES(x0=[0.5, 0.5, 0.5], sigma0=0.3, seed=0)
+        for _ in range(60):
+            candidates = cma.ask()
+            cma.tell(candidates, [np.sum((c - target)**2) for c in candidates])
+        np.testing.assert_allclose(cma.mean, target, atol=1e-3)
+
+    def test_apply_parameters(self):
+        config = config_util.ConfigurableConstants()
+        hil_optimizer.apply_parameters(config, {'RISE_FRACTION': 0.25, 'PEAK_TORQUE': 12})
+        self.assertEqual(config.RISE_FRACTION, 0.25)
+        self.assertEqual(config.LEFT_PEAK_TORQUE, 12)
+        self.assertEqual(config.RIGHT_PEAK_TORQUE, 12)
+        self.assertEqual(hil_optimizer.get_parameters(config, ['PEAK_TORQUE']), {'PEAK_TORQUE': 12})
+
+    def test_HILOptimizer_pushes_candidates(self):
+        config = config_util.ConfigurableConstants()
+        config.HIL_STRIDES_PER_CANDIDATE = 2
+        config.HIL_STRIDES_TO_SKIP = 1
+        config.HIL_POPULATION_SIZE = 4
+        config.HIL_NUM_GENERATIONS = 2
+        config.HIL_SEED = 0
+        lock = threading.Lock()
+        new_params_event = threading.Event()
+        optimizer = hil_optimizer.HILOptimizer(
+            lock=lock, config=config, new_params_event=new_params_event)
+        data = SimpleNamespace(did_heel_strike=False, commanded_torque=10,
+                               ankle_torque_from_current=8, loop_time=0)
+        exo = SimpleNamespace(side=0, data=data)
+        seen_peak_torques = set()
+        for i in range(2000):
+            data.did_heel_strike = i % 10 == 0
+            data.ankle_torque_from_current = config.LEFT_PEAK_TORQUE
+            optimizer.update([exo])
+            if new_params_event.is_set():
+                new_params_event.clear()
+                seen_peak_torques.add(config.LEFT_PEAK_TORQUE)
+            if optimizer.is_done:
+                break
+            time.sleep(0.001)
+        optimizer.close()
+        self.assertTrue(optimizer.is_done)
+        self.assertEqual(optimizer.cma.generation, 2)
+        self.assertGreater(len(seen_peak_torques), 4)
+        for peak_torque in seen_peak_torques:
+            self.assertTrue(2 <= peak_torque <= 20)
+
+
+    def test_torque_tracking_cost_normalized(self):
+        costs = []
+        for scale in [1, 3]:  # Same relative tracking at three times the torque
+            meter = hil_optimizer.StrideCostMeter(cost_type=config_util.HILCost.TORQUE_TRACKING)
+            for i in range(21):
+                commanded_torque = scale * (10 if i % 10 == 5 else 2)
+                data = SimpleNamespace(did_heel_strike=i % 10 == 0,
+                                       commanded_torque=commanded_torque,
+                                       ankle_torque_from_current=0.9 * commanded_torque)
+                stride_cost = meter.update(data)
+            costs.append(stride_cost)
+        self.assertAlmostEqual(costs[0], costs[1])
+        self.assertAlmostEqual(costs[0], 0.1 * np.sqrt((9 * 2**2 + 10**2) / 10) / 10)
+        # No torque commanded: no cost, rather than a perfect one
+        meter = hil_optimizer.StrideCostMeter(cost_type=config_util.HILCost.TORQUE_TRACKING)
+        for i in range(11):
+            stride_cost = meter.update(SimpleNamespace(did_heel_strike=i % 10 == 0,
+                                                       commanded_torque=0,
+                                                       ankle_torque_from_current=0.5))
+        self.assertIsNone(stride_cost)
+
+    def test_sides_weighted_equally(self):
+        config = config_util.ConfigurableConstants()
+        config.HIL_STRIDES_PER_CANDIDATE = 2
+        config.HIL_STRIDES_TO_SKIP = 1
+        config.HIL_POPULATION_SIZE = 4
+        config.HIL_NUM_GENERATIONS = 1
+        config.HIL_SEED = 0
+        optimizer = hil_optimizer.HILOptimizer(
+            lock=threading.Lock(), config=config, new_params_event=threading.Event())
+        # Relative errors of 0.1 (left) and 0.3 (right), with right strides three times as
+        # frequent: pooling strides would weigh the right side more
+        exo_list = [SimpleNamespace(side=side, data=SimpleNamespace(
+            did_heel_strike=False, commanded_torque=10, ankle_torque_from_current=10 - error,
+            loop_time=0)) for side, error in [(0, 1), (1, 3)]]
+        for i in range(5000):
+            exo_list[0].data.did_heel_strike = i % 12 == 0
+            exo_list[1].data.did_heel_strike = i % 4 == 0
+            optimizer.update(exo_list)
+            if optimizer.is_done:
+                break
+            time.sleep(0.0005)
+        optimizer.close()
+        self.assertTrue(optimizer.is_done)
+        self.assertAlmostEqual(optimizer.best_cost, 0.2)
+
+    def test_external_cost(self):
+        config = config_util.ConfigurableConstants()
+        config.HIL_COST = config_util.HILCost.EXTERNAL
+        config.HIL_STRIDES_PER_CANDIDATE = 2
+        config.HIL_STRIDES_TO_SKIP = 1
+        config.HIL_POPULATION_SIZE = 4
+        config.HIL_NUM_GENERATIONS = 1
+        config.HIL_SEED = 0
+        optimizer = hil_optimizer.HILOptimizer(
+            lock=threading.Lock(), config=config, new_params_event=threading.Event())
+        exo_list = [SimpleNamespace(side=0, data=SimpleNamespace(did_heel_strike=False,
+                                                                 loop_time=0))]
+        # Samples arrive on another thread (e.g., the NetworkParameterPasser's)
+        for i in range(5000):
+            sender = threading.Thread(target=optimizer.add_external_cost, args=(2.0 + i % 2,))
+            sender.start()
+            sender.join()
+            exo_list[0].data.did_heel_strike = i % 4 == 0
+            optimizer.update(exo_list)
+            if optimizer.is_done:
+                break
+            time.sleep(0.0005)
+        optimizer.close()
+        self.assertTrue(optimizer.is_done)
+        self.assertAlmostEqual(optimizer.best_cost, 2.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+'''Reports what importing each module costs, using python -X importtime.
+
+Each module is imported in a fresh interpreter, and the cumulative import time of it and of
+its slowest dependencies is printed, along with which heavy libraries (flexsea, scipy,
+pandas, matplotlib, the Jetson stack) got pulled in. Importing exoboot, or the analysis
+modules built on it, should load none of these; they are imported on first use.
+
+Run: python import_time_report.py [module ...] [--top 10]'''
+import argparse
+import subprocess
+import sys
+
+DEFAULT_MODULES = ['exoboot', 'analysis_util', 'plotters', 'controllers', 'state_machines',
+                   'gait_state_estimators', 'control_muxer']
+HEAVY_MODULES = ['flexsea', 'scipy.interpolate', 'scipy.signal', 'pandas', 'matplotlib',
+                 'ml_util']
+
+
+def get_import_times(module_name: str) -> list:
+    '''Returns [(cumulative_us, self_us, name), ...] for every module imported by module_name.'''
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module_name],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise ImportError(result.stderr.strip().splitlines()[-1])
+    import_times = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        import_times.append((int(cumulative_us), int(self_us), name.strip()))
+    return import_times
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import time per module')
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of slowest dependencies to list per module')
+    args = parser.parse_args()
+    for module_name in args.modules:
+        try:
+            import_times = get_import_times(module_name)
+        except ImportError as e:
+            print('%s: failed (%s)\n' % (module_name, e))
+            continue
+        imported_names = [name for _, _, name in import_times]
+        total_us = next(cumulative_us for cumulative_us, _, name in import_times
+                        if name == module_name)
+        heavy = [heavy_name for heavy_name in HEAVY_MODULES if any(
+            name == heavy_name or name.startswith(heavy_name + '.') for name in imported_names)]
+        print('%s: %.1f ms, %d modules, heavy: %s' % (
+            module_name, total_us / 1000, len(import_times), ', '.join(heavy) or 'none'))
+        for cumulative_us, self_us, name in sorted(import_times, reverse=True)[1:args.top + 1]:
+            print('    %8.1f ms  %8.1f ms self  %s' % (cumulative_us / 1000, self_us / 1000, name))
+        print()
@@ -14,7 +14,10 @@ import config_util
 import parameter_passers
 import control_muxer
 import plotters
-import ml_util
+import profiles
+import hil_optimizer
+import parameter_schedule
+import event_log
 import traceback
 import socket
 import os
@@ -63,6 +66,9 @@ def determineMinMaxData(anyData,exo):
     return peakData
 
 config = config_util.load_config_from_args()  # loads config from passed args
+if config.DO_HIL_OPTIMIZATION and config.HIL_COST == config_util.HILCost.EXTERNAL and \
+        config.PARAMETER_SERVER_PORT is None:
+    raise ValueError('HIL_COST = EXTERNAL needs PARAMETER_SERVER_PORT, to receive costs')
 file_ID = input(
     'Other than the date, what would you like added to the filename?')
 
@@ -110,6 +116,31 @@ t0 = time.perf_counter()
 keyboard_thread = parameter_passers.ParameterPasser(
     lock=lock, config=config, quit_event=quit_event,
     new_params_event=new_params_event)
+if config.SCHEDULE_FILENAME is not None:
+    schedule = parameter_schedule.ParameterSchedule(
+        lock=lock, config=config, new_params_event=new_params_event,
+        filename=config.SCHEDULE_FILENAME, file_ID=file_ID)
+else:
+    schedule = None
+if config.DO_HIL_OPTIMIZATION:
+    optimizer = hil_optimizer.HILOptimizer(
+        lock=lock, config=config, new_params_event=new_params_event, file_ID=file_ID)
+else:
+    optimizer = None
+if optimizer is not None and config.HIL_COST == config_util.HILCost.EXTERNAL:
+    on_external_cost = optimizer.add_external_cost  # Costs arrive over the network
+else:
+    on_external_cost = None
+if config.PARAMETER_SERVER_PORT is not None:
+    network_thread = parameter_passers.NetworkParameterPasser(
+        lock=lock, config=config, quit_event=quit_event,
+        new_params_event=new_params_event, port=config.PARAMETER_SERVER_PORT,
+        on_external_cost=on_external_cost)
+else:
+    network_thread = None
+event_log_writer = event_log.EventLogWriter(  # Saves state machine transitions
+    transition_logs=[exo.transition_log for exo in exo_list],
+    filenames=[event_log.get_events_filename(exo.filename) for exo in exo_list])
 config_saver.write_data(loop_time=0)  # Write first row on config
 only_write_if_new = not config.READ_ONLY and config.ONLY_LOG_IF_NEW
 
@@ -141,6 +172,10 @@ while True:
         if not config.READ_ONLY:
             for state_machine in state_machine_list:
                 state_machine.step(read_only=config.READ_ONLY)
+        if schedule is not None:
+            schedule.update(exo_list)
+        if optimizer is not None:
+            optimizer.update(exo_list)
         for exo in exo_list:
             exo.write_data(only_write_if_new=only_write_if_new)
             #maxValue=determineMinMaxData(exo.data.ankle_torque_from_current)
@@ -164,6 +199,16 @@ while True:
 
 '''Safely close files, stop streaming, optionally saves plots'''
 config_saver.close_file()
+event_log_writer.close()
+if network_thread is not None:
+    network_thread.close()
+if schedule is not None:
+    schedule.close()
+if optimizer is not None:
+    optimizer.close()
+control_muxer.close_task_resources()  # e.g., the Jetson connection
+if any(profiles.profile_cache.get_hits_and_misses()):
+    print(profiles.profile_cache)  # Once, not on every spline update
 for exo in exo_list:
     exo.close()
 if config.VARS_TO_PLOT:
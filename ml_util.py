@@ -1,58 +1,816 @@
 import exoboot
 from typing import Type
 import constants
+import config_util
 import numpy as np
+import select
+import socket
+import struct
+import threading
+import time
 import tcpip
-from collections import deque
+import util
+from collections import deque, namedtuple
+
+'''Binary wire protocol (config_util.JetsonProtocol.BINARY). All fields little-endian.
+Request (exo -> Jetson): version, side (0=LEFT, 1=RIGHT), sequence number, send time (s),
+    accel_x, accel_y, accel_z, gyro_x, gyro_y, gyro_z, ankle_angle, ankle_velocity
+Reply (Jetson -> exo): version, side, sequence number and send time echoed from the
+    request, gait_phase, is_stance'''
+PROTOCOL_VERSION = 1
+REQUEST_STRUCT = struct.Struct('<BBId8f')  # 46 bytes
+REPLY_STRUCT = struct.Struct('<BBIdfB')  # 19 bytes
+SEQUENCE_MODULUS = 2**32
+
+'''Window request (exo -> Jetson), for models that need a feature history. The first
+byte is WINDOW_PROTOCOL_VERSION instead of PROTOCOL_VERSION, so the Jetson can tell them
+apart. Header: version, side, sequence number, send time (s), num rows, num features,
+bytes per delta (2 or 4). Body: each feature is quantized to an integer count of
+FEATURE_QUANTA; the oldest row is sent as int32 counts, then each later row as the
+(int16, or int32 if any overflow) difference from the row before. Decoding is exact to
+within half a quantum, with no drift. Replies use REPLY_STRUCT.'''
+WINDOW_PROTOCOL_VERSION = 2
+WINDOW_HEADER_STRUCT = struct.Struct('<BBIdHBB')  # 17 bytes
+# Counts per unit: accel (g), gyro (deg/s), ankle_angle (deg), ankle_velocity (deg/s)
+FEATURE_QUANTA = np.array([1e-4, 1e-4, 1e-4, 1e-2, 1e-2, 1e-2, 1e-3, 1e-2])
+# Windows posted to a JetsonIOThread are copied into this many reused arrays per side
+WINDOW_RING_SIZE = 4
+
+TEXT_FRAME_START = ord('!')
+TEXT_SEPARATOR_BYTES = b' \r\n'  # Allowed between TEXT replies
+
+# Most TEXT requests per side that can be waiting for a reply (see ReplySink)
+MAX_PENDING_TEXT_REQUESTS = 64
+
+# send_time is when the features were sampled (None if it is not known)
+Prediction = namedtuple(
+    'Prediction', ['gait_phase', 'is_stance', 'sequence', 'send_time', 'recv_time'])
+
+
+def side_to_int(side: Type[constants.Side]) -> int:
+    return 0 if side == constants.Side.LEFT else 1
+
+
+def get_features(data: exoboot.Exo.DataContainer) -> tuple:
+    '''Returns the eight features sent to the Jetson, in protocol order.'''
+    return (data.accel_x, data.accel_y, data.accel_z,
+            data.gyro_x, data.gyro_y, data.gyro_z,
+            data.ankle_angle, data.ankle_velocity)
+
+
+def encode_request_into(buffer: bytearray, side: Type[constants.Side], sequence: int,
+                        send_time: float, features):
+    '''Packs a binary request into a preallocated buffer of size REQUEST_STRUCT.size.'''
+    REQUEST_STRUCT.pack_into(buffer, 0, PROTOCOL_VERSION, side_to_int(side),
+                             sequence % SEQUENCE_MODULUS, send_time, *features)
+
+
+def encode_text_request(side: Type[constants.Side], features) -> str:
+    '''Original text protocol: !side,accel_x,...,ankle_velocity'''
+    return '!' + str(side_to_int(side)) + ',' + ','.join('%.5f' % feature for feature in features)
+
+
+def decode_request(message: bytes):
+    '''Jetson-side counterpart of encode_request_into. Returns side, sequence, send_time, features.'''
+    version, side, sequence, send_time, *features = REQUEST_STRUCT.unpack(message)
+    if version != PROTOCOL_VERSION:
+        raise ValueError('Unsupported protocol version: ' + str(version))
+    return side, sequence, send_time, features
+
+
+class WindowRequestEncoder():
+    def __init__(self, window_size: int, num_features: int = 8, quanta=FEATURE_QUANTA):
+        '''Delta-encodes (window_size x num_features) windows (see above) into preallocated
+        arrays and a reused send buffer, so encoding allocates nothing per request.'''
+        self.window_size = window_size
+        self.num_features = num_features
+        self.quanta = quanta
+        self._scaled = np.empty((window_size, num_features))
+        self._counts = np.empty((window_size, num_features), dtype=np.int64)
+        self._deltas = np.empty((window_size - 1, num_features), dtype=np.int64)
+        body_start = WINDOW_HEADER_STRUCT.size + 4*num_features
+        num_deltas = (window_size - 1)*num_features
+        self._buffer = bytearray(body_start + 4*num_deltas)
+        self._view = memoryview(self._buffer)
+        # Views into _buffer, so counts are written straight into the message
+        self._first_row = np.frombuffer(self._buffer, dtype='<i4', count=num_features,
+                                        offset=WINDOW_HEADER_STRUCT.size)
+        self._delta_views = {
+            delta_bytes: np.frombuffer(self._buffer, dtype='<i%d' % delta_bytes, count=num_deltas,
+                                       offset=body_start).reshape(window_size - 1, num_features)
+            for delta_bytes in (2, 4)}
+
+    def encode(self, side: Type[constants.Side], sequence: int, send_time: float, window):
+        '''Returns a memoryview of the encoded request, valid until the next encode().'''
+        np.divide(window, self.quanta, out=self._scaled)
+        np.rint(self._scaled, out=self._scaled)
+        np.copyto(self._counts, self._scaled, casting='unsafe')
+        np.subtract(self._counts[1:], self._counts[:-1], out=self._deltas)
+        if self._deltas.size and (self._deltas.max() > 32767 or self._deltas.min() < -32767):
+            delta_bytes = 4
+        else:
+            delta_bytes = 2
+        WINDOW_HEADER_STRUCT.pack_into(
+            self._buffer, 0, WINDOW_PROTOCOL_VERSION, side_to_int(side),
+            sequence % SEQUENCE_MODULUS, send_time, self.window_size, self.num_features,
+            delta_bytes)
+        np.copyto(self._first_row, self._counts[0], casting='unsafe')
+        np.copyto(self._delta_views[delta_bytes], self._deltas, casting='unsafe')
+        return self._view[:WINDOW_HEADER_STRUCT.size + 4*self.num_features +
+                          self._deltas.size*delta_bytes]
+
+
+def encode_window_request(side: Type[constants.Side], sequence: int, send_time: float,
+                          window, quanta=FEATURE_QUANTA) -> bytes:
+    '''Delta-encodes a (num rows x 8) feature window, oldest row first (see above).'''
+    encoder = WindowRequestEncoder(window_size=window.shape[0], num_features=window.shape[1],
+                                   quanta=quanta)
+    return bytes(encoder.encode(side=side, sequence=sequence, send_time=send_time,
+                                window=window))
+
+
+def get_window_request_size(header: bytes) -> int:
+    '''Total size in bytes of the window request starting with this header.'''
+    _, _, _, _, num_rows, num_features, delta_bytes = WINDOW_HEADER_STRUCT.unpack_from(header)
+    return WINDOW_HEADER_STRUCT.size + 4*num_features + (num_rows - 1)*num_features*delta_bytes
+
+
+def decode_window_request(message: bytes, quanta=FEATURE_QUANTA):
+    '''Jetson-side counterpart of encode_window_request. Returns side, sequence, send_time, window.'''
+    version, side, sequence, send_time, num_rows, num_features, delta_bytes = \
+        WINDOW_HEADER_STRUCT.unpack_from(message)
+    if version != WINDOW_PROTOCOL_VERSION:
+        raise ValueError('Not a window request, version: ' + str(version))
+    first_row = np.frombuffer(message, dtype='<i4', count=num_features,
+                              offset=WINDOW_HEADER_STRUCT.size)
+    deltas = np.frombuffer(message, dtype='<i%d' % delta_bytes,
+                           count=(num_rows - 1)*num_features,
+                           offset=WINDOW_HEADER_STRUCT.size + 4*num_features)
+    counts = np.empty((num_rows, num_features), dtype=np.int64)
+    counts[0] = first_row
+    np.cumsum(deltas.reshape(num_rows - 1, num_features), axis=0, out=counts[1:])
+    counts[1:] += first_row
+    return side, sequence, send_time, counts * quanta
+
+
+def encode_reply(side: int, sequence: int, send_time: float, gait_phase: float,
+                 is_stance: bool) -> bytes:
+    '''Jetson-side reply, echoing sequence and send_time from the request.'''
+    return REPLY_STRUCT.pack(PROTOCOL_VERSION, side, sequence, send_time,
+                             gait_phase, int(bool(is_stance)))
+
+
+class ReplyStreamParser():
+    def __init__(self,
+                 protocol: Type[config_util.JetsonProtocol] = config_util.JetsonProtocol.TEXT,
+                 capacity: int = 8192):
+        '''Extracts complete Jetson replies from a TCP byte stream, which may split or coalesce them.
+
+        Bytes are received straight into a reusable buffer (get_recv_view() + commit()),
+        and frames are consumed incrementally: read_pos marks the first unconsumed byte.
+        BINARY frames are fixed-size and start with PROTOCOL_VERSION; on a bad frame the
+        parser skips ahead a byte at a time to resync. TEXT frames ('!side,gait_phase,is_stance')
+        end at the next '!' or newline, and are not parsed until one arrives, since a field
+        (e.g., is_stance '0.73') may be split across reads. So a Jetson that does not end its
+        replies with a newline has each one wait for the next. Each run of bad bytes counts as one
+        malformed frame. Each frame is stamped with the recv time of the chunk holding its
+        first byte. Call reset() when the connection changes.'''
+        self.protocol = protocol
+        self.buffer = bytearray(capacity)
+        self._view = memoryview(self.buffer)
+        self.num_frames = 0
+        self.num_malformed_frames = 0
+        self.reset()
+
+    def reset(self):
+        '''Drops any partial frame, e.g. from a connection that was closed.'''
+        self.read_pos = 0
+        self.write_pos = 0
+        self._chunks = deque()  # [start pos, recv time] per committed chunk not yet consumed
+        self._is_resyncing = False
+
+    def get_recv_view(self) -> memoryview:
+        '''Returns the writable free tail of the buffer, compacting first if needed.'''
+        if self.read_pos == self.write_pos:
+            self.read_pos = self.write_pos = 0
+            self._chunks.clear()
+        elif len(self.buffer) - self.write_pos < REPLY_STRUCT.size:
+            if self.read_pos == 0:
+                # Buffer full without a complete frame: drop it
+                self.num_malformed_frames += 1
+                self.read_pos = self.write_pos = 0
+                self._chunks.clear()
+            else:
+                num_unconsumed = self.write_pos - self.read_pos
+                self.buffer[:num_unconsumed] = bytes(self._view[self.read_pos:self.write_pos])
+                self._drop_consumed_chunks()
+                for chunk in self._chunks:
+                    chunk[0] = max(chunk[0] - self.read_pos, 0)
+                self.read_pos = 0
+                self.write_pos = num_unconsumed
+        return self._view[self.write_pos:]
+
+    def commit(self, num_bytes: int, recv_time: float = None):
+        '''Marks num_bytes written into the view from get_recv_view() as received at recv_time
+        (perf_counter, default now).'''
+        if recv_time is None:
+            recv_time = time.perf_counter()
+        self._chunks.append([self.write_pos, recv_time])
+        self.write_pos += num_bytes
+
+    def feed(self, message: bytes, recv_time: float = None):
+        '''Copies message into the buffer (for when bytes were not received in place).'''
+        if recv_time is None:
+            recv_time = time.perf_counter()
+        while message:
+            recv_view = self.get_recv_view()
+            num_bytes = min(len(recv_view), len(message))
+            recv_view[:num_bytes] = message[:num_bytes]
+            self.commit(num_bytes, recv_time=recv_time)
+            message = message[num_bytes:]
+
+    def parse(self, on_reply):
+        '''Calls on_reply(side, gait_phase, is_stance, sequence, send_time, recv_time) for each
+        complete frame. sequence and send_time are None for TEXT replies.'''
+        if self.protocol == config_util.JetsonProtocol.BINARY:
+            self._parse_binary(on_reply)
+        else:
+            self._parse_text(on_reply)
+
+    def _drop_consumed_chunks(self):
+        chunks = self._chunks
+        while len(chunks) > 1 and chunks[1][0] <= self.read_pos:
+            chunks.popleft()
+
+    def _get_recv_time(self) -> float:
+        '''Recv time of the chunk holding the byte at read_pos.'''
+        self._drop_consumed_chunks()
+        return self._chunks[0][1]
+
+    def _mark_malformed(self):
+        if not self._is_resyncing:
+            self.num_malformed_frames += 1
+            self._is_resyncing = True
+
+    def _parse_binary(self, on_reply):
+        frame_size = REPLY_STRUCT.size
+        buffer = self.buffer
+        while self.write_pos - self.read_pos >= frame_size:
+            if buffer[self.read_pos] != PROTOCOL_VERSION:
+                self._mark_malformed()
+                self.read_pos += 1
+                continue
+            _, side, sequence, send_time, gait_phase, is_stance = REPLY_STRUCT.unpack_from(
+                buffer, self.read_pos)
+            if side > 1 or is_stance > 1 or gait_phase != gait_phase:  # last is a NaN check
+                self._mark_malformed()
+                self.read_pos += 1
+                continue
+            self._is_resyncing = False
+            recv_time = self._get_recv_time()
+            self.read_pos += frame_size
+            self.num_frames += 1
+            on_reply(side, gait_phase, is_stance, sequence, send_time, recv_time)
+
+    def _parse_text(self, on_reply):
+        buffer = self.buffer
+        while self.read_pos < self.write_pos:
+            byte = buffer[self.read_pos]
+            if byte != TEXT_FRAME_START:
+                if byte in TEXT_SEPARATOR_BYTES:
+                    self.read_pos += 1
+                    continue
+                # Junk before a frame start
+                self._mark_malformed()
+                next_start = buffer.find(b'!', self.read_pos, self.write_pos)
+                self.read_pos = self.write_pos if next_start == -1 else next_start
+                continue
+            frame_end = buffer.find(b'!', self.read_pos + 1, self.write_pos)
+            if frame_end == -1:
+                frame_end = self.write_pos
+            line_end = buffer.find(b'\n', self.read_pos + 1, frame_end)
+            if line_end != -1:
+                frame_end = line_end
+            if frame_end == self.write_pos:
+                return  # No terminator yet: the last field may not have fully arrived
+            fields = bytes(self._view[self.read_pos + 1:frame_end]).split(b',')
+            recv_time = self._get_recv_time()
+            self.read_pos = frame_end
+            try:
+                side, gait_phase, is_stance = [float(field) for field in fields]
+            except ValueError:
+                self._is_resyncing = False
+                self._mark_malformed()
+                continue
+            self._is_resyncing = False
+            self.num_frames += 1
+            on_reply(int(side), gait_phase, is_stance, None, None, recv_time)
+
+
+class PredictionSlot():
+    def __init__(self, history_size: int = 0):
+        '''Newest Jetson prediction for one side, overwritten in place by write().
+
+        Replaces scanning a deque of per-message lists: lookups are O(1), and nothing is
+        allocated per reply except the Prediction that read() hands out (once per new reply).
+        One thread writes and one reads. write() bumps version to odd before touching the
+        fields and back to even after, so read() can tell a torn read (version odd or changed)
+        and return the last consistent Prediction instead of blocking.
+        history_size: if > 0, the last history_size gait phases are also kept, in a
+            preallocated ring, for smoothing. Read them with read_history().'''
+        self.version = 0
+        self.history_size = history_size
+        self.phase_history = np.zeros(history_size)
+        self.num_writes = 0
+        self.gait_phase = 0.0
+        self.is_stance = False
+        self.sequence = None
+        self.send_time = None
+        self.recv_time = None
+        self._read_version = 0
+        self._prediction = None
+
+    def write(self, gait_phase: float, is_stance, sequence: int, send_time: float,
+              recv_time: float):
+        '''Called from the writing thread only.'''
+        self.version += 1  # Odd: write in progress
+        self.gait_phase = gait_phase
+        self.is_stance = is_stance
+        self.sequence = sequence
+        self.send_time = send_time
+        self.recv_time = recv_time
+        if self.history_size:
+            self.phase_history[self.num_writes % self.history_size] = gait_phase
+        self.num_writes += 1
+        self.version += 1  # Even: write complete
+
+    def read(self):
+        '''Called from the reading thread only. Returns the newest Prediction, or None.
+
+        Returns the same object until a new prediction is written.'''
+        version = self.version
+        if version == self._read_version or version % 2:
+            return self._prediction
+        prediction = Prediction(self.gait_phase, self.is_stance, self.sequence,
+                                self.send_time, self.recv_time)
+        if self.version == version:
+            self._prediction = prediction
+            self._read_version = version
+        return self._prediction
+
+    def read_history(self, out: np.ndarray, max_attempts: int = 3) -> int:
+        '''Called from the reading thread only. Copies the newest gait phases into out, oldest
+        first, and returns how many were copied (at most len(out) and history_size).
+
+        out[:n] is always from one consistent version: the copy is retried if write() ran
+        during it, and 0 is returned if it ran during every attempt.'''
+        for _ in range(max_attempts):
+            version = self.version
+            if version % 2:
+                continue
+            num_writes = self.num_writes
+            n = min(len(out), num_writes, self.history_size)
+            end = num_writes % self.history_size if self.history_size else 0
+            start = end - n
+            if start >= 0:
+                out[:n] = self.phase_history[start:end]
+            else:  # Wraps around the end of the ring
+                out[:-start] = self.phase_history[start:]
+                out[-start:n] = self.phase_history[:end]
+            if self.version == version:
+                return n
+        return 0
+
+
+class ReplySink():
+    def __init__(self, protocol: Type[config_util.JetsonProtocol],
+                 prediction_history_size: int = 0):
+        '''Where Jetson replies end up, shared by JetsonInterface (inline) and JetsonIOThread.
+
+        Parses received bytes with one ReplyStreamParser and writes each reply to its side's
+        PredictionSlot, unless it answers an older request than the slot already holds
+        (counted in num_out_of_order_replies). Round trips go to latency_stats. Only the
+        thread that receives may call commit(), feed(), reset() and add_text_request().
+
+        TEXT replies carry no sequence number or send time, so whoever sends a TEXT request
+        records it with add_text_request(), and each TEXT reply is matched to the oldest
+        unanswered request for its side. This assumes the Jetson answers each side's requests
+        in order; if a reply is lost, later replies are matched to older requests, so their
+        age reads too high (never too low) until reset() on reconnect.
+        prediction_history_size: gait phases each PredictionSlot keeps (0 keeps none).'''
+        # Newest prediction per side int (0=LEFT, 1=RIGHT)
+        self.prediction_slots = [PredictionSlot(history_size=prediction_history_size),
+                                 PredictionSlot(history_size=prediction_history_size)]
+        self.stream_parser = ReplyStreamParser(protocol=protocol)
+        self.num_out_of_order_replies = 0
+        # Round trip from when features were sampled to when the reply arrived (s)
+        self.latency_stats = util.RunningStats()
+        # (sequence, send_time) of TEXT requests not yet answered, per side int
+        self.pending_text_requests = [deque(maxlen=MAX_PENDING_TEXT_REQUESTS),
+                                      deque(maxlen=MAX_PENDING_TEXT_REQUESTS)]
+
+    def add_text_request(self, side: Type[constants.Side], sequence: int, send_time: float):
+        self.pending_text_requests[side_to_int(side)].append((sequence, send_time))
+
+    def get_recv_view(self):
+        return self.stream_parser.get_recv_view()
+
+    def commit(self, num_bytes: int, recv_time: float = None):
+        '''Parses num_bytes just received into get_recv_view().'''
+        self.stream_parser.commit(num_bytes, recv_time=recv_time)
+        self.stream_parser.parse(self.on_reply)
+
+    def feed(self, message: bytes, recv_time: float = None):
+        self.stream_parser.feed(message, recv_time=recv_time)
+        self.stream_parser.parse(self.on_reply)
+
+    def reset(self):
+        '''Drops partial replies and unanswered TEXT requests, e.g. after a lost connection.'''
+        self.stream_parser.reset()
+        for pending_requests in self.pending_text_requests:
+            pending_requests.clear()
+
+    @property
+    def num_malformed_frames(self) -> int:
+        return self.stream_parser.num_malformed_frames
+
+    def on_reply(self, side, gait_phase, is_stance, sequence, send_time, recv_time):
+        if sequence is None and self.pending_text_requests[side]:
+            sequence, send_time = self.pending_text_requests[side].popleft()
+        slot = self.prediction_slots[side]
+        if sequence is not None:
+            if slot.sequence is not None and sequence <= slot.sequence:
+                # Reply to an older request than one already answered: keep the newer prediction
+                self.num_out_of_order_replies += 1
+                return
+            self.latency_stats.update(recv_time - send_time)
+        slot.write(gait_phase=gait_phase, is_stance=is_stance, sequence=sequence,
+                   send_time=send_time, recv_time=recv_time)
 
 
 class JetsonInterface():
 
-    def __init__(self, do_set_up_server=True, server_ip='192.168.1.2', recv_port=8080):
-        self.data = deque(maxlen=10)
+    def __init__(self, do_set_up_server=True, server_ip='192.168.1.2', recv_port=8080,
+                 protocol: Type[config_util.JetsonProtocol] = config_util.JetsonProtocol.TEXT,
+                 use_io_thread: bool = False,
+                 window_size: int = 0,
+                 prediction_history_size: int = 0):
+        '''Sends features to, and receives gait phase from, the Jetson.
+
+        protocol: config_util.JetsonProtocol. TEXT (default) is the original
+            '!side,features...' format, which every Jetson server speaks; BINARY is the
+            fixed-size struct format above, for Jetsons running the new server.
+        use_io_thread: if True, all socket traffic happens on a JetsonIOThread, and the
+            control loop only posts features to, and reads predictions from, its mailboxes.
+        window_size: if > 0, each request carries the last window_size samples from the
+            exo's util.FeatureHistory as a delta-encoded window request (BINARY only).
+        prediction_history_size: if > 0, the last this many gait phases per side are kept,
+            for smoothing, and can be read with get_gait_phase_history().'''
+        if window_size and protocol != config_util.JetsonProtocol.BINARY:
+            raise ValueError('Window requests need the BINARY protocol')
+        self.window_size = window_size
+        self.protocol = protocol
+        self.sequence = 0
+        self.reply_sink = ReplySink(protocol=protocol,
+                                    prediction_history_size=prediction_history_size)
+        self._send_buffer = bytearray(REQUEST_STRUCT.size)
+        self._window_encoder = None
+        if window_size:
+            self._window_encoder = WindowRequestEncoder(window_size=window_size)
+            self._window_rings = {side: np.zeros((WINDOW_RING_SIZE, window_size, 8))
+                                  for side in (constants.Side.LEFT, constants.Side.RIGHT)}
+            self._window_ring_idx = {constants.Side.LEFT: 0, constants.Side.RIGHT: 0}
+        self.io_thread = None
         if do_set_up_server:
-            self.clienttcp = tcpip.ClientTCP(server_ip, recv_port)
+            if use_io_thread:
+                self.io_thread = JetsonIOThread(
+                    server_ip=server_ip, recv_port=recv_port, protocol=protocol,
+                    reply_sink=self.reply_sink, window_size=window_size)
+            else:
+                self.clienttcp = tcpip.ClientTCP(server_ip, recv_port)
 
     def package_message(self, side: Type[constants.Side], data: exoboot.Exo.DataContainer):
-        if side == constants.Side.LEFT:
-            side_str = '0'
-        else:
-            side_str = '1'
-        accel_x = '%.5f' % data.accel_x
-        accel_y = '%.5f' % data.accel_y
-        accel_z = '%.5f' % data.accel_z
-        gyro_x = '%.5f' % data.gyro_x
-        gyro_y = '%.5f' % data.gyro_y
-        gyro_z = '%.5f' % data.gyro_z
-        ankle_angle = '%.5f' % data.ankle_angle
-        ankle_velocity = '%.5f' % data.ankle_velocity
-        message = '!'+side_str + ',' + accel_x+','+accel_y+','+accel_z+','+gyro_x + \
-            ','+gyro_y+','+gyro_z+','+ankle_angle+','+ankle_velocity
+        return encode_text_request(side=side, features=get_features(data))
+
+    def package_binary_message(self, side: Type[constants.Side], data: exoboot.Exo.DataContainer):
+        '''Packs a binary request into the reused send buffer, and returns the buffer.'''
+        encode_request_into(self._send_buffer, side=side, sequence=self.sequence,
+                            send_time=time.perf_counter(), features=get_features(data))
+        self.sequence += 1
+        return self._send_buffer
+
+    def package_window_message(self, side: Type[constants.Side], window):
+        '''Encodes a window request into the reused encoder buffer, and returns a view of it.'''
+        if self._window_encoder is None or self._window_encoder.window_size != window.shape[0]:
+            self._window_encoder = WindowRequestEncoder(window_size=window.shape[0])
+        message = self._window_encoder.encode(side=side, sequence=self.sequence,
+                                              send_time=time.perf_counter(), window=window)
+        self.sequence += 1
         return message
 
-    def package_and_send_message(self, side, data_container):
-        message = self.package_message(side=side, data=data_container)
-        self.clienttcp.to_server(msg=message)
+    def package_and_send_message(self, side, data_container, feature_history=None):
+        '''Sends features, or if window_size > 0, the window from feature_history.
+
+        With a window_size, nothing is sent until feature_history holds a full window.'''
+        if self.window_size:
+            window = feature_history.get_window(self.window_size)
+            if window is None:
+                return
+            if self.io_thread is not None:
+                # Copied, since the view changes on the next read_data(), into the next array
+                # of this side's ring (see JetsonIOThread._send_new_features)
+                ring_idx = self._window_ring_idx[side]
+                self._window_ring_idx[side] = (ring_idx + 1) % WINDOW_RING_SIZE
+                posted_window = self._window_rings[side][ring_idx]
+                np.copyto(posted_window, window)
+                self.io_thread.post_features(
+                    side=side, send_time=time.perf_counter(), features=posted_window)
+            else:
+                self.clienttcp.to_server_bytes(
+                    msg=self.package_window_message(side=side, window=window))
+        elif self.io_thread is not None:
+            self.io_thread.post_features(
+                side=side, send_time=time.perf_counter(), features=get_features(data_container))
+        elif self.protocol == config_util.JetsonProtocol.BINARY:
+            message = self.package_binary_message(side=side, data=data_container)
+            self.clienttcp.to_server_bytes(msg=message)
+        else:
+            send_time = time.perf_counter()
+            message = self.package_message(side=side, data=data_container)
+            self.clienttcp.to_server(msg=message)
+            self.reply_sink.add_text_request(side=side, sequence=self.sequence, send_time=send_time)
+            self.sequence += 1
 
     def grab_message_and_parse(self):
-        message = self.clienttcp.from_server()
-        self.parse(message)
+        if self.io_thread is not None:
+            return  # Handled by the io thread
+        num_bytes = self.clienttcp.from_server_into(self.reply_sink.get_recv_view())
+        if num_bytes:
+            self.reply_sink.commit(num_bytes)
+
+    def parse(self, message: str):
+        '''Parses TEXT replies (protocol=TEXT only), e.g. '!0,0.52,1'. Partial replies are kept.'''
+        if message:
+            self.reply_sink.feed(message.encode())
+
+    def parse_binary(self, message: bytes):
+        '''Parses BINARY replies (protocol=BINARY only). Partial replies are kept until complete.'''
+        if message:
+            self.reply_sink.feed(message)
+
+    @property
+    def num_malformed_messages(self) -> int:
+        return self.reply_sink.num_malformed_frames
+
+    @property
+    def num_out_of_order_replies(self) -> int:
+        return self.reply_sink.num_out_of_order_replies
 
-    def parse(self, message):
-        '''parses message from jetson. Returns side, gait_phase, is_stance'''
-        if message is not None:
-            message_list = message.split("!")[1:]
-            for message in message_list:
-                data_list = message.split(",")
-                self.data.appendleft([float(i) for i in data_list])
+    def get_most_recent_prediction(self, side: Type[constants.Side]):
+        '''Returns the newest Prediction for this side, or None.'''
+        return self.reply_sink.prediction_slots[side_to_int(side)].read()
+
+    def get_gait_phase_history(self, side: Type[constants.Side], out: np.ndarray) -> int:
+        '''Copies this side's newest gait phases into out, oldest first, and returns how many.
+
+        Needs prediction_history_size > 0. See PredictionSlot.read_history().'''
+        return self.reply_sink.prediction_slots[side_to_int(side)].read_history(out)
+
+    def get_latency_stats(self) -> util.RunningStats:
+        '''Round-trip latency stats (s), from feature sampling to reply receipt.'''
+        return self.reply_sink.latency_stats
 
     def get_most_recent_gait_phase(self, side: Type[constants.Side]):
-        for message in self.data:
-            if side == constants.Side.LEFT and message[0] == 0:
-                gait_phase = message[1]
-                stance_swing = message[2]
-                return gait_phase, stance_swing
-            elif side == constants.Side.RIGHT and message[0] == 1:
-                gait_phase = message[1]
-                stance_swing = message[2]
-                return gait_phase, stance_swing
+        prediction = self.get_most_recent_prediction(side=side)
+        if prediction is not None:
+            return prediction.gait_phase, prediction.is_stance
+
+    def close(self):
+        print('Jetson round trip latency (s): ', self.get_latency_stats())
+        print('Jetson replies out of order: ', self.num_out_of_order_replies,
+              ' malformed: ', self.num_malformed_messages)
+        if self.io_thread is not None:
+            self.io_thread.stop()
+
+
+class JetsonIOThread(threading.Thread):
+    def __init__(self,
+                 server_ip: str,
+                 recv_port: int,
+                 protocol: Type[config_util.JetsonProtocol] = config_util.JetsonProtocol.TEXT,
+                 connect_timeout: float = 1,
+                 reconnect_interval: float = 0.5,
+                 reply_sink: ReplySink = None,
+                 window_size: int = 0,
+                 name='jetson-io-thread'):
+        '''Owns the Jetson socket, so network hiccups never block the control loop.
+
+        The control loop posts the newest features per side with post_features() (into
+        util.Mailboxes), and reads the newest Prediction per side with get_prediction() (from
+        the reply sink's PredictionSlots, which this thread writes). Only the latest value is
+        kept either way, so nothing queues up if the Jetson falls behind. If the connection
+        drops (or was never made), it is retried every reconnect_interval.
+        reply_sink: ReplySink that replies are parsed into, e.g. shared with a JetsonInterface.
+            A new one is made if None.
+        window_size: if > 0, posted features are (window_size x 8) windows, sent as window
+            requests. A posted window must not be written to again until WINDOW_RING_SIZE - 1
+            more windows have been posted for that side, as JetsonInterface's rings ensure.'''
+        super().__init__(name=name)
+        self.daemon = True  # Thread property
+        self.server_ip = server_ip
+        self.recv_port = recv_port
+        self.protocol = protocol
+        self.connect_timeout = connect_timeout
+        self.reconnect_interval = reconnect_interval
+        self.window_size = window_size
+        self.outboxes = {constants.Side.LEFT: util.Mailbox(),
+                         constants.Side.RIGHT: util.Mailbox()}
+        if reply_sink is None:
+            reply_sink = ReplySink(protocol=protocol)
+        self.reply_sink = reply_sink
+        self.sent_versions = {constants.Side.LEFT: 0, constants.Side.RIGHT: 0}
+        self.clienttcp = None
+        self.sequence = 0
+        self.num_reconnects = 0
+        self._send_buffer = bytearray(REQUEST_STRUCT.size)
+        if window_size:
+            self._window_encoder = WindowRequestEncoder(window_size=window_size)
+        # Writing to _wake_writer interrupts the select() wait when new features are posted
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._wake_reader.setblocking(False)
+        self._wake_writer.setblocking(False)
+        self.stop_event = threading.Event()
+        self.start()  # Starts the run() function
+
+    def post_features(self, side: Type[constants.Side], send_time: float, features: tuple):
+        '''Called from the control loop. Replaces any features for this side not yet sent.'''
+        self.outboxes[side].post((send_time, features))
+        try:
+            self._wake_writer.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # Already awake, or wake buffer full
+
+    def get_prediction(self, side: Type[constants.Side]):
+        '''Called from the control loop. Returns the newest Prediction for this side, or None.'''
+        return self.reply_sink.prediction_slots[side_to_int(side)].read()
+
+    def is_connected(self) -> bool:
+        return self.clienttcp is not None
+
+    def stop(self):
+        self.stop_event.set()
+        try:
+            self._wake_writer.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    # This run function overrides the run() function in threading.Thread
+    def run(self):
+        while not self.stop_event.is_set():
+            if self.clienttcp is None and not self._connect():
+                self.stop_event.wait(self.reconnect_interval)
+                continue
+            try:
+                self._send_new_features()
+                readable, _, _ = select.select(
+                    [self.clienttcp.recv_conn, self._wake_reader], [], [], 0.1)
+                if self._wake_reader in readable:
+                    self._wake_reader.recv(4096)
+                if self.clienttcp.recv_conn in readable:
+                    num_bytes = self.clienttcp.recv_conn.recv_into(
+                        self.reply_sink.get_recv_view())
+                    if not num_bytes:
+                        raise ConnectionError('Jetson closed the connection')
+                    self.reply_sink.commit(num_bytes)
+            except OSError as err:
+                print('Lost connection to Jetson: ', err)
+                self._disconnect()
+        self._disconnect()
+
+    def _connect(self) -> bool:
+        try:
+            self.clienttcp = tcpip.ClientTCP(
+                self.server_ip, self.recv_port, timeout=self.connect_timeout)
+        except OSError:
+            self.clienttcp = None
+            return False
+        self.reply_sink.reset()
+        self.num_reconnects += 1
+        print('Connected to Jetson at ', self.server_ip)
+        return True
+
+    def _disconnect(self):
+        if self.clienttcp is not None:
+            try:
+                self.clienttcp.close()
+            except OSError:
+                pass
+            self.clienttcp = None
+        # Partial replies from the old connection must not be spliced onto the next one's
+        self.reply_sink.reset()
+
+    def _send_new_features(self):
+        for side, outbox in self.outboxes.items():
+            value, version = outbox.read_with_version()
+            if version == self.sent_versions[side]:
+                continue
+            self.sent_versions[side] = version
+            send_time, features = value
+            if self.window_size:
+                message = self._window_encoder.encode(
+                    side=side, sequence=self.sequence, send_time=send_time, window=features)
+                # The poster reuses its window arrays; if enough newer windows were posted
+                # while encoding, this one may have been overwritten, so send the newest instead
+                _, latest_version = outbox.read_with_version()
+                if latest_version - version >= WINDOW_RING_SIZE - 1:
+                    continue
+                self.clienttcp.to_server_bytes(msg=message)
+            elif self.protocol == config_util.JetsonProtocol.BINARY:
+                encode_request_into(self._send_buffer, side=side, sequence=self.sequence,
+                                    send_time=send_time, features=features)
+                self.clienttcp.to_server_bytes(msg=self._send_buffer)
+            else:
+                self.clienttcp.to_server(
+                    msg=encode_text_request(side=side, features=features))
+                self.reply_sink.add_text_request(
+                    side=side, sequence=self.sequence, send_time=send_time)
+            self.sequence += 1
+
+    @property
+    def num_malformed_messages(self) -> int:
+        return self.reply_sink.num_malformed_frames
+
+
+class LocalGaitPhaseModel():
+    def __init__(self,
+                 weights: list,
+                 biases: list,
+                 window_size: int = 1,
+                 feature_mean=None,
+                 feature_std=None):
+        '''Small MLP (or linear model, if one layer) that runs on the Pi, as a Jetson fallback.
+
+        Input is the last window_size samples of the eight get_features() signals, oldest
+        first, flattened to length 8*window_size and normalized by feature_mean/feature_std.
+        Samples come from the exo's util.FeatureHistory, so the model keeps no window of its
+        own. Hidden layers use ReLU; the last layer outputs [gait_phase, stance_logit]. All
+        buffers are preallocated, so predict() does not allocate arrays.'''
+        self.num_features = 8
+        self.window_size = window_size
+        self.weights = [np.ascontiguousarray(W, dtype=np.float64) for W in weights]
+        self.biases = [np.ascontiguousarray(b, dtype=np.float64) for b in biases]
+        input_size = self.num_features * window_size
+        if self.weights[0].shape[0] != input_size:
+            raise ValueError('First layer expects ' + str(self.weights[0].shape[0]) +
+                             ' inputs, but window_size*8 = ' + str(input_size))
+        if self.weights[-1].shape[1] != 2:
+            raise ValueError('Last layer must output [gait_phase, stance_logit]')
+        if feature_mean is None:
+            feature_mean = np.zeros(input_size)
+        if feature_std is None:
+            feature_std = np.ones(input_size)
+        self.feature_mean = np.broadcast_to(feature_mean, (input_size,)).astype(np.float64)
+        self.feature_std = np.broadcast_to(feature_std, (input_size,)).astype(np.float64)
+        self._x = np.zeros(input_size)
+        self._activations = [np.zeros(W.shape[1]) for W in self.weights]
+
+    @classmethod
+    def from_file(cls, filename: str):
+        '''Loads an .npz saved by save_local_model().'''
+        with np.load(filename) as npz:
+            num_layers = int(npz['num_layers'])
+            return cls(weights=[npz['weights_%d' % i] for i in range(num_layers)],
+                       biases=[npz['biases_%d' % i] for i in range(num_layers)],
+                       window_size=int(npz['window_size']),
+                       feature_mean=npz['feature_mean'],
+                       feature_std=npz['feature_std'])
+
+    def predict(self, feature_history: util.FeatureHistory):
+        '''Returns (gait_phase, is_stance), or None until the history holds a full window.'''
+        window = feature_history.get_window(self.window_size)
+        if window is None:
+            return None
+        x = self._x
+        np.subtract(window.reshape(-1), self.feature_mean, out=x)
+        np.divide(x, self.feature_std, out=x)
+        last_layer = len(self.weights) - 1
+        for i, (W, b, activation) in enumerate(zip(self.weights, self.biases, self._activations)):
+            np.dot(x, W, out=activation)
+            np.add(activation, b, out=activation)
+            if i < last_layer:
+                np.maximum(activation, 0, out=activation)
+            x = activation
+        return float(x[0]), bool(x[1] > 0)
+
+
+def save_local_model(filename: str, weights: list, biases: list, window_size: int = 1,
+                     feature_mean=None, feature_std=None):
+    '''Exports weights in the format LocalGaitPhaseModel.from_file() loads.'''
+    input_size = 8 * window_size
+    arrays = {'num_layers': len(weights), 'window_size': window_size,
+              'feature_mean': np.zeros(input_size) if feature_mean is None else feature_mean,
+              'feature_std': np.ones(input_size) if feature_std is None else feature_std}
+    for i, (W, b) in enumerate(zip(weights, biases)):
+        arrays['weights_%d' % i] = W
+        arrays['biases_%d' % i] = b
+    np.savez(filename, **arrays)
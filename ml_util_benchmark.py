@@ -0,0 +1,67 @@
+'''Compares encode/decode cost and bytes on the wire of the TEXT, BINARY and window Jetson requests.
+
+Run: python ml_util_benchmark.py'''
+import timeit
+
+import numpy as np
+
+import config_util
+import constants
+import exoboot
+import ml_util
+import util
+
+NUMBER = 20000
+
+if __name__ == '__main__':
+    jetson_interface = ml_util.JetsonInterface(do_set_up_server=False)
+    text_jetson_interface = ml_util.JetsonInterface(
+        do_set_up_server=False, protocol=config_util.JetsonProtocol.TEXT)
+    data = exoboot.Exo.DataContainer()
+    data.accel_x, data.accel_y, data.accel_z = 0.01234, -0.98765, 0.04321
+    data.gyro_x, data.gyro_y, data.gyro_z = 12.3456, -45.6789, 210.9876
+    data.ankle_angle, data.ankle_velocity = 14.56789, -123.45678
+
+    text_request = jetson_interface.package_message(side=constants.Side.LEFT, data=data)
+    binary_request = jetson_interface.package_binary_message(side=constants.Side.LEFT, data=data)
+    # 20 samples (100 ms at 200 Hz) of a random walk with realistic per-sample changes
+    window = np.cumsum(np.random.default_rng(0).normal(size=(20, 8)), axis=0) * \
+        [0.02, 0.02, 0.02, 5, 5, 5, 0.2, 5]
+    window_request = bytes(jetson_interface.package_window_message(
+        side=constants.Side.LEFT, window=window))
+    text_reply = '!0,0.54321,1'
+    binary_reply = ml_util.encode_reply(side=0, sequence=1, send_time=1.0,
+                                        gait_phase=0.54321, is_stance=True)
+
+    results = [
+        ('encode TEXT', len(text_request.encode()), lambda: jetson_interface.package_message(
+            side=constants.Side.LEFT, data=data).encode()),
+        ('encode BINARY', len(binary_request), lambda: jetson_interface.package_binary_message(
+            side=constants.Side.LEFT, data=data)),
+        ('encode WINDOW', len(window_request), lambda: jetson_interface.package_window_message(
+            side=constants.Side.LEFT, window=window)),
+        ('decode WINDOW', len(window_request), lambda: ml_util.decode_window_request(window_request)),
+        ('decode TEXT', len(text_reply.encode()), lambda: text_jetson_interface.parse(text_reply)),
+        ('decode BINARY', len(binary_reply), lambda: jetson_interface.parse_binary(binary_reply)),
+    ]
+    for name, num_bytes, fn in results:
+        seconds = min(timeit.repeat(fn, number=NUMBER, repeat=3))
+        print('%-14s %6.2f us/msg %4d bytes' % (name, 1e6*seconds/NUMBER, num_bytes))
+    print('(a 20-sample window as float32 would be %d bytes)' % (window.size * 4))
+
+    # Local fallback model: 10-sample window, two 32-unit hidden layers
+    rng = np.random.default_rng(0)
+    layer_sizes = [8*10, 32, 32, 2]
+    local_model = ml_util.LocalGaitPhaseModel(
+        weights=[rng.normal(size=(n_in, n_out)) for n_in, n_out in zip(layer_sizes[:-1], layer_sizes[1:])],
+        biases=[rng.normal(size=n_out) for n_out in layer_sizes[1:]],
+        window_size=10)
+
+    feature_history = util.FeatureHistory(size=10)
+
+    def run_local_model():
+        feature_history.update(data)
+        local_model.predict(feature_history)
+
+    seconds = min(timeit.repeat(run_local_model, number=NUMBER, repeat=3))
+    print('%-14s %6.2f us/tick' % ('local model', 1e6*seconds/NUMBER))
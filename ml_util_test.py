@@ -0,0 +1,405 @@
+import os
+import socket
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+import config_util
+import constants
+import exoboot
+import ml_util
+import util
+
+
+class Test_JetsonInterface(unittest.TestCase):
+
+    def setUp(self):
+        self.jetson_interface = ml_util.JetsonInterface(
+            do_set_up_server=False, protocol=config_util.JetsonProtocol.BINARY)
+        self.data = exoboot.Exo.DataContainer()
+        self.data.accel_x = 0.5
+        self.data.gyro_z = -120.25
+        self.data.ankle_angle = 12.5
+
+    def test_binary_request_round_trip(self):
+        message = self.jetson_interface.package_binary_message(
+            side=constants.Side.RIGHT, data=self.data)
+        self.assertEqual(len(message), ml_util.REQUEST_STRUCT.size)
+        side, sequence, _, features = ml_util.decode_request(bytes(message))
+        self.assertEqual(side, 1)
+        self.assertEqual(sequence, 0)
+        self.assertEqual(features[0], 0.5)
+        self.assertEqual(features[5], -120.25)
+        self.assertEqual(features[6], 12.5)
+        self.jetson_interface.package_binary_message(
+            side=constants.Side.RIGHT, data=self.data)
+        self.assertEqual(self.jetson_interface.sequence, 2)
+
+    def test_parse_binary(self):
+        message = (ml_util.encode_reply(side=0, sequence=3, send_time=1.0, gait_phase=0.25, is_stance=True) +
+                   ml_util.encode_reply(side=1, sequence=4, send_time=1.0, gait_phase=0.75, is_stance=False))
+        self.jetson_interface.parse_binary(message)
+        self.assertEqual(self.jetson_interface.get_most_recent_gait_phase(
+            side=constants.Side.LEFT), (0.25, 1))
+        self.assertEqual(self.jetson_interface.get_most_recent_gait_phase(
+            side=constants.Side.RIGHT), (0.75, 0))
+        self.assertEqual(self.jetson_interface.num_malformed_messages, 0)
+
+    def test_parse_binary_split_and_garbage(self):
+        message = (ml_util.encode_reply(side=0, sequence=3, send_time=1.0, gait_phase=0.25, is_stance=True) +
+                   ml_util.encode_reply(side=1, sequence=4, send_time=1.0, gait_phase=0.75, is_stance=False))
+        # Split mid-reply: nothing until the rest arrives
+        self.jetson_interface.parse_binary(message[:7])
+        self.assertIsNone(self.jetson_interface.get_most_recent_prediction(side=constants.Side.LEFT))
+        self.jetson_interface.parse_binary(message[7:30])
+        self.assertEqual(self.jetson_interface.get_most_recent_gait_phase(
+            side=constants.Side.LEFT), (0.25, 1))
+        self.jetson_interface.parse_binary(message[30:])
+        self.assertEqual(self.jetson_interface.get_most_recent_gait_phase(
+            side=constants.Side.RIGHT), (0.75, 0))
+        self.assertEqual(self.jetson_interface.num_malformed_messages, 0)
+        # Garbage between replies costs one malformed count, then resyncs
+        self.jetson_interface.parse_binary(b'\x07\xff\x00' + ml_util.encode_reply(
+            side=0, sequence=5, send_time=1.0, gait_phase=0.5, is_stance=False))
+        self.assertEqual(self.jetson_interface.get_most_recent_gait_phase(
+            side=constants.Side.LEFT), (0.5, 0))
+        self.assertEqual(self.jetson_interface.num_malformed_messages, 1)
+
+    def test_out_of_order_replies_and_latency(self):
+        send_time = time.perf_counter()
+        self.jetson_interface.parse_binary(ml_util.encode_reply(
+            side=0, sequence=5, send_time=send_time, gait_phase=0.3, is_stance=True))
+        self.jetson_interface.parse_binary(ml_util.encode_reply(
+            side=0, sequence=4, send_time=send_time, gait_phase=0.2, is_stance=True))
+        prediction = self.jetson_interface.get_most_recent_prediction(
+            side=constants.Side.LEFT)
+        self.assertEqual(prediction.sequence, 5)
+        self.assertEqual(self.jetson_interface.num_out_of_order_replies, 1)
+        latency_stats = self.jetson_interface.get_latency_stats()
+        self.assertEqual(latency_stats.count, 1)
+        self.assertGreaterEqual(latency_stats.mean, 0)
+
+    def test_window_request_round_trip(self):
+        rng = np.random.default_rng(1)
+        window = np.cumsum(rng.normal(size=(20, 8)), axis=0) * [0.1, 0.1, 0.1, 50, 50, 50, 2, 50]
+        message = ml_util.encode_window_request(
+            side=constants.Side.RIGHT, sequence=7, send_time=2.5, window=window)
+        self.assertEqual(len(message), ml_util.get_window_request_size(message))
+        self.assertLess(len(message), window.size * 4)  # Smaller than float32
+        side, sequence, send_time, decoded = ml_util.decode_window_request(message)
+        self.assertEqual((side, sequence, send_time), (1, 7, 2.5))
+        np.testing.assert_allclose(decoded, window, rtol=0, atol=ml_util.FEATURE_QUANTA.max()/2)
+        # Deltas too large for int16 fall back to int32, still exactly decoded
+        window[5, 3] = 1e6
+        _, _, _, decoded = ml_util.decode_window_request(ml_util.encode_window_request(
+            side=constants.Side.RIGHT, sequence=8, send_time=2.5, window=window))
+        np.testing.assert_allclose(decoded, window, rtol=0, atol=ml_util.FEATURE_QUANTA.max()/2)
+
+    def test_window_encoder_reuses_buffer(self):
+        rng = np.random.default_rng(2)
+        window = np.cumsum(rng.normal(size=(10, 8)), axis=0) * [0.1, 0.1, 0.1, 50, 50, 50, 2, 50]
+        encoder = ml_util.WindowRequestEncoder(window_size=10)
+        first = encoder.encode(side=constants.Side.LEFT, sequence=3, send_time=1.5, window=window)
+        self.assertEqual(bytes(first), ml_util.encode_window_request(
+            side=constants.Side.LEFT, sequence=3, send_time=1.5, window=window))
+        window[5, 3] = 1e6  # Now needs int32 deltas
+        second = encoder.encode(side=constants.Side.LEFT, sequence=4, send_time=1.5, window=window)
+        self.assertIs(second.obj, first.obj)  # Same preallocated buffer
+        self.assertGreater(len(second), len(first))
+        _, sequence, _, decoded = ml_util.decode_window_request(second)
+        self.assertEqual(sequence, 4)
+        np.testing.assert_allclose(decoded, window, rtol=0, atol=ml_util.FEATURE_QUANTA.max()/2)
+
+    def test_parse_text(self):
+        self.jetson_interface = ml_util.JetsonInterface(
+            do_set_up_server=False, protocol=config_util.JetsonProtocol.TEXT)
+        self.jetson_interface.parse('!0,0.25,1.0!1,0.7')
+        self.assertEqual(self.jetson_interface.get_most_recent_gait_phase(
+            side=constants.Side.LEFT), (0.25, 1.0))
+        self.assertIsNone(self.jetson_interface.get_most_recent_prediction(side=constants.Side.RIGHT))
+        # A reply is used once its newline or the next reply's '!' arrives
+        self.jetson_interface.parse('5,0.0\n!0,0.3,1')
+        self.assertEqual(self.jetson_interface.get_most_recent_gait_phase(
+            side=constants.Side.RIGHT), (0.75, 0.0))
+        self.assertEqual(self.jetson_interface.get_most_recent_gait_phase(
+            side=constants.Side.LEFT), (0.25, 1.0))
+        self.jetson_interface.parse('\n!0,0.35,0\n')
+        self.assertEqual(self.jetson_interface.get_most_recent_gait_phase(
+            side=constants.Side.LEFT), (0.35, 0.0))
+        self.assertEqual(self.jetson_interface.num_malformed_messages, 0)
+        self.jetson_interface.parse('!0,bad,1!')
+        self.assertEqual(self.jetson_interface.num_malformed_messages, 1)
+
+    def test_text_field_split_across_reads(self):
+        reply = b'!0,0.25,0.73\n'
+        for split in range(1, len(reply)):
+            with self.subTest(split=split):
+                parser = ml_util.ReplyStreamParser(protocol=config_util.JetsonProtocol.TEXT)
+                replies = []
+                on_reply = lambda *reply: replies.append(reply[:3])
+                parser.feed(reply[:split])
+                parser.parse(on_reply)
+                self.assertEqual(replies, [])
+                parser.feed(reply[split:])
+                parser.parse(on_reply)
+                self.assertEqual(replies, [(0, 0.25, 0.73)])
+                self.assertEqual(parser.num_malformed_frames, 0)
+
+    def test_text_recv_time_is_first_chunk(self):
+        parser = ml_util.ReplyStreamParser(protocol=config_util.JetsonProtocol.TEXT)
+        replies = []
+        on_reply = lambda *reply: replies.append(reply)
+        parser.feed(b'!0,0.25,1!1,0.', recv_time=1.0)
+        parser.parse(on_reply)
+        self.assertEqual(replies, [(0, 0.25, 1.0, None, None, 1.0)])
+        parser.feed(b'75,', recv_time=2.0)
+        parser.parse(on_reply)
+        self.assertEqual(len(replies), 1)
+        parser.feed(b'0!0,0.5,1', recv_time=3.0)
+        parser.parse(on_reply)
+        self.assertEqual(replies[1:], [(1, 0.75, 0.0, None, None, 1.0)])
+        parser.feed(b'\n', recv_time=4.0)
+        parser.parse(on_reply)
+        self.assertEqual(replies[2:], [(0, 0.5, 1.0, None, None, 3.0)])
+
+    def test_text_replies_matched_to_requests(self):
+        self.jetson_interface = ml_util.JetsonInterface(
+            do_set_up_server=False, protocol=config_util.JetsonProtocol.TEXT)
+        sent = []
+        self.jetson_interface.clienttcp = SimpleNamespace(to_server=lambda msg: sent.append(msg))
+        for side in [constants.Side.LEFT, constants.Side.LEFT, constants.Side.RIGHT]:
+            self.jetson_interface.package_and_send_message(side=side, data_container=self.data)
+        self.assertEqual(len(sent), 3)
+        left_requests, right_requests = [
+            list(pending_requests)
+            for pending_requests in self.jetson_interface.reply_sink.pending_text_requests]
+        self.assertEqual([sequence for sequence, _ in left_requests], [0, 1])
+        self.assertEqual([sequence for sequence, _ in right_requests], [2])
+        # Each reply takes the sequence and send time of its side's oldest unanswered request
+        self.jetson_interface.parse('!1,0.75,0\n!0,0.25,1\n')
+        for side, request in [(constants.Side.LEFT, left_requests[0]),
+                              (constants.Side.RIGHT, right_requests[0])]:
+            prediction = self.jetson_interface.get_most_recent_prediction(side=side)
+            self.assertEqual((prediction.sequence, prediction.send_time), request)
+            self.assertGreaterEqual(prediction.recv_time, prediction.send_time)
+        self.jetson_interface.parse('!0,0.3,1\n')
+        prediction = self.jetson_interface.get_most_recent_prediction(side=constants.Side.LEFT)
+        self.assertEqual((prediction.sequence, prediction.send_time), left_requests[1])
+        self.assertEqual(self.jetson_interface.get_latency_stats().count, 3)
+        # A reply with no request waiting (e.g., to one sent before a reconnect) has no send time
+        t0 = time.perf_counter()
+        self.jetson_interface.reply_sink.feed(b'!0,0.5,1\n', recv_time=t0 - 0.2)
+        prediction = self.jetson_interface.get_most_recent_prediction(side=constants.Side.LEFT)
+        self.assertEqual((prediction.gait_phase, prediction.recv_time), (0.5, t0 - 0.2))
+        self.assertIsNone(prediction.send_time)
+        self.assertEqual(self.jetson_interface.get_latency_stats().count, 3)
+
+    def test_reset_drops_partial_frame(self):
+        parser = ml_util.ReplyStreamParser(protocol=config_util.JetsonProtocol.BINARY)
+        replies = []
+        reply = ml_util.encode_reply(side=0, sequence=2, send_time=1.0, gait_phase=0.5, is_stance=True)
+        parser.feed(ml_util.encode_reply(
+            side=1, sequence=1, send_time=1.0, gait_phase=0.9, is_stance=False)[:10])
+        parser.reset()
+        parser.feed(reply)
+        parser.parse(lambda *reply: replies.append(reply))
+        self.assertEqual([reply[:5] for reply in replies], [(0, 0.5, 1, 2, 1.0)])
+        self.assertEqual(parser.num_malformed_frames, 0)
+
+
+class Test_PredictionSlot(unittest.TestCase):
+
+    def test_read(self):
+        slot = ml_util.PredictionSlot()
+        self.assertIsNone(slot.read())
+        slot.write(gait_phase=0.9, is_stance=False, sequence=1, send_time=1.0, recv_time=1.01)
+        prediction = slot.read()
+        self.assertEqual(prediction, ml_util.Prediction(0.9, False, 1, 1.0, 1.01))
+        self.assertIs(slot.read(), prediction)  # Unchanged: same object
+        for sequence, gait_phase in enumerate([0.1, 0.2, 0.3], start=2):
+            slot.write(gait_phase=gait_phase, is_stance=True, sequence=sequence,
+                       send_time=1.0, recv_time=1.01)
+        self.assertEqual(slot.read().sequence, 4)
+
+    def test_torn_read_returns_last_consistent(self):
+        slot = ml_util.PredictionSlot()
+        slot.write(gait_phase=0.5, is_stance=True, sequence=1, send_time=1.0, recv_time=1.01)
+        prediction = slot.read()
+        slot.version += 1  # As if the writer were mid-write
+        slot.gait_phase = 0.6
+        self.assertIs(slot.read(), prediction)
+
+    def test_read_history(self):
+        slot = ml_util.PredictionSlot(history_size=4)
+        out = np.zeros(3)
+        self.assertEqual(slot.read_history(out), 0)
+        for sequence, gait_phase in enumerate([0.1, 0.2], start=1):
+            slot.write(gait_phase=gait_phase, is_stance=True, sequence=sequence,
+                       send_time=1.0, recv_time=1.01)
+        self.assertEqual(slot.read_history(out), 2)
+        np.testing.assert_array_equal(out[:2], [0.1, 0.2])
+        for sequence, gait_phase in enumerate([0.3, 0.4, 0.5], start=3):
+            slot.write(gait_phase=gait_phase, is_stance=True, sequence=sequence,
+                       send_time=1.0, recv_time=1.01)
+        self.assertEqual(slot.read_history(out), 3)  # Wrapped around the ring
+        np.testing.assert_array_equal(out, [0.3, 0.4, 0.5])
+        slot.version += 1  # As if the writer were mid-write
+        self.assertEqual(slot.read_history(out), 0)
+        # Off by default
+        self.assertEqual(ml_util.PredictionSlot().read_history(out), 0)
+
+    def test_read_history_retries_if_written_during_copy(self):
+        slot = ml_util.PredictionSlot(history_size=4)
+        for i in range(6):
+            slot.write(gait_phase=float(i), is_stance=True, sequence=i, send_time=1.0,
+                       recv_time=1.01)
+
+        class WrittenDuringCopy(np.ndarray):
+            def __getitem__(self, index):
+                # The writer thread runs between the two halves of the wrapped copy, once
+                if not writes_left:
+                    return super().__getitem__(index)
+                writes_left.pop()
+                window = np.array(super().__getitem__(index))
+                slot.write(gait_phase=6.0, is_stance=True, sequence=6, send_time=1.0,
+                           recv_time=1.01)
+                return window
+        writes_left = [True]
+        slot.phase_history = slot.phase_history.view(WrittenDuringCopy)
+        out = np.zeros(3)
+        # The write lands mid-copy, so the copy is retried, and the newest window returned
+        self.assertEqual(slot.read_history(out), 3)
+        np.testing.assert_array_equal(out, [4.0, 5.0, 6.0])
+        self.assertFalse(writes_left)
+
+
+class Test_LocalGaitPhaseModel(unittest.TestCase):
+
+    def test_matches_reference_and_round_trips(self):
+        rng = np.random.default_rng(0)
+        window_size = 3
+        weights = [rng.normal(size=(8*window_size, 16)), rng.normal(size=(16, 2))]
+        biases = [rng.normal(size=16), rng.normal(size=2)]
+        feature_mean = rng.normal(size=8*window_size)
+        feature_std = 1 + rng.random(size=8*window_size)
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder, 'model.npz')
+            ml_util.save_local_model(filename, weights=weights, biases=biases,
+                                     window_size=window_size,
+                                     feature_mean=feature_mean, feature_std=feature_std)
+            local_model = ml_util.LocalGaitPhaseModel.from_file(filename)
+
+        data = exoboot.Exo.DataContainer()
+        feature_history = util.FeatureHistory(size=4)
+        samples = rng.normal(size=(5, 8))
+        for i, sample in enumerate(samples):
+            (data.accel_x, data.accel_y, data.accel_z, data.gyro_x, data.gyro_y,
+             data.gyro_z, data.ankle_angle, data.ankle_velocity) = sample
+            feature_history.update(data)
+            if i < window_size - 1:
+                self.assertIsNone(local_model.predict(feature_history))
+        gait_phase, is_stance = local_model.predict(feature_history)
+
+        x = (samples[-window_size:].reshape(-1) - feature_mean) / feature_std
+        hidden = np.maximum(x @ weights[0] + biases[0], 0)
+        expected = hidden @ weights[1] + biases[1]
+        self.assertAlmostEqual(gait_phase, expected[0])
+        self.assertEqual(is_stance, expected[1] > 0)
+
+
+class Test_JetsonIOThread(unittest.TestCase):
+
+    def test_round_trip_and_reconnect(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        port = listener.getsockname()[1]
+        jetson_interface = ml_util.JetsonInterface(
+            server_ip='127.0.0.1', recv_port=port, protocol=config_util.JetsonProtocol.BINARY,
+            use_io_thread=True)
+        data = exoboot.Exo.DataContainer()
+        for _ in range(2):  # Second pass checks the client reconnects
+            conn, _ = listener.accept()
+            jetson_interface.package_and_send_message(
+                side=constants.Side.LEFT, data_container=data)
+            side, sequence, send_time, _ = ml_util.decode_request(
+                conn.recv(ml_util.REQUEST_STRUCT.size, socket.MSG_WAITALL))
+            conn.sendall(ml_util.encode_reply(
+                side=side, sequence=sequence, send_time=send_time, gait_phase=0.5, is_stance=True))
+            t0 = time.perf_counter()
+            while time.perf_counter() - t0 < 2:
+                prediction = jetson_interface.get_most_recent_prediction(
+                    side=constants.Side.LEFT)
+                if prediction is not None and prediction.sequence == sequence:
+                    break
+                time.sleep(0.001)
+            self.assertEqual(prediction.sequence, sequence)
+            self.assertEqual(prediction.gait_phase, 0.5)
+            self.assertLess(prediction.recv_time - prediction.send_time, 2)
+            conn.close()
+        # The listener's backlog may already have accepted a third connection
+        self.assertGreaterEqual(jetson_interface.io_thread.num_reconnects, 2)
+        jetson_interface.close()
+        listener.close()
+
+    def test_connection_dropped_mid_frame(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        io_thread = ml_util.JetsonIOThread(
+            server_ip='127.0.0.1', recv_port=listener.getsockname()[1],
+            protocol=config_util.JetsonProtocol.BINARY, reconnect_interval=0.05)
+        conn, _ = listener.accept()
+        conn.sendall(ml_util.encode_reply(
+            side=0, sequence=1, send_time=1.0, gait_phase=0.9, is_stance=False)[:10])
+        time.sleep(0.05)
+        conn.close()
+        conn, _ = listener.accept()
+        conn.sendall(ml_util.encode_reply(
+            side=0, sequence=2, send_time=1.0, gait_phase=0.5, is_stance=True))
+        t0 = time.perf_counter()
+        while io_thread.get_prediction(side=constants.Side.LEFT) is None and \
+                time.perf_counter() - t0 < 2:
+            time.sleep(0.001)
+        prediction = io_thread.get_prediction(side=constants.Side.LEFT)
+        self.assertEqual((prediction.sequence, prediction.gait_phase), (2, 0.5))
+        self.assertEqual(io_thread.num_malformed_messages, 0)
+        io_thread.stop()
+        io_thread.join()
+        conn.close()
+        listener.close()
+
+
+    def test_overwritten_window_not_sent(self):
+        io_thread = ml_util.JetsonIOThread(
+            server_ip='127.0.0.1', recv_port=1, protocol=config_util.JetsonProtocol.BINARY,
+            connect_timeout=0.01, window_size=2)
+        io_thread.stop()
+        io_thread.join()
+        sent = []
+        io_thread.clienttcp = SimpleNamespace(to_server_bytes=lambda msg: sent.append(bytes(msg)))
+        encode = io_thread._window_encoder.encode
+
+        def encode_while_posting(**kwargs):
+            # The control loop posts (reusing ring arrays) while this window is encoded
+            for _ in range(ml_util.WINDOW_RING_SIZE - 1):
+                io_thread.post_features(side=constants.Side.LEFT, send_time=2.0,
+                                        features=np.ones((2, 8)))
+            io_thread._window_encoder.encode = encode
+            return encode(**kwargs)
+        io_thread._window_encoder.encode = encode_while_posting
+        io_thread.post_features(side=constants.Side.LEFT, send_time=1.0, features=np.zeros((2, 8)))
+        io_thread._send_new_features()
+        self.assertEqual(sent, [])
+        io_thread._send_new_features()  # Sends the newest window instead
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(ml_util.decode_window_request(sent[0])[2], 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+'''Drives MLGaitStateEstimator through a MockJetsonServer, reporting loop timing and prediction age.
+
+Example: python mock_jetson_benchmark.py --latency 0.005 --jitter 0.01 --drop 0.05 --seconds 10'''
+import argparse
+import time
+
+import config_util
+import constants
+import exoboot
+import gait_state_estimators
+import ml_util
+import mock_jetson_server
+import util
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark MLGaitStateEstimator against a mock Jetson')
+    parser.add_argument('--latency', type=float, default=0.005, help='s')
+    parser.add_argument('--jitter', type=float, default=0.005, help='s')
+    parser.add_argument('--drop', type=float, default=0, help='drop probability')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--freq', type=float, default=config_util.ConfigurableConstants.TARGET_FREQ)
+    parser.add_argument('--no_io_thread', action='store_true',
+                        help='send/receive inline on the control loop, as before JetsonIOThread')
+    parser.add_argument('--binary', action='store_true', help='use the BINARY protocol')
+    parser.add_argument('--window', type=int, default=0, help='samples per window request (0=off)')
+    args = parser.parse_args()
+    protocol = config_util.JetsonProtocol.BINARY if args.binary else config_util.JetsonProtocol.TEXT
+
+    mock_server = mock_jetson_server.MockJetsonServer(
+        protocol=protocol, latency=args.latency, jitter=args.jitter,
+        drop_probability=args.drop, seed=0)
+    jetson_interface = ml_util.JetsonInterface(
+        server_ip='127.0.0.1', recv_port=mock_server.port, protocol=protocol,
+        use_io_thread=not args.no_io_thread, window_size=args.window)
+
+    gait_state_estimator_list = []
+    for side in [constants.Side.LEFT, constants.Side.RIGHT]:
+        data = exoboot.Exo.DataContainer(do_include_gen_vars=True)
+        gait_state_estimator_list.append(gait_state_estimators.MLGaitStateEstimator(
+            side=side, data_container=data, jetson_interface=jetson_interface,
+            do_print_heel_strikes=False))
+
+    detect_time_stats = util.RunningStats()  # s per tick, both sides
+    period_stats = util.RunningStats()  # s between ticks
+    age_stats = util.RunningStats()  # s, of the prediction used this tick
+    num_ticks_without_prediction = 0
+    timer = util.FlexibleTimer(target_freq=args.freq)
+    t0 = time.perf_counter()
+    last_tick_time = None
+    while time.perf_counter() - t0 < args.seconds:
+        timer.pause()
+        tick_time = time.perf_counter()
+        if last_tick_time is not None:
+            period_stats.update(tick_time - last_tick_time)
+        last_tick_time = tick_time
+        for gait_state_estimator in gait_state_estimator_list:
+            gait_state_estimator.detect()
+        detect_time_stats.update(time.perf_counter() - tick_time)
+        for gait_state_estimator in gait_state_estimator_list:
+            prediction = jetson_interface.get_most_recent_prediction(
+                side=gait_state_estimator.side)
+            if prediction is None:
+                num_ticks_without_prediction += 1
+            else:
+                age_stats.update(gait_state_estimator.get_age(prediction))
+    jetson_interface.close()
+    mock_server.stop()
+
+    print('io thread:        ', not args.no_io_thread, ' protocol: ', protocol.name)
+    print('detect time (s):  ', detect_time_stats)
+    print('loop period (s):  ', period_stats)
+    print('prediction age (s):', age_stats)
+    print('round trip (s):   ', jetson_interface.get_latency_stats())
+    print('requests: ', mock_server.num_requests, ' dropped: ', mock_server.num_dropped,
+          ' ticks without prediction: ', num_ticks_without_prediction)
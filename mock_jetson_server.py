@@ -0,0 +1,217 @@
+'''Local stand-in for the Jetson gait phase server, for benchmarking without a Jetson.
+
+Answers JetsonInterface requests (BINARY or TEXT protocol) from a scripted or replayed
+gait model, with injectable latency, jitter and dropped replies. Run it from another
+script (see mock_jetson_benchmark.py), or standalone and point JetsonInterface at it:
+    python mock_jetson_server.py --port 8080 --latency 0.01'''
+import argparse
+import heapq
+import random
+import select
+import socket
+import threading
+import time
+from typing import Type
+
+import config_util
+import ml_util
+import tcpip
+
+
+class ScriptedGaitModel():
+    def __init__(self, stride_duration: float = 1.1, stance_fraction: float = 0.6):
+        '''Gait phase from a steady stride clock that starts at the first request.'''
+        self.stride_duration = stride_duration
+        self.stance_fraction = stance_fraction
+        self.t0 = None
+
+    def predict(self, side: int, features):
+        time_now = time.perf_counter()
+        if self.t0 is None:
+            self.t0 = time_now
+        gait_phase = ((time_now - self.t0) / self.stride_duration) % 1
+        return gait_phase, gait_phase < self.stance_fraction
+
+
+class ReplayGaitModel():
+    def __init__(self, gait_phases: list, is_stances: list):
+        '''Replays recorded (gait_phase, is_stance) pairs, one per request per side, looping.'''
+        self.gait_phases = gait_phases
+        self.is_stances = is_stances
+        self.idxs = [0, 0]
+
+    @classmethod
+    def from_csv(cls, filename: str):
+        '''Loads an exo data file, using its gait_phase column (empty = None -> 0).'''
+        import csv
+        gait_phases = []
+        is_stances = []
+        with open(filename, newline='') as f:
+            last_gait_phase = 1
+            is_stance = False
+            for row in csv.DictReader(f):
+                gait_phase = float(row['gait_phase']) if row['gait_phase'] else 0
+                gait_phases.append(gait_phase)
+                # Stance starts at heel strike, ends at toe off
+                if gait_phase < last_gait_phase or row.get('did_heel_strike') == 'True':
+                    is_stance = True
+                elif row.get('did_toe_off') == 'True':
+                    is_stance = False
+                is_stances.append(is_stance)
+                last_gait_phase = gait_phase
+        return cls(gait_phases=gait_phases, is_stances=is_stances)
+
+    def predict(self, side: int, features):
+        idx = self.idxs[side]
+        self.idxs[side] = (idx + 1) % len(self.gait_phases)
+        return self.gait_phases[idx], self.is_stances[idx]
+
+
+class MockJetsonServer(threading.Thread):
+    def __init__(self,
+                 server_ip: str = '127.0.0.1',
+                 recv_port: int = 0,
+                 model=None,
+                 protocol: Type[config_util.JetsonProtocol] = config_util.JetsonProtocol.TEXT,
+                 latency: float = 0,
+                 jitter: float = 0,
+                 drop_probability: float = 0,
+                 seed: int = None,
+                 name='mock-jetson-server'):
+        '''Serves clients, one at a time, on a background thread, built on tcpip.ServerTCP.
+
+        Arguments:
+            recv_port: port to listen on. If 0, the OS picks one; read it from self.port.
+            model: object with predict(side, features) -> (gait_phase, is_stance).
+                Defaults to ScriptedGaitModel().
+            latency: seconds between receiving a request and sending its reply
+            jitter: extra uniformly distributed delay, in [0, jitter] s (TEXT replies stay in order)
+            drop_probability: chance that a request gets no reply'''
+        super().__init__(name=name)
+        self.daemon = True  # Thread property
+        self.model = model if model is not None else ScriptedGaitModel()
+        self.protocol = protocol
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_probability = drop_probability
+        self.random = random.Random(seed)
+        self.num_requests = 0
+        self.num_dropped = 0
+        self.stop_event = threading.Event()
+        self.server = tcpip.ServerTCP(server_ip, recv_port)
+        self.server.listen()
+        self.port = self.server.RECV_PORT
+        self.start()  # Starts the run() function
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+    # This run function overrides the run() function in threading.Thread
+    def run(self):
+        # Clients are served one at a time, and a new one accepted when one disconnects (e.g.,
+        # a JetsonIOThread reconnecting). The timeout lets accept() notice stop().
+        self.server.recv_socket.settimeout(0.1)
+        while not self.stop_event.is_set():
+            try:
+                conn, _ = self.server.recv_socket.accept()
+            except socket.timeout:
+                continue
+            conn.settimeout(None)
+            with conn:
+                try:
+                    self._serve_client(conn)
+                except OSError:  # Client reset the connection
+                    pass
+        self.server.recv_socket.close()
+
+    def _serve_client(self, conn):
+        pending_replies = []  # heap of (send_at, tiebreak, reply bytes)
+        last_send_at = 0
+        buffer = bytearray()
+        while not self.stop_event.is_set():
+            time_now = time.perf_counter()
+            while pending_replies and pending_replies[0][0] <= time_now:
+                _, _, reply = heapq.heappop(pending_replies)
+                conn.sendall(reply)
+            timeout = 0.01
+            if pending_replies:
+                timeout = min(timeout, max(0, pending_replies[0][0] - time_now))
+            if not select.select([conn], [], [], timeout)[0]:
+                continue
+            message = conn.recv(8192)
+            if not message:
+                return  # Client disconnected
+            buffer += message
+            for reply in self._handle_requests(buffer):
+                self.num_requests += 1
+                if self.random.random() < self.drop_probability:
+                    self.num_dropped += 1
+                    continue
+                send_at = time.perf_counter() + self.latency + self.random.uniform(0, self.jitter)
+                if self.protocol == config_util.JetsonProtocol.TEXT:
+                    # A TEXT server answers in order, since replies are matched to requests by order
+                    send_at = max(send_at, last_send_at)
+                    last_send_at = send_at
+                heapq.heappush(pending_replies, (send_at, self.num_requests, reply))
+
+    def _handle_requests(self, buffer: bytearray) -> list:
+        '''Consumes whole requests from the front of buffer, returns their replies.'''
+        replies = []
+        if self.protocol == config_util.JetsonProtocol.BINARY:
+            # Feature requests and window requests, told apart by their first (version) byte
+            start = 0
+            while True:
+                if len(buffer) - start >= ml_util.WINDOW_HEADER_STRUCT.size and \
+                        buffer[start] == ml_util.WINDOW_PROTOCOL_VERSION:
+                    request_size = ml_util.get_window_request_size(buffer[start:])
+                else:
+                    request_size = ml_util.REQUEST_STRUCT.size
+                if len(buffer) - start < request_size:
+                    break
+                request = bytes(buffer[start:start + request_size])
+                start += request_size
+                if request[0] == ml_util.WINDOW_PROTOCOL_VERSION:
+                    side, sequence, send_time, window = ml_util.decode_window_request(request)
+                    features = window[-1]  # Models here only use the newest sample
+                else:
+                    side, sequence, send_time, features = ml_util.decode_request(request)
+                gait_phase, is_stance = self.model.predict(side, features)
+                replies.append(ml_util.encode_reply(
+                    side=side, sequence=sequence, send_time=send_time,
+                    gait_phase=gait_phase, is_stance=is_stance))
+            del buffer[:start]
+        else:
+            # Text requests have no terminator: everything before the last '!' is complete,
+            # and the last one is assumed complete once it has all nine fields
+            text = buffer.decode()
+            requests = text.split('!')[1:]
+            if requests and len(requests[-1].split(',')) < 9:
+                incomplete = '!' + requests.pop()
+            else:
+                incomplete = ''
+            for request in requests:
+                fields = request.split(',')
+                side = int(fields[0])
+                gait_phase, is_stance = self.model.predict(side, [float(i) for i in fields[1:]])
+                replies.append(('!%d,%.5f,%d' % (side, gait_phase, is_stance)).encode())
+            buffer[:] = incomplete.encode()
+        return replies
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mock Jetson gait phase server')
+    parser.add_argument('--ip', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0, help='s')
+    parser.add_argument('--jitter', type=float, default=0, help='s')
+    parser.add_argument('--drop', type=float, default=0, help='drop probability')
+    parser.add_argument('--replay', default=None, help='exo data csv to replay gait_phase from')
+    parser.add_argument('--binary', action='store_true', help='use the BINARY protocol')
+    args = parser.parse_args()
+    model = ReplayGaitModel.from_csv(args.replay) if args.replay else None
+    protocol = config_util.JetsonProtocol.BINARY if args.binary else config_util.JetsonProtocol.TEXT
+    mock_server = MockJetsonServer(server_ip=args.ip, recv_port=args.port, model=model,
+                                   protocol=protocol, latency=args.latency,
+                                   jitter=args.jitter, drop_probability=args.drop)
+    mock_server.join()
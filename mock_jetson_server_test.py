@@ -0,0 +1,106 @@
+import socket
+import time
+import unittest
+
+import config_util
+import constants
+import exoboot
+import ml_util
+import mock_jetson_server
+import util
+
+
+class Test_MockJetsonServer(unittest.TestCase):
+
+    def test_replay_with_latency(self):
+        model = mock_jetson_server.ReplayGaitModel(
+            gait_phases=[0.1, 0.2, 0.3], is_stances=[True, True, False])
+        mock_server = mock_jetson_server.MockJetsonServer(
+            model=model, protocol=config_util.JetsonProtocol.BINARY, latency=0.02)
+        jetson_interface = ml_util.JetsonInterface(
+            server_ip='127.0.0.1', recv_port=mock_server.port, protocol=config_util.JetsonProtocol.BINARY,
+            use_io_thread=True)
+        data = exoboot.Exo.DataContainer()
+        gait_phases = []
+        t0 = time.perf_counter()
+        while len(gait_phases) < 3 and time.perf_counter() - t0 < 2:
+            jetson_interface.package_and_send_message(
+                side=constants.Side.RIGHT, data_container=data)
+            time.sleep(0.03)
+            prediction = jetson_interface.get_most_recent_prediction(
+                side=constants.Side.RIGHT)
+            if prediction is not None and prediction.gait_phase not in gait_phases:
+                gait_phases.append(prediction.gait_phase)
+        jetson_interface.close()
+        mock_server.stop()
+        self.assertEqual([round(gait_phase, 5) for gait_phase in gait_phases], [0.1, 0.2, 0.3])
+        self.assertGreaterEqual(jetson_interface.get_latency_stats().min, 0.02)
+
+    def test_window_requests(self):
+        model = mock_jetson_server.ReplayGaitModel(gait_phases=[0.4], is_stances=[True])
+        mock_server = mock_jetson_server.MockJetsonServer(model=model, protocol=config_util.JetsonProtocol.BINARY)
+        jetson_interface = ml_util.JetsonInterface(
+            server_ip='127.0.0.1', recv_port=mock_server.port, protocol=config_util.JetsonProtocol.BINARY,
+            use_io_thread=True, window_size=4)
+        data = exoboot.Exo.DataContainer()
+        feature_history = util.FeatureHistory(size=4)
+        prediction = None
+        t0 = time.perf_counter()
+        while prediction is None and time.perf_counter() - t0 < 2:
+            feature_history.update(data)
+            jetson_interface.package_and_send_message(
+                side=constants.Side.LEFT, data_container=data, feature_history=feature_history)
+            time.sleep(0.01)
+            prediction = jetson_interface.get_most_recent_prediction(side=constants.Side.LEFT)
+        jetson_interface.close()
+        mock_server.stop()
+        self.assertIsNotNone(prediction)
+        self.assertAlmostEqual(prediction.gait_phase, 0.4, places=5)
+        self.assertGreaterEqual(prediction.sequence, 0)
+
+
+    def test_default_protocol_is_text(self):
+        # Every Jetson server speaks TEXT, so the defaults work without configuration
+        self.assertEqual(config_util.ConfigurableConstants().JETSON_PROTOCOL,
+                         config_util.JetsonProtocol.TEXT)
+        model = mock_jetson_server.ReplayGaitModel(gait_phases=[0.6], is_stances=[False])
+        mock_server = mock_jetson_server.MockJetsonServer(model=model)
+        jetson_interface = ml_util.JetsonInterface(
+            server_ip='127.0.0.1', recv_port=mock_server.port, use_io_thread=True)
+        data = exoboot.Exo.DataContainer()
+        prediction = None
+        t0 = time.perf_counter()
+        while prediction is None and time.perf_counter() - t0 < 2:
+            jetson_interface.package_and_send_message(side=constants.Side.LEFT, data_container=data)
+            time.sleep(0.01)
+            prediction = jetson_interface.get_most_recent_prediction(side=constants.Side.LEFT)
+        jetson_interface.close()
+        mock_server.stop()
+        self.assertAlmostEqual(prediction.gait_phase, 0.6, places=5)
+        # Matched to its request by the reply sink, though TEXT replies do not echo it
+        self.assertLessEqual(prediction.send_time, prediction.recv_time)
+
+
+    def test_serves_reconnecting_clients(self):
+        model = mock_jetson_server.ReplayGaitModel(gait_phases=[0.25], is_stances=[True])
+        mock_server = mock_jetson_server.MockJetsonServer(model=model)
+        for _ in range(2):
+            client = socket.create_connection(('127.0.0.1', mock_server.port), timeout=2)
+            client.sendall(ml_util.encode_text_request(side=constants.Side.RIGHT,
+                                                       features=[0] * 8).encode())
+            self.assertEqual(client.recv(64), b'!1,0.25000,1')
+            client.close()
+        mock_server.stop()
+        self.assertFalse(mock_server.is_alive())
+        self.assertEqual(mock_server.num_requests, 2)
+
+    def test_stop_without_client(self):
+        mock_server = mock_jetson_server.MockJetsonServer()
+        t0 = time.perf_counter()
+        mock_server.stop()
+        self.assertFalse(mock_server.is_alive())
+        self.assertLess(time.perf_counter() - t0, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
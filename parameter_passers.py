@@ -1,4 +1,7 @@
+import json
+import socket
 import threading
+import time
 from typing import Type
 import config_util
 
@@ -55,15 +58,18 @@ class ParameterPasser(threading.Thread):
                 msg_content = msg[1:-1]
 
                 if first_letter == 'v':
+                    # v<rise fraction>,<peak torque>,<peak fraction>,<fall fraction>!, both sides
                     param_list = [float(x) for x in msg_content.split(',')]
-                    if len(param_list) != 5:
-                        print('Must send five spline points with v<>! message')
+                    if len(param_list) != 4:
+                        print('Must send four spline points with v<>! message')
                     else:
                         self.config.RISE_FRACTION = param_list[0]
                         self.config.LEFT_PEAK_TORQUE = param_list[1]
                         self.config.RIGHT_PEAK_TORQUE = param_list[1]
-                        self.config.PEAK_FRACTION = param_list[2]
-                        self.config.FALL_FRACTION = param_list[3]
+                        self.config.LEFT_PEAK_FRACTION = param_list[2]
+                        self.config.RIGHT_PEAK_FRACTION = param_list[2]
+                        self.config.LEFT_FALL_FRACTION = param_list[3]
+                        self.config.RIGHT_FALL_FRACTION = param_list[3]
                 elif first_letter == 'k':
                     if msg_content.isdigit():
                         self.config.K_VAL = int(msg_content)
@@ -153,3 +159,123 @@ class ParameterPasser(threading.Thread):
 
             else:
                 print('IDK how to interpret your message')
+
+
+class NetworkParameterPasser(threading.Thread):
+    def __init__(self,
+                 lock: Type[threading.Lock],
+                 config: Type[config_util.ConfigurableConstants],
+                 quit_event: Type[threading.Event],
+                 new_params_event: Type[threading.Event],
+                 port: int,
+                 host: str = '127.0.0.1',
+                 ack_timeout: float = 1,
+                 on_external_cost=None,
+                 name='network-parameter-thread'):
+        '''Like ParameterPasser, but takes batches of parameters as JSON over a local TCP socket.
+
+        Each message is one line of JSON, either {"params": {"KEY": value, ...}} or {"quit": true},
+        or {"external_cost": x}, which is passed to on_external_cost(x) (e.g.,
+        HILOptimizer.add_external_cost, for HILCost.EXTERNAL), optionally with an "id" that is
+        echoed back. A batch is checked with
+        config_util.validate_config_updates (only keys that take effect mid-run), then applied
+        all at once under the lock with a single new_params_event, so the controllers are
+        rebuilt once per batch, not once per parameter.
+        Each message gets a one-line JSON reply: {"ok": true, "version": n, "loop_time": t},
+        where t is the loop_time the batch took effect (null if the main loop didn't apply it
+        within ack_timeout), or {"ok": false, "error": "..."}, in which case nothing was applied.
+        One client is served at a time.'''
+        super().__init__(name=name)
+        self.daemon = True  # Thread property
+        self.lock = lock
+        self.config = config
+        self.quit_event = quit_event
+        self.new_params_event = new_params_event
+        self.ack_timeout = ack_timeout
+        self.on_external_cost = on_external_cost
+        self.version = 0  # Number of batches applied
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((host, port))
+        self.server_socket.listen(1)
+        self.server_socket.settimeout(0.5)  # So run() notices quit_event and close()
+        self.port = self.server_socket.getsockname()[1]  # If port=0, the one picked by the OS
+        self.start()  # Starts the run() function
+
+    # This run function overrides the run() function in threading.Thread
+    def run(self):
+        while not self.quit_event.is_set():
+            try:
+                client_socket, _ = self.server_socket.accept()
+            except socket.timeout:
+                continue
+            except OSError:  # Socket closed
+                break
+            try:
+                with client_socket, client_socket.makefile('rw', newline='\n') as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        reply = self.handle_message(line)
+                        f.write(json.dumps(reply) + '\n')
+                        f.flush()
+                        if self.quit_event.is_set():
+                            break
+            except OSError:  # Client disconnected
+                pass
+
+    def handle_message(self, line: str) -> dict:
+        reply = {}
+        try:
+            msg = json.loads(line)
+            if not isinstance(msg, dict):
+                raise ValueError('Message must be a JSON object')
+            if 'id' in msg:
+                reply['id'] = msg['id']
+            if msg.get('quit'):
+                print('Quitting')
+                with self.lock:
+                    self.quit_event.set()
+                reply['ok'] = True
+                return reply
+            if 'external_cost' in msg:
+                self.pass_external_cost(msg['external_cost'])
+                reply['ok'] = True
+                return reply
+            if not isinstance(msg.get('params'), dict):
+                raise ValueError('Message must have "params": {"KEY": value, ...}, '
+                                 '"external_cost": x or "quit": true')
+            updates = config_util.validate_config_updates(msg['params'])
+        except ValueError as err:  # Includes json.JSONDecodeError
+            reply.update(ok=False, error=str(err))
+            return reply
+        with self.lock:
+            # The main loop writes the config (setting config.loop_time) when it applies updates
+            loop_time_before = self.config.loop_time
+            for key, value in updates.items():
+                setattr(self.config, key, value)
+            self.version += 1
+            self.new_params_event.set()
+        print('Parameters updated: ', updates)
+        reply.update(ok=True, version=self.version, loop_time=self.wait_for_ack(loop_time_before))
+        return reply
+
+    def pass_external_cost(self, value):
+        if self.on_external_cost is None:
+            raise ValueError('No external cost expected (needs DO_HIL_OPTIMIZATION with '
+                             'HIL_COST = EXTERNAL)')
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value != value:
+            raise ValueError('"external_cost" must be a number, not ' + repr(value))
+        self.on_external_cost(float(value))
+
+    def wait_for_ack(self, loop_time_before: float):
+        '''Returns the loop_time at which the main loop applied the update, or None on timeout.'''
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < self.ack_timeout:
+            if self.config.loop_time != loop_time_before:
+                return self.config.loop_time
+            time.sleep(0.001)
+        return None
+
+    def close(self):
+        self.server_socket.close()
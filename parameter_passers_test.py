@@ -0,0 +1,97 @@
+import json
+import socket
+import threading
+import time
+import unittest
+
+import config_util
+import parameter_passers
+
+
+class Test_NetworkParameterPasser(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.config = config_util.ConfigurableConstants()
+        self.quit_event = threading.Event()
+        self.new_params_event = threading.Event()
+        self.passer = parameter_passers.NetworkParameterPasser(
+            lock=self.lock, config=self.config, quit_event=self.quit_event,
+            new_params_event=self.new_params_event, port=0)
+        self.num_applies = 0
+        self.stop_event = threading.Event()
+        self.main_loop = threading.Thread(target=self.run_main_loop, daemon=True)
+        self.main_loop.start()
+        self.client = socket.create_connection(('127.0.0.1', self.passer.port))
+        self.client_file = self.client.makefile('rw', newline='\n')
+
+    def tearDown(self):
+        self.stop_event.set()
+        self.main_loop.join()
+        self.client_file.close()
+        self.client.close()
+        self.passer.close()
+
+    def run_main_loop(self):
+        '''Applies new params as main_loop does, with loop_time = 0.01 * tick.'''
+        tick = 0
+        while not self.stop_event.is_set():
+            tick += 1
+            with self.lock:
+                if self.new_params_event.is_set():
+                    self.config.loop_time = 0.01 * tick  # As ConfigSaver.write_data does
+                    self.num_applies += 1
+                    self.new_params_event.clear()
+            time.sleep(0.002)
+
+    def send(self, msg: dict) -> dict:
+        self.client_file.write(json.dumps(msg) + '\n')
+        self.client_file.flush()
+        return json.loads(self.client_file.readline())
+
+    def test_batch_applied_once(self):
+        reply = self.send({'id': 7, 'params': {'RISE_FRACTION': 0.25, 'LEFT_PEAK_TORQUE': 12,
+                                               'SWING_ONLY': True}})
+        self.assertEqual(reply['id'], 7)
+        self.assertTrue(reply['ok'])
+        self.assertEqual(reply['version'], 1)
+        self.assertEqual(reply['loop_time'], self.config.loop_time)
+        self.assertGreater(reply['loop_time'], 0)
+        self.assertEqual(self.num_applies, 1)
+        self.assertEqual(self.config.RISE_FRACTION, 0.25)
+        self.assertEqual(self.config.LEFT_PEAK_TORQUE, 12)
+        self.assertTrue(self.config.SWING_ONLY)
+
+    def test_invalid_batch_applies_nothing(self):
+        reply = self.send({'params': {'RISE_FRACTION': 0.25, 'PEAK_FRACTION': 0.5,
+                                      'SWING_ONLY': 1, 'TASK': 'WALKING'}})
+        self.assertFalse(reply['ok'])
+        self.assertIn('PEAK_FRACTION', reply['error'])
+        self.assertIn('SWING_ONLY', reply['error'])
+        self.assertIn('TASK', reply['error'])
+        self.assertEqual(self.config.RISE_FRACTION, 0.2)
+        self.assertFalse(self.new_params_event.is_set())
+        self.assertFalse(self.send({'params': 'RISE_FRACTION'})['ok'])
+        self.client_file.write('not json\n')
+        self.client_file.flush()
+        self.assertFalse(json.loads(self.client_file.readline())['ok'])
+        self.assertEqual(self.passer.version, 0)
+
+    def test_external_cost(self):
+        reply = self.send({'external_cost': 3.5})
+        self.assertFalse(reply['ok'])  # Nothing set up to take it
+        self.assertIn('HIL_COST', reply['error'])
+        external_costs = []
+        self.passer.on_external_cost = external_costs.append
+        self.assertTrue(self.send({'id': 2, 'external_cost': 3.5})['ok'])
+        self.assertFalse(self.send({'external_cost': 'high'})['ok'])
+        self.assertEqual(external_costs, [3.5])
+        self.assertFalse(self.new_params_event.is_set())
+
+    def test_quit(self):
+        self.assertTrue(self.send({'quit': True})['ok'])
+        self.assertTrue(self.quit_event.is_set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+'''Scripted config changes at set times or strides, for repeatable protocols (e.g., torque ramps).
+
+A schedule is a csv file with the columns trigger, at, key, value:
+
+    trigger,at,key,value
+    time,0,PEAK_TORQUE,5
+    time,60,PEAK_TORQUE,10
+    stride,100,RISE_FRACTION,0.25
+    stride,100,SWING_ONLY,true
+
+trigger is time (at = s of loop_time) or stride (at = number of heel strikes of the first exo).
+value is read as JSON where possible (12, 0.25, true, null, [1, 2]), else as a string, so enum
+fields take the member name. Keys without a LEFT_/RIGHT_ field set both sides. Only keys that
+take effect mid-run (config_util.RUNTIME_CONFIG_KEYS) may be scheduled. Rows with the same
+trigger and at form one batch.
+
+The whole file is checked with config_util.validate_config_updates when loaded, so a typo is
+found before the experiment, not during it, and compiled into one sorted list of batches per
+trigger. The main loop calls ParameterSchedule.update(exo_list) every tick, which only compares
+loop_time and the stride count with the next batch of each list. A due batch is written into
+the config under the shared lock with new_params_event set, like a ParameterPasser update, so
+the main loop applies it with update_ctrl_params_from_config() and the config change log
+records it. Each applied batch is also logged to a _SCHEDULE.csv file.'''
+import csv
+import json
+from dataclasses import fields
+import threading
+import time
+from typing import Type
+
+import config_util
+
+SCHEDULE_FIELDS = ['trigger', 'at', 'key', 'value']
+TRIGGERS = ['time', 'stride']
+
+
+def decode_schedule_value(text: str):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def load_schedule(filename: str) -> dict:
+    '''Returns {trigger: [(at, updates), ...]}, each list sorted by at, from a schedule file.
+
+    Raises ValueError, naming the row, for an unknown trigger or an invalid update.'''
+    config_fields = [config_field.name for config_field in fields(config_util.ConfigurableConstants)]
+    batches = {trigger: {} for trigger in TRIGGERS}
+    with open(filename, newline='') as f:
+        reader = csv.DictReader(f)
+        if reader.fieldnames != SCHEDULE_FIELDS:
+            raise ValueError('Schedule file must have the columns ' + ','.join(SCHEDULE_FIELDS))
+        for row_num, row in enumerate(reader, start=2):
+            trigger = row['trigger'].strip()
+            if trigger not in TRIGGERS:
+                raise ValueError('%s row %d: trigger must be one of %s' % (filename, row_num, TRIGGERS))
+            at = float(row['at']) if trigger == 'time' else int(row['at'])
+            key = row['key'].strip()
+            value = decode_schedule_value(row['value'].strip())
+            if key in config_fields:
+                updates = {key: value}
+            else:
+                updates = {'LEFT_' + key: value, 'RIGHT_' + key: value}
+            try:
+                updates = config_util.validate_config_updates(updates)
+            except ValueError as err:
+                raise ValueError('%s row %d: %s' % (filename, row_num, err))
+            batches[trigger].setdefault(at, {}).update(updates)
+    return {trigger: sorted(batches[trigger].items(), key=lambda batch: batch[0])
+            for trigger in TRIGGERS}
+
+
+class ParameterSchedule():
+    def __init__(self,
+                 lock: Type[threading.Lock],
+                 config: Type[config_util.ConfigurableConstants],
+                 new_params_event: Type[threading.Event],
+                 filename: str,
+                 file_ID: str = None):
+        '''Applies the config changes in a schedule file (see top of file) as they come due.
+
+        If file_ID is given, applied changes are logged to exo_data/<date>_<file_ID>_SCHEDULE.csv.'''
+        self.lock = lock
+        self.config = config
+        self.new_params_event = new_params_event
+        schedule = load_schedule(filename)
+        self.time_batches = schedule['time']
+        self.stride_batches = schedule['stride']
+        self.next_time_idx = 0
+        self.next_stride_idx = 0
+        self.num_strides = 0
+        self.file_ID = file_ID
+        if file_ID is not None:
+            log_filename = 'exo_data/' + time.strftime("%Y%m%d_%H%M_") + file_ID + '_SCHEDULE.csv'
+            self.my_file = open(log_filename, 'w', newline='')
+            self.writer = csv.writer(self.my_file)
+            self.writer.writerow(['loop_time', 'stride', 'trigger', 'at', 'key', 'value'])
+
+    @property
+    def is_done(self):
+        return (self.next_time_idx == len(self.time_batches) and
+                self.next_stride_idx == len(self.stride_batches))
+
+    def update(self, exo_list):
+        '''Called from the main loop each tick, after gait event detection.'''
+        data = exo_list[0].data
+        if data.did_heel_strike:
+            self.num_strides += 1
+        # Batches are sorted, so only the next one of each list needs checking
+        while (self.next_time_idx < len(self.time_batches) and
+               data.loop_time >= self.time_batches[self.next_time_idx][0]):
+            self.apply(data.loop_time, 'time', *self.time_batches[self.next_time_idx])
+            self.next_time_idx += 1
+        while (self.next_stride_idx < len(self.stride_batches) and
+               self.num_strides >= self.stride_batches[self.next_stride_idx][0]):
+            self.apply(data.loop_time, 'stride', *self.stride_batches[self.next_stride_idx])
+            self.next_stride_idx += 1
+
+    def apply(self, loop_time: float, trigger: str, at, updates: dict):
+        with self.lock:
+            for key, value in updates.items():
+                setattr(self.config, key, value)
+            self.new_params_event.set()
+        print('Schedule (%s %s): ' % (trigger, at), updates)
+        if self.file_ID is not None:
+            for key, value in updates.items():
+                self.writer.writerow([loop_time, self.num_strides, trigger, at, key,
+                                      config_util.encode_config_value(value)])
+            self.my_file.flush()
+
+    def close(self):
+        if self.file_ID is not None:
+            self.my_file.close()
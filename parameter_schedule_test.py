@@ -0,0 +1,76 @@
+import os
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+
+import config_util
+import parameter_schedule
+
+SCHEDULE = '''trigger,at,key,value
+time,1.5,PEAK_TORQUE,10
+stride,3,RISE_FRACTION,0.25
+time,0,PEAK_TORQUE,5
+stride,3,SWING_ONLY,true
+time,0,EXPERIMENTER_NOTES,ramp start
+'''
+
+
+class Test_ParameterSchedule(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.temp_dir.name, 'schedule.csv')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_schedule(self, text: str):
+        with open(self.filename, 'w') as f:
+            f.write(text)
+
+    def test_load_schedule(self):
+        self.write_schedule(SCHEDULE)
+        schedule = parameter_schedule.load_schedule(self.filename)
+        self.assertEqual(schedule['time'], [
+            (0, {'LEFT_PEAK_TORQUE': 5, 'RIGHT_PEAK_TORQUE': 5, 'EXPERIMENTER_NOTES': 'ramp start'}),
+            (1.5, {'LEFT_PEAK_TORQUE': 10, 'RIGHT_PEAK_TORQUE': 10})])
+        self.assertEqual(schedule['stride'], [
+            (3, {'RISE_FRACTION': 0.25, 'SWING_ONLY': True})])
+
+    def test_invalid_schedule(self):
+        for text in ['trigger,at,key,value\nstep,1,RISE_FRACTION,0.25\n',
+                     'trigger,at,key,value\ntime,1,RISE_FRACTON,0.25\n',
+                     'trigger,at,key,value\ntime,1,SWING_ONLY,maybe\n',
+                     'trigger,at,key,value\ntime,1,TASK,WALKING\n',
+                     'time,at,key\n']:
+            self.write_schedule(text)
+            with self.assertRaises(ValueError):
+                parameter_schedule.load_schedule(self.filename)
+
+    def test_update(self):
+        self.write_schedule(SCHEDULE)
+        config = config_util.ConfigurableConstants()
+        new_params_event = threading.Event()
+        schedule = parameter_schedule.ParameterSchedule(
+            lock=threading.Lock(), config=config, new_params_event=new_params_event,
+            filename=self.filename)
+        data = SimpleNamespace(loop_time=0, did_heel_strike=False)
+        exo_list = [SimpleNamespace(data=data)]
+        applied_ticks = []
+        for tick in range(300):
+            data.loop_time = 0.01 * tick
+            data.did_heel_strike = tick % 50 == 10
+            schedule.update(exo_list)
+            if new_params_event.is_set():
+                new_params_event.clear()
+                applied_ticks.append(tick)
+        self.assertEqual(applied_ticks, [0, 110, 150])  # Third heel strike is at tick 110
+        self.assertTrue(schedule.is_done)
+        self.assertEqual(config.LEFT_PEAK_TORQUE, 10)
+        self.assertEqual(config.RISE_FRACTION, 0.25)
+        self.assertTrue(config.SWING_ONLY)
+
+
+if __name__ == '__main__':
+    unittest.main()
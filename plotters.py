@@ -1,10 +1,7 @@
-import matplotlib.pyplot as plt
-import pandas as pd
-import exoboot
-import time
-
-
 def save_plot(filename: str, vars_to_plot: list, save=True, max_file_len=24000):
+    # Imported here, at the end of a run, so they don't add to main_loop's startup time
+    import matplotlib.pyplot as plt
+    import pandas as pd
     filenames = [filename+'_LEFT.csv',
                  filename+'_RIGHT.csv']  # LEFT then RIGHT
     sides = ['left', 'right']
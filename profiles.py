@@ -0,0 +1,314 @@
+'''Torque profiles compiled into dense lookup tables, for cheap per-tick evaluation.
+
+Evaluating a scipy pchip object costs tens of microseconds per call (argument
+checking, array creation, interval search). A SplineTable samples the pchip once,
+on a uniform grid, and evaluates by indexing plus linear interpolation, which
+needs no numpy call at all. With the default resolution the error against the
+exact pchip is far below what the exo can resolve (see profiles_test.py).
+
+A ProfileFader cross-fades from one table to the next when the spline changes,
+blending the two tables' arrays directly. Compiled tables are kept in a shared LRU
+ProfileCache, so switching back to a recent setting needs no recompiling. A CurrentTable
+goes one step further, folding Exo.command_torque's clipping, taper and transmission
+ratio into motor current vs. (gait phase, ankle angle).'''
+import array
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Type
+
+import numpy as np
+
+import config_util
+import constants
+
+
+class SplineTable():
+    def __init__(self, spline_x: list, spline_y: list, resolution: float = 0.0005):
+        '''Pchip through (spline_x, spline_y), sampled every resolution (or less) in x.
+
+        Outside [spline_x[0], spline_x[-1]], returns the value at the nearest end.'''
+        self.spline_x = spline_x
+        self.spline_y = spline_y
+        from scipy import interpolate  # Deferred, so importing this module doesn't load scipy
+        self.spline = interpolate.pchip(spline_x, spline_y, extrapolate=False)
+        self.x_start = spline_x[0]
+        self.x_end = spline_x[-1]
+        num_points = max(2, math.ceil((self.x_end - self.x_start) / resolution) + 1)
+        self.x = np.linspace(self.x_start, self.x_end, num_points)
+        self.y = self.spline(self.x)
+        self.y[0] = spline_y[0]  # Exact ends, in case of rounding at the boundaries
+        self.y[-1] = spline_y[-1]
+        self._inv_step = (num_points - 1) / (self.x_end - self.x_start)
+        self._last_idx = num_points - 2
+        self._y_list = self.y.tolist()  # Indexing a list of floats beats indexing numpy
+
+    def __call__(self, x: float) -> float:
+        position = (x - self.x_start) * self._inv_step
+        if position <= 0:
+            return self._y_list[0]
+        idx = int(position)
+        if idx > self._last_idx:
+            return self._y_list[-1]
+        y_list = self._y_list
+        y_low = y_list[idx]
+        return y_low + (position - idx) * (y_list[idx + 1] - y_low)
+
+
+class ProfileCache():
+    def __init__(self, capacity: int = 16):
+        '''Bounded LRU cache of SplineTables, keyed on (spline_x, spline_y, resolution).
+
+        Tables are never modified after compiling, so one can be shared by any number of
+        controllers (e.g., both sides). Guarded by a lock, in case controllers on different
+        threads update at once.'''
+        self.capacity = capacity
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def get(self, spline_x: list, spline_y: list, resolution: float = 0.0005) -> SplineTable:
+        '''Returns the SplineTable for this spline, compiling it on a miss.'''
+        key = (tuple(spline_x), tuple(spline_y), resolution)
+        with self._lock:
+            spline_table = self._tables.get(key)
+            if spline_table is not None:
+                self._tables.move_to_end(key)
+                self.num_hits += 1
+                return spline_table
+            self.num_misses += 1
+        spline_table = SplineTable(list(spline_x), list(spline_y), resolution=resolution)
+        with self._lock:
+            self._tables[key] = spline_table
+            self._tables.move_to_end(key)
+            while len(self._tables) > self.capacity:
+                self._tables.popitem(last=False)  # Least recently used
+        return spline_table
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+            self.num_hits = 0
+            self.num_misses = 0
+
+    def get_hits_and_misses(self):
+        '''Returns (num_hits, num_misses) since creation or the last clear().'''
+        with self._lock:
+            return self.num_hits, self.num_misses
+
+    def __len__(self):
+        return len(self._tables)
+
+    def __str__(self):
+        return 'profile cache: %d hits, %d misses, %d/%d tables' % (
+            self.num_hits, self.num_misses, len(self._tables), self.capacity)
+
+
+# Shared by all spline controllers (both sides)
+profile_cache = ProfileCache()
+
+
+def get_fade_weight(fraction: float, fade_shape: Type[config_util.FadeShape]) -> float:
+    '''Weight of the new profile, given the elapsed fraction (0 to 1) of the fade.'''
+    if fade_shape == config_util.FadeShape.COSINE:
+        return 0.5 - 0.5*math.cos(math.pi*fraction)
+    elif fade_shape == config_util.FadeShape.SMOOTHSTEP:
+        return fraction*fraction*(3 - 2*fraction)
+    else:
+        return fraction
+
+
+class ProfileFader():
+    def __init__(self,
+                 fade_duration: float = 5,
+                 fade_shape: Type[config_util.FadeShape] = config_util.FadeShape.LINEAR):
+        '''Evaluates the current SplineTable, cross-fading from the previous profile after changes.
+
+        On set_profile(), whatever was being commanded at that moment (which, mid-fade, is
+        the blend, not the stale old profile) is resampled onto the new table's grid, once.
+        While fading, each call then interpolates both arrays at one shared grid position and
+        blends them, so evaluation allocates nothing beyond the returned float.'''
+        self.fade_duration = fade_duration
+        self.fade_shape = fade_shape
+        self.profile = None
+        self.fade_start_time = None
+        self._from_list = None  # Previous profile on self.profile's grid, while fading
+        self._from_y = None
+
+    def set_profile(self, profile: Type[SplineTable], do_fade: bool = True):
+        '''Switches to profile, fading from the currently commanded profile if do_fade.'''
+        time_now = time.perf_counter()
+        if self.profile is None or not do_fade or self.fade_duration <= 0:
+            self._end_fade()
+        else:
+            weight = self.get_weight(time_now)
+            if weight is None:
+                current_y = self.profile.y
+            else:
+                current_y = self._from_y + weight*(self.profile.y - self._from_y)
+            if len(profile.x) == len(self.profile.x) and profile.x_start == self.profile.x_start \
+                    and profile.x_end == self.profile.x_end:
+                self._from_y = current_y  # Same grid
+            else:
+                self._from_y = np.interp(profile.x, self.profile.x, current_y)
+            self._from_list = self._from_y.tolist()
+            self.fade_start_time = time_now
+        self.profile = profile
+
+    def get_weight(self, time_now: float):
+        '''Weight of the new profile, or None if not fading.'''
+        if self._from_list is None:
+            return None
+        fraction = (time_now - self.fade_start_time) / self.fade_duration
+        if fraction >= 1:
+            self._end_fade()
+            return None
+        return get_fade_weight(fraction, self.fade_shape)
+
+    def is_fading(self) -> bool:
+        return self.get_weight(time.perf_counter()) is not None
+
+    def _end_fade(self):
+        self._from_list = None
+        self._from_y = None
+
+    def __call__(self, x: float) -> float:
+        profile = self.profile
+        if self._from_list is None:
+            return profile(x)
+        weight = self.get_weight(time.perf_counter())
+        if weight is None:
+            return profile(x)
+        from_list = self._from_list
+        to_list = profile._y_list
+        position = (x - profile.x_start) * profile._inv_step
+        if position <= 0:
+            idx = 0
+            remainder = 0
+        else:
+            idx = int(position)
+            if idx > profile._last_idx:
+                idx = profile._last_idx + 1
+                remainder = 0
+            else:
+                remainder = position - idx
+        from_value = from_list[idx]
+        to_value = to_list[idx]
+        if remainder:
+            from_value += remainder * (from_list[idx + 1] - from_value)
+            to_value += remainder * (to_list[idx + 1] - to_value)
+        return from_value + weight*(to_value - from_value)
+
+
+class CurrentTable():
+    # Exo.command_torque tapers torque to 0 from TAPER_START to TAPER_END deg, and above
+    # TAPER_END only commands a small reel-in current
+    TAPER_START = 40
+    TAPER_END = 45
+
+    def __init__(self,
+                 profile: Type[SplineTable],
+                 TR_from_ankle_angle,
+                 motor_sign: int,
+                 max_allowable_current: int,
+                 phase_resolution: float = 0.001,
+                 angle_resolution: float = 0.25,
+                 max_phase: float = 1):
+        '''Motor current (mA) vs. (gait phase, ankle angle), as Exo.command_torque would command.
+
+        Folds the torque profile, max allowable torque clipping, the 40-45 deg taper (with its
+        reel-in floor), the transmission ratio and the int() truncation into one grid per
+        angle band, so __call__ is a region check plus one bilinear lookup. Bands are split
+        at TAPER_START, where command_torque is discontinuous for the left side, so no cell
+        interpolates across it. Only covers phases up to max_phase (gait phase), clamping
+        beyond; the caller rebuilds it when the profile, max current or calibration changes.'''
+        self.profile = profile
+        self.motor_sign = motor_sign
+        self.max_allowable_current = max_allowable_current
+        self.reel_in_current = motor_sign*1000
+        self.phase_start = profile.x_start
+        phase_end = min(profile.x_end, max_phase)
+        num_phases = max(2, math.ceil((phase_end - self.phase_start) / phase_resolution) + 1)
+        phases = np.linspace(self.phase_start, phase_end, num_phases)
+        self._inv_phase_step = (num_phases - 1) / (phase_end - self.phase_start)
+        self._last_phase_idx = num_phases - 2
+        torques = np.interp(phases, profile.x, profile.y)
+        if np.any(torques < 0):
+            raise ValueError('Cannot apply negative torques')
+
+        self.min_angle = constants.MIN_ANKLE_ANGLE
+        self.main_band = self._build_band(torques, TR_from_ankle_angle, self.min_angle,
+                                          self.TAPER_START, angle_resolution, do_taper=False)
+        self.taper_band = self._build_band(torques, TR_from_ankle_angle, self.TAPER_START,
+                                           self.TAPER_END, angle_resolution, do_taper=True)
+        # Max allowable torque vs. angle, for reporting clipping like command_torque
+        num_angles = math.ceil((self.TAPER_END - self.min_angle) / angle_resolution) + 1
+        self._max_torques = np.maximum(
+            0, motor_sign*max_allowable_current*constants.MOTOR_CURRENT_TO_MOTOR_TORQUE *
+            TR_from_ankle_angle(np.linspace(self.min_angle, self.TAPER_END, num_angles))).tolist()
+        self._inv_max_torque_step = (num_angles - 1) / (self.TAPER_END - self.min_angle)
+
+    def _build_band(self, torques, TR_from_ankle_angle, angle_start: float, angle_end: float,
+                    angle_resolution: float, do_taper: bool):
+        '''Returns (angle_start, currents as a flat row-major array.array (one row per phase),
+        row length, 1/angle step, last angle index with a cell above it).'''
+        num_angles = max(2, math.ceil((angle_end - angle_start) / angle_resolution) + 1)
+        angles = np.linspace(angle_start, angle_end, num_angles)
+        TR = TR_from_ankle_angle(angles)
+        max_torques = np.maximum(0, self.motor_sign*self.max_allowable_current *
+                                 constants.MOTOR_CURRENT_TO_MOTOR_TORQUE*TR)
+        clipped_torques = np.minimum(torques[:, None], max_torques[None, :])
+        if do_taper:
+            clipped_torques = clipped_torques*(angle_end - angles)/(angle_end - angle_start)
+        currents = np.trunc(clipped_torques / TR / constants.MOTOR_CURRENT_TO_MOTOR_TORQUE)
+        if do_taper:
+            currents = np.maximum(self.reel_in_current, currents)
+        inv_angle_step = (num_angles - 1) / (angle_end - angle_start)
+        # array.array indexes as fast as a list, at 8 bytes per entry
+        flat_currents = array.array('d')
+        flat_currents.frombytes(np.ascontiguousarray(currents, dtype=np.float64).tobytes())
+        return angle_start, flat_currents, num_angles, inv_angle_step, num_angles - 2
+
+    def __call__(self, phase: float, ankle_angle: float) -> int:
+        if ankle_angle > self.TAPER_END:
+            return self.reel_in_current
+        if ankle_angle > self.TAPER_START:
+            angle_start, currents, row_length, inv_angle_step, last_angle_idx = self.taper_band
+        else:
+            angle_start, currents, row_length, inv_angle_step, last_angle_idx = self.main_band
+        phase_position = (phase - self.phase_start) * self._inv_phase_step
+        if phase_position <= 0:
+            phase_idx = 0
+            phase_remainder = 0
+        else:
+            phase_idx = int(phase_position)
+            if phase_idx > self._last_phase_idx:
+                phase_idx = self._last_phase_idx
+                phase_remainder = 1
+            else:
+                phase_remainder = phase_position - phase_idx
+        angle_position = (ankle_angle - angle_start) * inv_angle_step
+        if angle_position <= 0:
+            angle_idx = 0
+            angle_remainder = 0
+        else:
+            angle_idx = int(angle_position)
+            if angle_idx > last_angle_idx:
+                angle_idx = last_angle_idx
+                angle_remainder = 1
+            else:
+                angle_remainder = angle_position - angle_idx
+        idx_low = phase_idx*row_length + angle_idx
+        idx_high = idx_low + row_length
+        current_low = currents[idx_low]
+        current_low += angle_remainder*(currents[idx_low + 1] - current_low)
+        current_high = currents[idx_high]
+        current_high += angle_remainder*(currents[idx_high + 1] - current_high)
+        return int(current_low + phase_remainder*(current_high - current_low))
+
+    def get_max_torque(self, ankle_angle: float) -> float:
+        '''Max allowable torque (Nm), at the nearest tabulated ankle angle.'''
+        idx = int(round((ankle_angle - self.min_angle) * self._inv_max_torque_step))
+        return self._max_torques[min(max(idx, 0), len(self._max_torques) - 1)]
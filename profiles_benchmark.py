@@ -0,0 +1,86 @@
+'''Times per-tick torque lookup and cross-fading from tables against exact pchip evaluation.
+
+Run: python profiles_benchmark.py'''
+import timeit
+
+import numpy as np
+from scipy import interpolate
+
+import constants
+import profiles
+
+NUM_TICKS = 20000
+
+if __name__ == '__main__':
+    # Default FourPointSplineController shape, from config_util.ConfigurableConstants
+    spline_x = [0, 0.2, 0.53, 0.60, 10]
+    spline_y = [3, 3, 20, 3, 3]
+    phases = np.random.default_rng(0).random(NUM_TICKS).tolist()
+    spline = interpolate.pchip(spline_x, spline_y, extrapolate=False)
+    spline_table = profiles.SplineTable(spline_x, spline_y)
+    last_spline_table = profiles.SplineTable(spline_x, [3, 3, 10, 3, 3])
+    last_spline = interpolate.pchip(spline_x, [3, 3, 10, 3, 3], extrapolate=False)
+
+    profile_fader = profiles.ProfileFader(fade_duration=1000)
+    profile_fader.set_profile(last_spline_table)
+    profile_fader.set_profile(spline_table)
+
+    def run_pchip():
+        for phase in phases:
+            spline(phase)
+
+    def run_table():
+        for phase in phases:
+            spline_table(phase)
+
+    def run_pchip_fade():
+        for phase in phases:
+            0.5*last_spline(phase) + 0.5*spline(phase)
+
+    def run_fader():
+        for phase in phases:
+            profile_fader(phase)
+
+    for name, fn in [('pchip', run_pchip), ('SplineTable', run_table),
+                     ('pchip fade', run_pchip_fade), ('ProfileFader fade', run_fader)]:
+        seconds = min(timeit.repeat(fn, number=1, repeat=3))
+        print('%-18s %8.3f us/tick' % (name, 1e6*seconds/NUM_TICKS))
+    seconds = min(timeit.repeat(lambda: profiles.SplineTable(spline_x, spline_y), number=20, repeat=3))
+    print('%-18s %8.3f ms' % ('compile table', 1e3*seconds/20))
+    profile_cache = profiles.ProfileCache()
+    profile_cache.get(spline_x, spline_y)
+    seconds = min(timeit.repeat(lambda: profile_cache.get(spline_x, spline_y), number=1000, repeat=3))
+    print('%-18s %8.3f ms' % ('cached table', 1e3*seconds/1000))
+
+    # Torque -> current, as in Exo.command_torque (right side), vs. one CurrentTable lookup
+    TR_from_ankle_angle = interpolate.PchipInterpolator(constants.ANKLE_PTS, constants.TR_PTS)
+    max_allowable_current = 20000
+    angles = np.random.default_rng(1).uniform(-20, 44, NUM_TICKS).tolist()
+
+    def run_command_torque_math():
+        for phase, ankle_angle in zip(phases, angles):
+            desired_torque = spline_table(phase)
+            max_allowable_torque = max(0, max_allowable_current*constants.MOTOR_CURRENT_TO_MOTOR_TORQUE *
+                                       TR_from_ankle_angle(ankle_angle))
+            desired_torque = min(desired_torque, max_allowable_torque)
+            if 40 < ankle_angle <= 45:
+                desired_torque = desired_torque*(45-ankle_angle)/5
+            int(desired_torque / TR_from_ankle_angle(ankle_angle) /
+                constants.MOTOR_CURRENT_TO_MOTOR_TORQUE)
+
+    current_table = profiles.CurrentTable(
+        profile=spline_table, TR_from_ankle_angle=TR_from_ankle_angle, motor_sign=1,
+        max_allowable_current=max_allowable_current)
+
+    def run_current_table():
+        for phase, ankle_angle in zip(phases, angles):
+            current_table(phase, ankle_angle)
+
+    for name, fn in [('torque -> current', run_command_torque_math),
+                     ('CurrentTable', run_current_table)]:
+        seconds = min(timeit.repeat(fn, number=1, repeat=3))
+        print('%-18s %8.3f us/tick' % (name, 1e6*seconds/NUM_TICKS))
+    seconds = min(timeit.repeat(lambda: profiles.CurrentTable(
+        profile=spline_table, TR_from_ankle_angle=TR_from_ankle_angle, motor_sign=1,
+        max_allowable_current=max_allowable_current), number=5, repeat=3))
+    print('%-18s %8.3f ms' % ('build CurrentTable', 1e3*seconds/5))
@@ -0,0 +1,131 @@
+import unittest
+
+import numpy as np
+from scipy import interpolate
+
+import config_util
+import constants
+import profiles
+
+
+class Test_SplineTable(unittest.TestCase):
+
+    def test_matches_pchip_for_four_point_spline_shapes(self):
+        bias_torque = 3
+        # (spline_x, spline_y) as built by FourPointSplineController, with and without peak hold
+        shapes = []
+        for peak_torque in [5, 20, 40]:
+            for peak_fraction, fall_fraction in [(0.45, 0.55), (0.53, 0.60), (0.6, 0.65)]:
+                shapes.append(([0, 0.2, peak_fraction, fall_fraction, 10],
+                               [bias_torque, bias_torque, peak_torque, bias_torque, bias_torque]))
+                shapes.append(([0, 0.2, peak_fraction, peak_fraction + 0.1, fall_fraction + 0.1, 1],
+                               [bias_torque, bias_torque, peak_torque, peak_torque,
+                                bias_torque, bias_torque]))
+        phases = np.linspace(0, 1, 20001)
+        for spline_x, spline_y in shapes:
+            spline_table = profiles.SplineTable(spline_x, spline_y)
+            exact = interpolate.pchip(spline_x, spline_y, extrapolate=False)(phases)
+            from_table = np.array([spline_table(phase) for phase in phases])
+            max_error = np.max(np.abs(from_table - exact))
+            self.assertLess(max_error, 0.01, msg=str((spline_x, spline_y)))  # Nm
+
+    def test_clamps_outside_spline(self):
+        spline_table = profiles.SplineTable([0, 0.2, 0.5, 0.6, 1], [3, 3, 20, 3, 4])
+        self.assertEqual(spline_table(-0.1), 3)
+        self.assertEqual(spline_table(1.5), 4)
+        self.assertIsInstance(spline_table(0.5), float)
+
+
+class Test_ProfileCache(unittest.TestCase):
+
+    def test_lru_and_counts(self):
+        profile_cache = profiles.ProfileCache(capacity=2)
+        spline_x = [0, 0.2, 0.53, 0.6, 10]
+        table_5 = profile_cache.get(spline_x, [3, 3, 5, 3, 3])
+        table_10 = profile_cache.get(spline_x, [3, 3, 10, 3, 3])
+        self.assertIs(profile_cache.get(list(spline_x), [3, 3, 5, 3, 3]), table_5)
+        profile_cache.get(spline_x, [3, 3, 20, 3, 3])  # Evicts table_10, least recently used
+        self.assertIs(profile_cache.get(spline_x, [3, 3, 5, 3, 3]), table_5)
+        self.assertIsNot(profile_cache.get(spline_x, [3, 3, 10, 3, 3]), table_10)
+        self.assertEqual(profile_cache.get_hits_and_misses(), (2, 4))
+        self.assertEqual(len(profile_cache), 2)
+
+
+class Test_ProfileFader(unittest.TestCase):
+
+    def test_fade_and_chained_update(self):
+        spline_x = [0, 0.2, 0.53, 0.6, 10]
+        profile_1 = profiles.SplineTable(spline_x, [3, 3, 10, 3, 3])
+        profile_2 = profiles.SplineTable(spline_x, [3, 3, 20, 3, 3])
+        profile_3 = profiles.SplineTable([0, 0.2, 0.5, 0.6, 1], [3, 3, 30, 3, 3])
+        profile_fader = profiles.ProfileFader(fade_duration=100)
+        profile_fader.set_profile(profile_1)
+        self.assertEqual(profile_fader(0.53), profile_1(0.53))
+        profile_fader.set_profile(profile_2)
+        self.assertAlmostEqual(profile_fader(0.53), 10, places=2)  # Fade just started
+        profile_fader.fade_start_time -= 50
+        self.assertAlmostEqual(profile_fader(0.53), 15, places=2)
+        # Mid-fade update: continues from the blend (15), not from profile_1 (10)
+        profile_fader.set_profile(profile_3)
+        self.assertAlmostEqual(profile_fader(0.53), 15, places=2)
+        profile_fader.fade_start_time -= 50
+        self.assertAlmostEqual(profile_fader(0.53), (15 + profile_3(0.53))/2, places=2)
+        profile_fader.fade_start_time -= 60
+        self.assertEqual(profile_fader(0.53), profile_3(0.53))  # Fade over
+        self.assertIsNone(profile_fader.get_weight(0))
+
+    def test_fade_shapes(self):
+        for fade_shape in config_util.FadeShape:
+            self.assertEqual(profiles.get_fade_weight(0, fade_shape), 0)
+            self.assertAlmostEqual(profiles.get_fade_weight(0.5, fade_shape), 0.5)
+            self.assertAlmostEqual(profiles.get_fade_weight(1, fade_shape), 1)
+        self.assertLess(profiles.get_fade_weight(0.1, config_util.FadeShape.COSINE), 0.1)
+        self.assertLess(profiles.get_fade_weight(0.1, config_util.FadeShape.SMOOTHSTEP), 0.1)
+
+
+class Test_CurrentTable(unittest.TestCase):
+
+    def command_torque_current(self, desired_torque, ankle_angle, TR_from_ankle_angle,
+                               motor_sign, max_allowable_current):
+        '''Current that Exo.command_torque would command (same steps, without an exo).'''
+        TR = TR_from_ankle_angle(ankle_angle)
+        max_allowable_torque = max(
+            0, motor_sign*max_allowable_current*constants.MOTOR_CURRENT_TO_MOTOR_TORQUE*TR)
+        desired_torque = min(desired_torque, max_allowable_torque)
+        reel_in_current = motor_sign*1000
+        if ankle_angle > 45:
+            return reel_in_current
+        elif 40 < ankle_angle <= 45:
+            desired_torque = desired_torque*(45-ankle_angle)/5
+            return max(reel_in_current,
+                       int(desired_torque / TR / constants.MOTOR_CURRENT_TO_MOTOR_TORQUE))
+        return int(desired_torque / TR / constants.MOTOR_CURRENT_TO_MOTOR_TORQUE)
+
+    def test_matches_command_torque(self):
+        max_allowable_current = 20000
+        rng = np.random.default_rng(0)
+        for motor_sign in [-1, 1]:
+            TR_from_ankle_angle = interpolate.PchipInterpolator(
+                constants.ANKLE_PTS, motor_sign*constants.TR_PTS)
+            for peak_torque in [10, 60]:  # Unclipped, and clipped at high angles
+                profile = profiles.SplineTable([0, 0.2, 0.53, 0.6, 10], [3, 3, peak_torque, 3, 3])
+                current_table = profiles.CurrentTable(
+                    profile=profile, TR_from_ankle_angle=TR_from_ankle_angle,
+                    motor_sign=motor_sign, max_allowable_current=max_allowable_current)
+                errors = []
+                for phase, ankle_angle in zip(rng.random(5000), rng.uniform(-60, 80, 5000)):
+                    current = current_table(phase, ankle_angle)
+                    self.assertIsInstance(current, int)
+                    self.assertLessEqual(abs(current), max_allowable_current)
+                    if ankle_angle > 45:
+                        self.assertEqual(current, motor_sign*1000)
+                    errors.append(abs(current - self.command_torque_current(
+                        profile(phase), ankle_angle, TR_from_ankle_angle, motor_sign,
+                        max_allowable_current)))
+                # Only cells straddling a clipping kink differ by more than a few mA
+                self.assertLess(np.percentile(errors, 99), 20)
+                self.assertLess(max(errors), 0.02*max_allowable_current)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+'''Replays ankle angle data through StalkController to compare slack prediction modes.
+
+The Actpack reaches a commanded motor angle some latency after it is sent, by which time
+the ankle has moved on, so slack is off by ankle_to_motor(angle then) - ankle_to_motor(angle
+commanded for). This replays logged (or synthetic) ankle angles through StalkController in
+each config_util.SlackPrediction mode and reports the mean and std of that slack error in
+motor counts. Rows with a commanded_position (position control, i.e., swing) are used if the
+file has that column; each run of them starts with reset=True, as in the state machine.
+
+Run: python slack_prediction_replay.py [exo_data/..._LEFT.csv] [--latency 0.02]'''
+import argparse
+import csv
+from types import SimpleNamespace
+from typing import Type
+
+import numpy as np
+
+import config_util
+import constants
+import controllers
+import filters
+
+
+class ReplayExo():
+    '''Stands in for Exo: holds replayed data, records the ankle angle each command is for.'''
+
+    def __init__(self, side: Type[constants.Side] = constants.Side.LEFT):
+        self.side = side
+        self.data = SimpleNamespace(state_time=0, ankle_angle=0, ankle_velocity=0)
+        self.commanded_ankle_angle = None
+
+    def update_gains(self, **kwargs):
+        pass
+
+    def command_slack(self, desired_slack, ankle_angle=None):
+        self.commanded_ankle_angle = self.data.ankle_angle if ankle_angle is None else ankle_angle
+
+
+def load_segments(filename: str) -> list:
+    '''Returns [(state_times, ankle_angles, ankle_velocities), ...], one per position control run.'''
+    with open(filename, newline='') as f:
+        rows = list(csv.DictReader(f))
+    has_position = 'commanded_position' in rows[0]
+    segments = []
+    segment = []
+    for row in rows:
+        if not has_position or row['commanded_position'] not in ('', 'None'):
+            segment.append((float(row['state_time']), float(row['ankle_angle']),
+                            float(row['ankle_velocity'])))
+        elif segment:
+            segments.append(segment)
+            segment = []
+    if segment:
+        segments.append(segment)
+    return [tuple(np.array(column) for column in zip(*segment)) for segment in segments]
+
+
+def make_synthetic_segments(duration: float = 60, freq: float = 175, stride_duration: float = 1.1,
+                            noise: float = 0.1, seed: int = 0) -> list:
+    '''A gait-like ankle angle (deg) with sensor noise, and Exo's filtered velocity.'''
+    rng = np.random.default_rng(seed)
+    state_times = np.arange(0, duration, 1/freq)
+    phase = 2*np.pi*state_times/stride_duration
+    ankle_angles = 10 + 12*np.sin(phase) + 6*np.sin(2*phase + 1) + 2*np.sin(3*phase + 2) + \
+        rng.normal(scale=noise, size=len(state_times))
+    velocity_filter = filters.Butterworth(N=2, Wn=10, fs=freq)  # As in Exo
+    ankle_velocities = [0]
+    for i in range(1, len(state_times)):
+        ankle_velocities.append(velocity_filter.filter(
+            (ankle_angles[i] - ankle_angles[i-1]) / (state_times[i] - state_times[i-1])))
+    return [(state_times, ankle_angles, np.array(ankle_velocities))]
+
+
+def evaluate(segments: list, prediction: Type[config_util.SlackPrediction], latency: float,
+             actual_latency: float, window: int = 8, order: int = 2,
+             ankle_to_motor_polynomial=constants.LEFT_ANKLE_TO_MOTOR) -> np.ndarray:
+    '''Returns slack errors (motor counts) for each replayed command.'''
+    exo = ReplayExo()
+    controller = controllers.StalkController(
+        exo=exo, desired_slack=0, prediction=prediction, prediction_latency=latency,
+        prediction_window=window, prediction_order=order)
+    slack_errors = []
+    for state_times, ankle_angles, ankle_velocities in segments:
+        arrival_times = state_times + actual_latency
+        for i in range(len(state_times)):
+            if arrival_times[i] > state_times[-1]:
+                break
+            exo.data.state_time = state_times[i]
+            exo.data.ankle_angle = ankle_angles[i]
+            exo.data.ankle_velocity = ankle_velocities[i]
+            controller.command(reset=i == 0)
+            ankle_angle_at_arrival = np.interp(arrival_times[i], state_times, ankle_angles)
+            slack_errors.append(np.polyval(ankle_to_motor_polynomial, ankle_angle_at_arrival) -
+                                np.polyval(ankle_to_motor_polynomial, exo.commanded_ankle_angle))
+    return np.array(slack_errors)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare slack prediction modes in replay')
+    parser.add_argument('filename', nargs='?', default=None,
+                        help='exo data csv (default: synthetic gait)')
+    parser.add_argument('--latency', type=float, default=0.02, help='prediction latency (s)')
+    parser.add_argument('--actual_latency', type=float, default=None,
+                        help='simulated command latency (s), default = --latency')
+    parser.add_argument('--window', type=int, default=8)
+    parser.add_argument('--order', type=int, default=2)
+    args = parser.parse_args()
+    segments = load_segments(args.filename) if args.filename else make_synthetic_segments()
+    actual_latency = args.latency if args.actual_latency is None else args.actual_latency
+    print('Slack error (motor counts) with %.3f s actual latency:' % actual_latency)
+    for prediction in config_util.SlackPrediction:
+        slack_errors = evaluate(segments=segments, prediction=prediction, latency=args.latency,
+                                actual_latency=actual_latency, window=args.window,
+                                order=args.order)
+        print('%-10s mean %8.1f  std %8.1f  var %12.0f' % (
+            prediction.name, np.mean(slack_errors), np.std(slack_errors), np.var(slack_errors)))
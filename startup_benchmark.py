@@ -0,0 +1,34 @@
+'''Times, per task, importing control_muxer and the task's builder in a fresh interpreter.
+
+Each task runs in its own subprocess so that no module is already imported. Also reports
+whether the Jetson stack (ml_util) was loaded and how many modules were.
+
+Run: python startup_benchmark.py'''
+import subprocess
+import sys
+
+import config_util
+
+SCRIPT = '''
+import sys, time
+t0 = time.perf_counter()
+import config_util, control_muxer
+control_muxer.get_task_builder(config_util.Task[sys.argv[1]])
+print(time.perf_counter() - t0, 'ml_util' in sys.modules, len(sys.modules))
+'''
+NUM_RUNS = 5
+
+if __name__ == '__main__':
+    print('%-32s %10s %8s %8s' % ('task', 'best (ms)', 'ml_util', 'modules'))
+    for task in config_util.Task:
+        times = []
+        for _ in range(NUM_RUNS):
+            result = subprocess.run([sys.executable, '-c', SCRIPT, task.name],
+                                    capture_output=True, text=True)
+            if result.returncode != 0:
+                print('%-32s %s' % (task.name, result.stderr.strip().splitlines()[-1]))
+                break
+            import_time, is_ml_loaded, num_modules = result.stdout.split()
+            times.append(float(import_time))
+        else:
+            print('%-32s %10.1f %8s %8s' % (task.name, 1000 * min(times), is_ml_loaded, num_modules))
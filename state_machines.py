@@ -27,7 +27,103 @@ class HighLevelController():
             'update_ctrl_params_from_config() not written yet for this controller')
 
 
-class StandingPerturbationResponse(HighLevelController):
+ANY_STATE = '*'  # Transition source that matches every state
+
+
+def _get_trigger_name(guard) -> str:
+    '''e.g., self._did_heel_strike -> did_heel_strike, timer.check -> DelayTimer.check'''
+    name = guard.__name__.lstrip('_')
+    owner = getattr(guard, '__self__', None)
+    if name == 'check' and owner is not None:
+        return type(owner).__name__ + '.' + name
+    return name
+
+
+class TableStateMachine(HighLevelController):
+    '''Steps through controllers using a transition table, rather than an if/elif chain.'''
+
+    def __init__(self,
+                 exo: Type[Exo],
+                 state_controllers: dict,
+                 transitions: list,
+                 initial_state: str,
+                 reset_on_first_step: bool = False):
+        '''
+        Args:
+            state_controllers: {state name: controllers.Controller commanded in that state}
+            transitions: [(state, guard, next_state, on_enter), ...]. guard() -> bool is called
+                each tick while in state (or any state, if state is ANY_STATE); the first True
+                guard, in table order, moves to next_state and calls on_enter() (if not None).
+                Any transition, including to the same state, resets the controller.
+            initial_state: state name to start in
+            reset_on_first_step: if True, the first step() only resets the initial controller
+
+        The table is compiled into a guard list per state, so each tick only evaluates the
+        current state's outgoing edges. Transitions are appended to exo.transition_log (an
+        event_log.TransitionLog), triggered by the guard's name; the first step() logs a
+        'start' event into the initial state. A self-transition that repeats every tick (e.g.,
+        swing only) still resets the controller each tick, but is only logged on the first.'''
+        self.exo = exo
+        self.state_controllers = state_controllers
+        self.transitions = transitions
+        for state, _, next_state, _ in transitions:
+            if state != ANY_STATE and state not in state_controllers:
+                raise ValueError('Transition from unknown state: ' + str(state))
+            if next_state not in state_controllers:
+                raise ValueError('Transition to unknown state: ' + str(next_state))
+        self.transition_log = exo.transition_log
+        self.state_codes = {state: self.transition_log.get_code(state)
+                            for state in state_controllers}
+        self.start_code = self.transition_log.get_code('start')
+        self.edges = {state: [(guard, next_state, on_enter, self.state_codes[next_state],
+                               self.transition_log.get_code(_get_trigger_name(guard)))
+                              for from_state, guard, next_state, on_enter in transitions
+                              if from_state in (state, ANY_STATE)]
+                      for state in state_controllers}
+        self.state_now = initial_state
+        self.controller_now = state_controllers[initial_state]
+        self.just_starting = True
+        self.reset_on_first_step = reset_on_first_step
+        self._repeating_trigger_code = None  # Trigger of last tick's self-transition, if any
+
+    def update_state(self) -> bool:
+        '''Takes the first transition whose guard is True, returns whether one was taken.'''
+        data = self.exo.data
+        if self.just_starting:
+            self.just_starting = False
+            state_code = self.state_codes[self.state_now]
+            self.transition_log.append(data.loop_time, data.state_time, state_code, state_code,
+                                       self.start_code)
+            if self.reset_on_first_step:
+                return True
+        for guard, next_state, on_enter, next_state_code, trigger_code in self.edges[self.state_now]:
+            if guard():
+                if next_state != self.state_now:
+                    self._repeating_trigger_code = None
+                    do_log = True
+                else:
+                    # Same self-transition as last tick: the controller is still reset
+                    do_log = trigger_code != self._repeating_trigger_code
+                    self._repeating_trigger_code = trigger_code
+                if do_log:
+                    self.transition_log.append(data.loop_time, data.state_time,
+                                               self.state_codes[self.state_now], next_state_code,
+                                               trigger_code)
+                self.state_now = next_state
+                self.controller_now = self.state_controllers[next_state]
+                if on_enter is not None:
+                    on_enter()
+                return True
+        self._repeating_trigger_code = None
+        return False
+
+    def step(self, read_only=False):
+        did_controllers_switch = self.update_state()
+        if not read_only:
+            self.controller_now.command(reset=did_controllers_switch)
+
+
+class StandingPerturbationResponse(TableStateMachine):
     '''Pass through high level controller that implements standing perturbation response.'''
 
     def __init__(self,
@@ -35,40 +131,38 @@ class StandingPerturbationResponse(HighLevelController):
                  standing_controller: Type[controllers.Controller],
                  slip_controller: Type[controllers.Controller],
                  slip_recovery_time: float = 1.5):
-        self.exo = exo
+        '''uses slip detector to detect slip onset, uses timer to stop slip controller.'''
         self.standing_controller = standing_controller
         self.slip_controller = slip_controller
         self.slip_ctrl_timer = util.DelayTimer(delay_time=slip_recovery_time)
-        self.controller_now = self.standing_controller
-
-    def step(self, read_only):
-        '''uses slip detector to detect slip onset, uses timer to stop slip controller.'''
-
-        if self.slip_ctrl_timer.check():
-            if self.exo.side == constants.Side.LEFT:
-                print('slip timeout--moving back now')
-            # If slip controller time has elapsed (goes True) and we need to switch back
-            self.slip_ctrl_timer.reset()
-            self.controller_now = self.standing_controller
-            did_controllers_switch = True
-        elif self.exo.data.did_slip:
-            if self.exo.side == constants.Side.LEFT:
-                print('slip detected, moving to slip controller')
-            self.slip_ctrl_timer.start()
-            self.controller_now = self.slip_controller
-            did_controllers_switch = True
-            print(type(self.slip_controller))
-        else:
-            did_controllers_switch = False
-
-        if not read_only:
-            self.controller_now.command(reset=did_controllers_switch)
+        super().__init__(
+            exo=exo,
+            state_controllers={'standing': standing_controller, 'slip': slip_controller},
+            transitions=[
+                # If slip controller time has elapsed (goes True) and we need to switch back
+                (ANY_STATE, self.slip_ctrl_timer.check, 'standing', self._on_slip_timeout),
+                (ANY_STATE, self._did_slip, 'slip', self._on_slip)],
+            initial_state='standing')
+
+    def _did_slip(self):
+        return self.exo.data.did_slip
+
+    def _on_slip_timeout(self):
+        if self.exo.side == constants.Side.LEFT:
+            print('slip timeout--moving back now')
+        self.slip_ctrl_timer.reset()
+
+    def _on_slip(self):
+        if self.exo.side == constants.Side.LEFT:
+            print('slip detected, moving to slip controller')
+        self.slip_ctrl_timer.start()
+        print(type(self.slip_controller))
 
     def update_ctrl_params_from_config(self, config):
         self.slip_controller.update_ctrl_params_from_config(config=config)
 
 
-class StanceSwingStateMachine(HighLevelController):
+class StanceSwingStateMachine(TableStateMachine):
     '''Unilateral state machine that takes in data, segments strides, and applies controllers'''
 
     def __init__(self,
@@ -79,32 +173,27 @@ class StanceSwingStateMachine(HighLevelController):
         '''A state machine object is associated with an exo, and reads/stores exo data, applies logic to
         determine gait states and phases, chooses the correct controllers, and applies the
         controller.'''
-        self.exo = exo
         self.stance_controller = stance_controller
         self.swing_controller = swing_controller
-        self.controller_now = self.swing_controller
+        super().__init__(
+            exo=exo,
+            state_controllers={'stance': stance_controller, 'swing': swing_controller},
+            transitions=[
+                ('swing', self._did_heel_strike, 'stance', None),
+                (ANY_STATE, self._did_toe_off, 'swing', None)],
+            initial_state='swing')
 
-    def step(self, read_only=False):
-        # Check state machine transition criteria, switching controller_now if criteria are met
-        if (self.controller_now == self.swing_controller and
-            self.exo.data.did_heel_strike and
-                self.exo.data.gait_phase is not None):
-            self.controller_now = self.stance_controller
-            did_controllers_switch = True
-        elif self.exo.data.did_toe_off or self.exo.data.gait_phase is None:
-            self.controller_now = self.swing_controller
-            did_controllers_switch = True
-        else:
-            did_controllers_switch = False
+    def _did_heel_strike(self):
+        return self.exo.data.did_heel_strike and self.exo.data.gait_phase is not None
 
-        if not read_only:
-            self.controller_now.command(reset=did_controllers_switch)
+    def _did_toe_off(self):
+        return self.exo.data.did_toe_off or self.exo.data.gait_phase is None
 
     def update_ctrl_params_from_config(self, config):
         self.stance_controller.update_ctrl_params_from_config(config=config)
 
 
-class StanceSwingReeloutReelinStateMachine(HighLevelController):
+class StanceSwingReeloutReelinStateMachine(TableStateMachine):
     '''Unilateral state machine that takes in data, segments strides, and applies controllers'''
 
     def __init__(self,
@@ -117,49 +206,37 @@ class StanceSwingReeloutReelinStateMachine(HighLevelController):
                  ):
         '''A state machine object is associated with an exo, and reads/stores exo data, applies logic to
         determine gait states and phases, chooses the correct controllers, and applies the
-        controller.'''
-        self.exo = exo
+        controller.
+
+        Stride: swing -> (heel strike) reel_in -> (slack taken up) stance -> (toe off) reel_out
+        -> (slack let out) swing. Transitions are in exo.transition_log.'''
         self.stance_controller = stance_controller
         self.swing_controller = swing_controller
         self.reel_out_controller = reel_out_controller
         self.reel_in_controller = reel_in_controller
-        self.controller_now = self.reel_out_controller
-        self.just_starting = True
         self.swing_only = swing_only
-
-    def step(self, read_only=False):
-        # Check state machine transition criteria, switching controller_now if criteria are met
-        if self.just_starting:
-            self.controller_now = self.reel_out_controller
-            self.just_starting = False
-            did_controllers_switch = True
-        elif self.swing_only:  # for swing only
-            self.controller_now = self.swing_controller
-            did_controllers_switch = True  # update gains every time for now
-        elif (self.controller_now == self.swing_controller and
-              self.exo.data.did_heel_strike and
-                self.exo.data.gait_phase is not None):
-            self.controller_now = self.reel_in_controller
-            did_controllers_switch = True
-            self.exo.data.gen_var1 = 0
-        elif self.controller_now == self.reel_in_controller and self.reel_in_controller.check_completion_status():
-            self.controller_now = self.stance_controller
-            did_controllers_switch = True
-            self.exo.data.gen_var1 = 1
-        elif self.controller_now == self.stance_controller and (self.exo.data.did_toe_off or self.exo.data.gait_phase is None):
-            self.controller_now = self.reel_out_controller
-            did_controllers_switch = True
-            self.exo.data.gen_var1 = 2
-        elif self.controller_now == self.reel_out_controller and self.reel_out_controller.check_completion_status():
-            self.controller_now = self.swing_controller
-            did_controllers_switch = True
-            self.exo.data.gen_var1 = 3
-
-        else:
-            did_controllers_switch = False
-
-        if not read_only:
-            self.controller_now.command(reset=did_controllers_switch)
+        super().__init__(
+            exo=exo,
+            state_controllers={'stance': stance_controller, 'swing': swing_controller,
+                               'reel_out': reel_out_controller, 'reel_in': reel_in_controller},
+            transitions=[
+                # Swing only re-enters swing (and updates gains) every tick
+                (ANY_STATE, self._is_swing_only, 'swing', None),
+                ('swing', self._did_heel_strike, 'reel_in', None),
+                ('reel_in', reel_in_controller.check_completion_status, 'stance', None),
+                ('stance', self._did_toe_off, 'reel_out', None),
+                ('reel_out', reel_out_controller.check_completion_status, 'swing', None)],
+            initial_state='reel_out',
+            reset_on_first_step=True)
+
+    def _is_swing_only(self):
+        return self.swing_only
+
+    def _did_heel_strike(self):
+        return self.exo.data.did_heel_strike and self.exo.data.gait_phase is not None
+
+    def _did_toe_off(self):
+        return self.exo.data.did_toe_off or self.exo.data.gait_phase is None
 
     def update_ctrl_params_from_config(self, config):
         self.stance_controller.update_ctrl_params_from_config(config=config)
@@ -0,0 +1,200 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+import constants
+import event_log
+import state_machines
+
+
+class FakeController():
+    def __init__(self, name, completion_statuses=None):
+        self.name = name
+        self.completion_statuses = completion_statuses
+        self.commands = []
+
+    def command(self, reset=False):
+        self.commands.append(reset)
+
+    def check_completion_status(self):
+        return self.completion_statuses[self.tick]
+
+
+def make_exo():
+    return SimpleNamespace(
+        side=constants.Side.LEFT, transition_log=event_log.TransitionLog(capacity=4096),
+        data=SimpleNamespace(did_heel_strike=False, gait_phase=0, did_toe_off=False,
+                             did_slip=False, loop_time=0, state_time=0))
+
+
+def make_gait_data(num_ticks, seed):
+    '''Random gait events, including missing gait phase, to exercise every edge.'''
+    rng = np.random.default_rng(seed)
+    return {'did_heel_strike': rng.random(num_ticks) < 0.1,
+            'gait_phase': np.where(rng.random(num_ticks) < 0.05, None, 0.5),
+            'did_toe_off': rng.random(num_ticks) < 0.1,
+            'did_slip': rng.random(num_ticks) < 0.02,
+            'reel_in_done': rng.random(num_ticks) < 0.3,
+            'reel_out_done': rng.random(num_ticks) < 0.3,
+            'swing_only': rng.random(num_ticks) < 0.05}
+
+
+# Reference if/elif implementations that the table-driven state machines replaced
+def legacy_reelin_step(sm):
+    if sm.just_starting:
+        sm.controller_now = sm.reel_out_controller
+        sm.just_starting = False
+        did_controllers_switch = True
+    elif sm.swing_only:
+        sm.controller_now = sm.swing_controller
+        did_controllers_switch = True
+    elif (sm.controller_now == sm.swing_controller and sm.exo.data.did_heel_strike and
+          sm.exo.data.gait_phase is not None):
+        sm.controller_now = sm.reel_in_controller
+        did_controllers_switch = True
+    elif sm.controller_now == sm.reel_in_controller and sm.reel_in_controller.check_completion_status():
+        sm.controller_now = sm.stance_controller
+        did_controllers_switch = True
+    elif sm.controller_now == sm.stance_controller and (sm.exo.data.did_toe_off or sm.exo.data.gait_phase is None):
+        sm.controller_now = sm.reel_out_controller
+        did_controllers_switch = True
+    elif sm.controller_now == sm.reel_out_controller and sm.reel_out_controller.check_completion_status():
+        sm.controller_now = sm.swing_controller
+        did_controllers_switch = True
+    else:
+        did_controllers_switch = False
+    sm.controller_now.command(reset=did_controllers_switch)
+
+
+def legacy_stance_swing_step(sm):
+    if (sm.controller_now == sm.swing_controller and sm.exo.data.did_heel_strike and
+            sm.exo.data.gait_phase is not None):
+        sm.controller_now = sm.stance_controller
+        did_controllers_switch = True
+    elif sm.exo.data.did_toe_off or sm.exo.data.gait_phase is None:
+        sm.controller_now = sm.swing_controller
+        did_controllers_switch = True
+    else:
+        did_controllers_switch = False
+    sm.controller_now.command(reset=did_controllers_switch)
+
+
+def legacy_standing_perturbation_step(sm):
+    if sm.slip_ctrl_timer.check():
+        sm.slip_ctrl_timer.reset()
+        sm.controller_now = sm.standing_controller
+        did_controllers_switch = True
+    elif sm.exo.data.did_slip:
+        sm.slip_ctrl_timer.start()
+        sm.controller_now = sm.slip_controller
+        did_controllers_switch = True
+    else:
+        did_controllers_switch = False
+    sm.controller_now.command(reset=did_controllers_switch)
+
+
+class Test_TableStateMachine(unittest.TestCase):
+
+    def replay(self, make_state_machine, legacy_step, num_ticks=3000, seed=0):
+        '''Steps the table-driven and legacy versions side by side on the same data.'''
+        gait_data = make_gait_data(num_ticks, seed)
+        runs = []
+        for use_legacy in [False, True]:
+            exo = make_exo()
+            controller_list = [FakeController('stance'), FakeController('swing'),
+                               FakeController('reel_out', gait_data['reel_out_done']),
+                               FakeController('reel_in', gait_data['reel_in_done'])]
+            state_machine = make_state_machine(exo, *controller_list)
+            controllers_now = []
+            resets = []
+            for tick in range(num_ticks):
+                for controller in controller_list:
+                    controller.tick = tick
+                for key in ['did_heel_strike', 'gait_phase', 'did_toe_off', 'did_slip']:
+                    setattr(exo.data, key, gait_data[key][tick])
+                exo.data.loop_time = exo.data.state_time = 0.01 * tick
+                if hasattr(state_machine, 'swing_only'):
+                    state_machine.swing_only = gait_data['swing_only'][tick]
+                with mock.patch('time.perf_counter', return_value=0.01 * tick):
+                    if use_legacy:
+                        legacy_step(state_machine)
+                    else:
+                        state_machine.step()
+                controllers_now.append(state_machine.controller_now.name)
+                resets.append(state_machine.controller_now.commands[-1])
+            runs.append((controllers_now, [controller.commands for controller in controller_list]))
+            if not use_legacy:
+                events = exo.transition_log.drain()
+        self.assertEqual(runs[0], runs[1])
+        self.assertGreater(len(set(runs[0][0])), 1)  # Transitions happened
+        # Each logged transition matches a controller switch in the legacy run
+        controllers_now = runs[1][0]
+        self.assertEqual(events[0][4], 'start')
+        for loop_time, state_time, from_state, to_state, trigger in events[1:]:
+            tick = round(loop_time / 0.01)
+            self.assertEqual(state_time, loop_time)
+            self.assertEqual(state_machine.state_controllers[to_state].name, controllers_now[tick])
+            if tick > 0:
+                self.assertEqual(state_machine.state_controllers[from_state].name,
+                                 controllers_now[tick - 1])
+        # Every reset is logged, except a self-transition straight after the same one
+        num_repeats = sum(resets[tick] and resets[tick - 1] and
+                          controllers_now[tick] == controllers_now[tick - 1] ==
+                          controllers_now[tick - 2]
+                          for tick in range(2, num_ticks))
+        self.assertEqual(len(events), sum(resets) - num_repeats +
+                         (not state_machine.reset_on_first_step))
+
+    def test_StanceSwingReeloutReelinStateMachine(self):
+        self.replay(lambda exo, stance, swing, reel_out, reel_in:
+                    state_machines.StanceSwingReeloutReelinStateMachine(
+                        exo=exo, stance_controller=stance, swing_controller=swing,
+                        reel_out_controller=reel_out, reel_in_controller=reel_in),
+                    legacy_reelin_step)
+
+    def test_StanceSwingStateMachine(self):
+        self.replay(lambda exo, stance, swing, reel_out, reel_in:
+                    state_machines.StanceSwingStateMachine(
+                        exo=exo, stance_controller=stance, swing_controller=swing),
+                    legacy_stance_swing_step)
+
+    def test_StandingPerturbationResponse(self):
+        self.replay(lambda exo, stance, swing, reel_out, reel_in:
+                    state_machines.StandingPerturbationResponse(
+                        exo=exo, standing_controller=stance, slip_controller=swing,
+                        slip_recovery_time=0.5),
+                    legacy_standing_perturbation_step)
+
+    def test_repeated_self_transition_logged_once(self):
+        exo = make_exo()
+        controller_list = [FakeController(name) for name in ['stance', 'swing', 'reel_out',
+                                                              'reel_in']]
+        state_machine = state_machines.StanceSwingReeloutReelinStateMachine(
+            exo=exo, stance_controller=controller_list[0], swing_controller=controller_list[1],
+            reel_out_controller=controller_list[2], reel_in_controller=controller_list[3],
+            swing_only=True)
+        for tick in range(10):
+            exo.data.loop_time = 0.01 * tick
+            state_machine.swing_only = tick != 5  # One tick off, then on again
+            state_machine.step()
+        self.assertEqual(controller_list[1].commands,
+                         [True, True, True, True, False, True, True, True, True])
+        events = exo.transition_log.drain()
+        self.assertEqual([(event[2], event[3], event[4]) for event in events],
+                         [('reel_out', 'reel_out', 'start'),
+                          ('reel_out', 'swing', 'is_swing_only'),
+                          ('swing', 'swing', 'is_swing_only'),
+                          ('swing', 'swing', 'is_swing_only')])
+        self.assertEqual([round(event[0] / 0.01) for event in events], [0, 1, 2, 6])
+
+    def test_unknown_state(self):
+        with self.assertRaises(ValueError):
+            state_machines.TableStateMachine(
+                exo=make_exo(), state_controllers={'a': FakeController('a')},
+                transitions=[('a', lambda: True, 'b', None)], initial_state='a')
+
+
+if __name__ == '__main__':
+    unittest.main()
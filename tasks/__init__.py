@@ -0,0 +1,4 @@
+'''Task builders, one module per config_util.Task, registered in control_muxer.
+
+Each module has build(exo_list, config) -> (gait_state_estimator_list, state_machine_list),
+and is only imported when its task is selected.'''
@@ -0,0 +1,61 @@
+'''Task.BILATERALSTANDINGPERTURBATION: IMU-based slip detection across both exos, each
+switching from a standing controller to a slip controller. The slip controller helper is
+shared with the sync-based slip task.'''
+from typing import Type
+
+import config_util
+import controllers
+import gait_state_estimators
+import state_machines
+
+
+def get_slip_controller_and_recovery_time(exo, config: Type[config_util.ConfigurableConstants]):
+    '''Returns the slip controller chosen by config.STANCE_CONTROL_STYLE, and how long (s) to
+    apply it. Splines are vs. time (s) since slip detection.'''
+    if config.STANCE_CONTROL_STYLE == config_util.StanceCtrlStyle.GENERICIMPEDANCE:
+        slip_controller = controllers.GenericImpedanceController(
+            exo=exo, setpoint=config.SET_POINT, k_val=config.K_VAL)
+        slip_recovery_time = 1.01  # TODO(maxshep)
+    elif config.STANCE_CONTROL_STYLE in [config_util.StanceCtrlStyle.FOURPOINTSPLINE,
+                                         config_util.StanceCtrlStyle.FIVEPOINTSPLINE]:
+        print('using a spline based controller!')
+        if config.STANCE_CONTROL_STYLE == config_util.StanceCtrlStyle.FIVEPOINTSPLINE:
+            peak_hold_time = 0.1
+        else:
+            peak_hold_time = 0
+        slip_controller = controllers.FourPointSplineController(
+            exo=exo, rise_fraction=config.RISE_FRACTION,
+            left_peak_torque=config.LEFT_PEAK_TORQUE, right_peak_torque=config.RIGHT_PEAK_TORQUE,
+            left_peak_fraction=config.LEFT_PEAK_FRACTION,
+            right_peak_fraction=config.RIGHT_PEAK_FRACTION,
+            left_fall_fraction=config.LEFT_FALL_FRACTION,
+            right_fall_fraction=config.RIGHT_FALL_FRACTION,
+            bias_torque=config.SPLINE_BIAS,
+            use_gait_phase=False,
+            peak_hold_time=peak_hold_time)
+        slip_recovery_time = 0.99
+    else:
+        raise ValueError('STANCE_CONTROL_STYLE not supported for slip tasks: ' +
+                         str(config.STANCE_CONTROL_STYLE))
+    return slip_controller, slip_recovery_time
+
+
+def get_state_machine(exo, config: Type[config_util.ConfigurableConstants]):
+    standing_controller = controllers.GenericImpedanceController(
+        exo=exo, setpoint=10, k_val=100)
+    slip_controller, slip_recovery_time = get_slip_controller_and_recovery_time(
+        exo=exo, config=config)
+    return state_machines.StandingPerturbationResponse(exo=exo,
+                                                       standing_controller=standing_controller,
+                                                       slip_controller=slip_controller,
+                                                       slip_recovery_time=slip_recovery_time)
+
+
+def build(exo_list, config: Type[config_util.ConfigurableConstants]):
+    if len(exo_list) != 2:
+        raise ValueError(
+            'Must have two exos connected for task=BILATERALSTANDINGPERTURBATION')
+    gait_state_estimator_list = [gait_state_estimators.BilateralSlipDetectorIMU(
+        exo_1=exo_list[0], exo_2=exo_list[1])]
+    state_machine_list = [get_state_machine(exo=exo, config=config) for exo in exo_list]
+    return gait_state_estimator_list, state_machine_list
@@ -0,0 +1,23 @@
+'''Task.SLIPDETECTFROMSYNC: slips signalled on the sync line, with a configurable delay.'''
+from typing import Type
+
+import config_util
+import gait_state_estimators
+from tasks import bilateral_standing_perturbation
+
+
+def build(exo_list, config: Type[config_util.ConfigurableConstants]):
+    if len(exo_list) != 2:
+        raise ValueError(
+            'Must have two exos connected for task=SLIPDETECTFROMSYNC')
+    if config.USE_GPIO_EDGE_CALLBACKS:
+        sync_edge_recorder = exo_list[0].sync_detector  # Shared between exos
+    else:
+        sync_edge_recorder = None
+    gait_state_estimator_list = [gait_state_estimators.BilateralSlipDetectorFromSync(
+        exo_1=exo_list[0], exo_2=exo_list[1], delay_ms=config.SLIP_DETECT_DELAY,
+        sync_edge_recorder=sync_edge_recorder)]
+    print('Using sync-based slip detection: use dX! to adjust delay (ms) and pX! to adjust peak torque (Nm)')
+    state_machine_list = [bilateral_standing_perturbation.get_state_machine(exo=exo, config=config)
+                          for exo in exo_list]
+    return gait_state_estimator_list, state_machine_list
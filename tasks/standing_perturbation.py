@@ -0,0 +1,9 @@
+'''Task.STANDINGPERTURBATION: no gait state estimators or state machines, so the exos only
+stream and log data.'''
+from typing import Type
+
+import config_util
+
+
+def build(exo_list, config: Type[config_util.ConfigurableConstants]):
+    return [], []
@@ -0,0 +1,93 @@
+'''Task.WALKING: gyro heel strikes, stride-averaged gait phase, and a reel in/stance/reel
+out/swing state machine. The controller helpers are shared with other walking tasks.'''
+from typing import Type
+
+import config_util
+import controllers
+import filters
+import gait_state_estimators
+import state_machines
+
+
+def get_stance_controller(exo, config: Type[config_util.ConfigurableConstants]):
+    '''Returns the gait phase based stance controller chosen by config.STANCE_CONTROL_STYLE.'''
+    if config.STANCE_CONTROL_STYLE == config_util.StanceCtrlStyle.FOURPOINTSPLINE:
+        return controllers.FourPointSplineController(
+            exo=exo, rise_fraction=config.RISE_FRACTION,
+            left_peak_torque=config.LEFT_PEAK_TORQUE, right_peak_torque=config.RIGHT_PEAK_TORQUE,
+            left_peak_fraction=config.LEFT_PEAK_FRACTION,
+            right_peak_fraction=config.RIGHT_PEAK_FRACTION,
+            left_fall_fraction=config.LEFT_FALL_FRACTION,
+            right_fall_fraction=config.RIGHT_FALL_FRACTION,
+            bias_torque=config.SPLINE_BIAS, use_spline_table=config.USE_SPLINE_TABLE,
+            fade_shape=config.SPLINE_FADE_SHAPE, use_current_table=config.USE_CURRENT_TABLE)
+    elif config.STANCE_CONTROL_STYLE == config_util.StanceCtrlStyle.ITERATIVELEARNINGSPLINE:
+        return controllers.IterativeLearningSplineController(
+            exo=exo, num_bins=config.ILC_NUM_BINS, learning_gain=config.ILC_LEARNING_GAIN,
+            forgetting_factor=config.ILC_FORGETTING_FACTOR,
+            max_correction=config.ILC_MAX_CORRECTION,
+            max_stride_duration_change=config.ILC_MAX_STRIDE_DURATION_CHANGE,
+            rise_fraction=config.RISE_FRACTION,
+            left_peak_torque=config.LEFT_PEAK_TORQUE, right_peak_torque=config.RIGHT_PEAK_TORQUE,
+            left_peak_fraction=config.LEFT_PEAK_FRACTION,
+            right_peak_fraction=config.RIGHT_PEAK_FRACTION,
+            left_fall_fraction=config.LEFT_FALL_FRACTION,
+            right_fall_fraction=config.RIGHT_FALL_FRACTION,
+            bias_torque=config.SPLINE_BIAS, use_spline_table=config.USE_SPLINE_TABLE,
+            fade_shape=config.SPLINE_FADE_SHAPE)
+    elif config.STANCE_CONTROL_STYLE == config_util.StanceCtrlStyle.SAWICKIWICKI:
+        return controllers.SawickiWickiController(
+            exo=exo, k_val=config.K_VAL, b_val=config.B_VAL)
+    else:
+        raise ValueError('STANCE_CONTROL_STYLE not supported for walking: ' +
+                         str(config.STANCE_CONTROL_STYLE))
+
+
+def get_state_machine(exo, config: Type[config_util.ConfigurableConstants],
+                      swing_only: bool = False):
+    '''Returns a StanceSwingReeloutReelinStateMachine with controllers from config.'''
+    reel_in_controller = controllers.SmoothReelInController(
+        exo=exo, reel_in_mV=config.REEL_IN_MV, slack_cutoff=config.REEL_IN_SLACK_CUTOFF,
+        time_out=config.REEL_IN_TIMEOUT)
+    swing_controller = controllers.StalkController(
+        exo=exo, desired_slack=config.SWING_SLACK,
+        prediction=config.SLACK_PREDICTION,
+        prediction_latency=config.SLACK_PREDICTION_LATENCY,
+        prediction_window=config.SLACK_PREDICTION_WINDOW,
+        prediction_order=config.SLACK_PREDICTION_ORDER)
+    reel_out_controller = controllers.SoftReelOutController(
+        exo=exo, desired_slack=config.SWING_SLACK)
+    return state_machines.StanceSwingReeloutReelinStateMachine(
+        exo=exo,
+        stance_controller=get_stance_controller(exo=exo, config=config),
+        swing_controller=swing_controller,
+        reel_in_controller=reel_in_controller,
+        reel_out_controller=reel_out_controller,
+        swing_only=swing_only)
+
+
+def build(exo_list, config: Type[config_util.ConfigurableConstants]):
+    gait_state_estimator_list = []
+    state_machine_list = []
+    for exo in exo_list:
+        heel_strike_detector = gait_state_estimators.GyroHeelStrikeDetector(
+            height=config.HS_GYRO_THRESHOLD,
+            gyro_filter=filters.Butterworth(N=config.HS_GYRO_FILTER_N,
+                                            Wn=config.HS_GYRO_FILTER_WN,
+                                            fs=config.TARGET_FREQ),
+            delay=config.HS_GYRO_DELAY)
+        gait_phase_estimator = gait_state_estimators.StrideAverageGaitPhaseEstimator(
+            num_strides_required=config.NUM_STRIDES_REQUIRED)
+        toe_off_detector = gait_state_estimators.GaitPhaseBasedToeOffDetector(
+            exo=exo, right_fraction_of_gait=config.RIGHT_TOE_OFF_FRACTION,
+            left_fraction_of_gait=config.LEFT_TOE_OFF_FRACTION)
+        gait_state_estimator = gait_state_estimators.GaitStateEstimator(
+            side=exo.side,
+            data_container=exo.data,
+            heel_strike_detector=heel_strike_detector,
+            gait_phase_estimator=gait_phase_estimator,
+            toe_off_detector=toe_off_detector,
+            do_print_heel_strikes=config.PRINT_HS)
+        gait_state_estimator_list.append(gait_state_estimator)
+        state_machine_list.append(get_state_machine(exo=exo, config=config))
+    return gait_state_estimator_list, state_machine_list
@@ -0,0 +1,37 @@
+'''Task.WALKINGMLGAITPHASE: walking, with gait phase predicted by the Jetson (ml_util).'''
+from typing import Type
+
+import config_util
+import control_muxer
+import gait_state_estimators
+import ml_util
+from tasks import walking
+
+
+def build(exo_list, config: Type[config_util.ConfigurableConstants]):
+    gait_state_estimator_list = []
+    state_machine_list = []
+    # Closed by main_loop, which stops its IO thread and prints its latency stats
+    jetson_interface = control_muxer.close_on_shutdown(ml_util.JetsonInterface(
+        protocol=config.JETSON_PROTOCOL, use_io_thread=config.JETSON_USE_IO_THREAD,
+        window_size=config.JETSON_WINDOW_SIZE))
+    for exo in exo_list:
+        feature_history_size = config.JETSON_WINDOW_SIZE
+        if config.ML_LOCAL_MODEL_PATH is not None:
+            local_model = ml_util.LocalGaitPhaseModel.from_file(config.ML_LOCAL_MODEL_PATH)
+            feature_history_size = max(feature_history_size, local_model.window_size)
+        else:
+            local_model = None
+        if feature_history_size > 0:
+            feature_history = exo.enable_feature_history(size=feature_history_size)
+        else:
+            feature_history = None
+        gait_state_estimator = gait_state_estimators.MLGaitStateEstimator(
+            side=exo.side, data_container=exo.data, jetson_interface=jetson_interface,
+            max_prediction_age=config.ML_MAX_PREDICTION_AGE,
+            do_extrapolate_phase=config.ML_DO_EXTRAPOLATE_PHASE,
+            local_model=local_model, feature_history=feature_history)
+        gait_state_estimator_list.append(gait_state_estimator)
+        state_machine_list.append(walking.get_state_machine(
+            exo=exo, config=config, swing_only=config.SWING_ONLY))
+    return gait_state_estimator_list, state_machine_list
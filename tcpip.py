@@ -22,22 +22,32 @@ class ServerTCP(object):
         return
 
     def start_server(self):
-        recv_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        recv_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-        recv_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        recv_socket.bind((self.SERVER_IP, self.RECV_PORT))
-        recv_socket.listen(1)
+        self.listen()
+        self.accept_client()
+        return
+
+    def listen(self):
+        '''Binds and listens. If RECV_PORT is 0, it is updated to the port the OS picked.'''
+        self.recv_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.recv_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.recv_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.recv_socket.bind((self.SERVER_IP, self.RECV_PORT))
+        self.RECV_PORT = self.recv_socket.getsockname()[1]
+        self.recv_socket.listen(1)
+
+    def accept_client(self):
         print('\nWaiting for client to connect.')
-        self.recv_conn, recv_addr = recv_socket.accept()
-        recv_socket.close()
+        self.recv_conn, recv_addr = self.recv_socket.accept()
+        self.recv_socket.close()
         print('Client connected!')
-        return
 
 
 class ClientTCP(object):
-    def __init__(self, server_ip, recv_port):
+    def __init__(self, server_ip, recv_port, timeout=None):
+        '''timeout (s) applies to connecting only; None blocks until the OS gives up.'''
         self.SERVER_IP = server_ip
         self.RECV_PORT = recv_port
+        self.timeout = timeout
         self.recv_conn = 0.
         self.start_client()
 
@@ -54,9 +64,34 @@ class ClientTCP(object):
         self.recv_conn.sendall(msg.encode())
         return
 
+    def from_server_bytes(self):
+        '''Like from_server, but returns raw bytes (for binary protocols).'''
+        if select.select([self.recv_conn], [], [], 0.0001)[0]:
+            return self.recv_conn.recv(8192)
+        else:
+            return b''
+
+    def from_server_into(self, buffer) -> int:
+        '''Like from_server_bytes, but receives into a writable buffer. Returns bytes received.'''
+        if select.select([self.recv_conn], [], [], 0.0001)[0]:
+            return self.recv_conn.recv_into(buffer)
+        else:
+            return 0
+
+    def to_server_bytes(self, msg):
+        self.recv_conn.sendall(msg)
+        return
+
     def start_client(self):
         self.recv_conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.recv_conn.connect((self.SERVER_IP, self.RECV_PORT))
+        self.recv_conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.recv_conn.settimeout(self.timeout)
+        try:
+            self.recv_conn.connect((self.SERVER_IP, self.RECV_PORT))
+        except OSError:
+            self.recv_conn.close()
+            raise
+        self.recv_conn.settimeout(None)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,8 @@
 import sys
 import os
 import time
+from operator import attrgetter
+import numpy as np
 import constants
 
 
@@ -17,9 +19,12 @@ class DelayTimer():
         self.true_until = true_until
         self.start_time = None  # Means timer is "inactive"
 
-    def start(self):
-        '''Starts the timer.'''
-        self.start_time = time.perf_counter()
+    def start(self, start_time: float = None):
+        '''Starts the timer, optionally from an earlier time.perf_counter() timestamp.'''
+        if start_time is None:
+            self.start_time = time.perf_counter()
+        else:
+            self.start_time = start_time
 
     def check(self):
         '''Depending on true_until, will either go True when time is hit, or go False when time is hit.'''
@@ -64,3 +69,117 @@ class FlexibleTimer():
         while time.perf_counter()-self.last_time < self.target_period:
             pass
         self.last_time = time.perf_counter()
+
+
+class Mailbox():
+    '''Holds only the latest value posted, for handing values between two threads.
+
+    The value and a version count are stored as one tuple, so a single reference
+    assignment publishes them together, and readers never see a torn update. Intended
+    for a single writer per mailbox.'''
+
+    def __init__(self):
+        self._slot = (None, 0)
+
+    def post(self, value):
+        self._slot = (value, self._slot[1] + 1)
+
+    def read(self):
+        '''Returns the latest value (None if nothing was posted yet).'''
+        return self._slot[0]
+
+    def read_with_version(self):
+        '''Returns (value, version), where version increments on every post.'''
+        return self._slot
+
+
+class RunningStats():
+    '''Running mean, std, min and max of a stream of values (Welford's algorithm).'''
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0
+        self._m2 = 0
+        self.min = None
+        self.max = None
+        self.last = None
+
+    def update(self, new_val: float):
+        self.count += 1
+        delta = new_val - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (new_val - self.mean)
+        self.min = new_val if self.min is None else min(self.min, new_val)
+        self.max = new_val if self.max is None else max(self.max, new_val)
+        self.last = new_val
+
+    def get_std(self) -> float:
+        if self.count < 2:
+            return 0
+        return (self._m2 / (self.count - 1)) ** 0.5
+
+    def __str__(self):
+        if self.count == 0:
+            return 'no samples'
+        return 'n=%d mean=%.5f std=%.5f min=%.5f max=%.5f' % (
+            self.count, self.mean, self.get_std(), self.min, self.max)
+
+
+class FeatureHistory():
+    def __init__(self, size: int, channel_names: list = constants.ML_FEATURE_NAMES):
+        '''Circular buffer of the last size samples of DataContainer fields (channels).
+
+        Each sample is written twice, size rows apart, so the newest window_size samples are
+        always one contiguous (window_size x channels) block, and get_window() returns a
+        numpy view of it without copying. Views are only valid until the next update().'''
+        self.size = size
+        self.channel_names = list(channel_names)
+        self.num_channels = len(self.channel_names)
+        self._get_values = attrgetter(*self.channel_names)
+        self._buffer = np.zeros((2*size, self.num_channels))
+        self._idx = 0  # Next row to write
+        self.num_samples = 0
+
+    def update(self, data):
+        '''Appends the channel values from data (e.g., an Exo.DataContainer).'''
+        values = self._get_values(data)
+        self._buffer[self._idx] = values
+        self._buffer[self._idx + self.size] = values
+        self._idx = (self._idx + 1) % self.size
+        self.num_samples += 1
+
+    def get_window(self, window_size: int = None):
+        '''Returns a (window_size x channels) view of the newest samples, oldest first.
+
+        Returns None until window_size samples have been added. Defaults to size.'''
+        if window_size is None:
+            window_size = self.size
+        if window_size > self.size:
+            raise ValueError('window_size must be <= FeatureHistory size: ' + str(self.size))
+        if self.num_samples < window_size:
+            return None
+        end = self._idx + self.size
+        return self._buffer[end - window_size:end]
+
+    def resize(self, size: int):
+        '''Grows the buffer in place, keeping the newest samples, so holders of this object
+        see the new size. Views from get_window() are invalid afterwards. Never shrinks.'''
+        if size <= self.size:
+            return
+        num_kept = min(self.num_samples, self.size)
+        buffer = np.zeros((2*size, self.num_channels))
+        if num_kept:
+            kept = self.get_window(num_kept)
+            buffer[:num_kept] = kept
+            buffer[size:size + num_kept] = kept
+        self._buffer = buffer
+        self.size = size
+        self._idx = num_kept % size
+        self.num_samples = num_kept
+
+    def clear(self):
+        self._idx = 0
+        self.num_samples = 0
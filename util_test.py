@@ -26,6 +26,50 @@ class Test_timer(unittest.TestCase):
         plt.plot(vals2)
         plt.show()
 
+    def test_running_stats(self):
+        running_stats = util.RunningStats()
+        values = [0.01, 0.03, 0.02, 0.06]
+        for value in values:
+            running_stats.update(value)
+        self.assertAlmostEqual(running_stats.mean, 0.03)
+        self.assertAlmostEqual(running_stats.get_std(), 0.021602468994692866)
+        self.assertEqual(running_stats.min, 0.01)
+        self.assertEqual(running_stats.max, 0.06)
+
+    def test_feature_history(self):
+        class Data:
+            pass
+        data = Data()
+        feature_history = util.FeatureHistory(size=3, channel_names=['a', 'b'])
+        self.assertIsNone(feature_history.get_window(2))
+        for i in range(5):
+            data.a, data.b = i, 10*i
+            feature_history.update(data)
+        window = feature_history.get_window(2)
+        self.assertEqual(window.tolist(), [[3, 30], [4, 40]])
+        self.assertEqual(feature_history.get_window().tolist(), [[2, 20], [3, 30], [4, 40]])
+        self.assertTrue(window.flags['C_CONTIGUOUS'])
+        self.assertFalse(window.flags['OWNDATA'])  # A view, not a copy
+
+    def test_feature_history_resize(self):
+        class Data:
+            pass
+        data = Data()
+        feature_history = util.FeatureHistory(size=3, channel_names=['a', 'b'])
+        for i in range(5):
+            data.a, data.b = i, 10*i
+            feature_history.update(data)
+        feature_history.resize(5)
+        self.assertEqual(feature_history.size, 5)
+        self.assertEqual(feature_history.get_window(3).tolist(), [[2, 20], [3, 30], [4, 40]])
+        self.assertIsNone(feature_history.get_window(4))  # Older samples were already dropped
+        for i in range(5, 8):
+            data.a, data.b = i, 10*i
+            feature_history.update(data)
+        self.assertEqual(feature_history.get_window()[:, 0].tolist(), [3, 4, 5, 6, 7])
+        feature_history.resize(2)  # Never shrinks
+        self.assertEqual(feature_history.size, 5)
+
     # def test_single_time(self):
     #     custom_timer = util.FlexibleTimer(target_freq=2)
     #     t0 = time.time()